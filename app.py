@@ -2,8 +2,40 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
+import json
 import os
+import re
+from contextlib import contextmanager
 from datetime import datetime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from connections import get_manager, thread_owner
+from writer import get_writer
+from archive import attach_archives
+from mirror import AttendanceMirror, cohort_summary, daily_trend, student_percentages
+from bitmaps import build_bitmaps, install_triggers
+from migrations import ensure_migrated
+from catalog import CatalogCache
+from replica import ReadReplica
+from report_cache import ReportCache
+from query_guard import QueryGuard, QueryTimedOut
+from jobs import (
+    ACTIVE_JOB_STATUSES,
+    JOB_POLL_SECONDS,
+    cancel_job,
+    get_runner,
+    job_download_name,
+    list_jobs,
+    submit_job
+)
+from exports import EXPORT_FORMATS, PreviewCursor, export_bundle, export_cursor, get_columns
+from report_cache import RowCursor
+from reports import (
+    StudentStatisticsSummary,
+    faculty_workload_query,
+    report_filter,
+    student_statistics_query
+)
+from ingest import load_section_ids, parse_rosters, upsert_students, validate_roster
 
 # ================ Configuration Settings ================
 # Database configuration
@@ -56,6 +88,44 @@ SUBJECTS = {
     'MCA-I': ['Programming Fundamentals', 'Computer Organization'],
 }
 
+# Longest a page waits for the attendance writer to commit a submission
+WRITE_TIMEOUT_SECONDS = 60
+
+# Report rows shown on screen; downloads always contain the full report
+REPORT_PREVIEW_ROWS = 1000
+
+# Serve the report pages from an in-memory copy of the database, refreshed
+# once the data has changed and the copy is older than the interval
+REPLICA_ENABLED = False
+REPLICA_REFRESH_SECONDS = 60
+
+# Report results shared by every server process, least recently used
+# entries dropped past the size limit
+REPORT_CACHE_FILE = 'report_cache.db'
+REPORT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Longest a report page may spend on its queries before they are stopped
+REPORT_TIME_BUDGET_SECONDS = 120
+
+# Background report jobs and the directory their files are kept in. With
+# JOB_RUNNER_IN_APP off, jobs only run under `python manage.py run-jobs`
+JOB_DIR = 'report_jobs'
+JOB_RUNNER_IN_APP = True
+JOB_WORKERS = os.cpu_count() or 1
+
+# Also store each marked session as a presence bitmap, for the NumPy
+# sweeps in bitmaps.py; `python manage.py build-bitmaps` fills in the rest.
+# The triggers dropping stale bitmaps are installed once at start
+ATTENDANCE_BITMAPS = False
+
+# Serve the Attendance Analytics page from memory-mapped column files,
+# shared by every server process and appended to as classes are marked
+ANALYTICS_MIRROR = False
+MIRROR_DIR = 'analytics_mirror'
+# The page starts a background refresh once the mirror is older than this;
+# `python manage.py refresh-mirror` brings it up to date on demand
+MIRROR_REFRESH_SECONDS = 60
+
 # Sample faculty data
 FACULTY = [
     ('p', 'p'),
@@ -82,6 +152,13 @@ def check_period_time(period):
         return start_time <= current_time <= end_time
     return False
 
+def get_period_minutes(period):
+    """Get the length of a period in minutes"""
+    start_str, end_str = PERIOD_TIMINGS[period]
+    start = datetime.strptime(start_str, '%H:%M')
+    end = datetime.strptime(end_str, '%H:%M')
+    return int((end - start).total_seconds() // 60)
+
 def validate_date_range(from_date, to_date):
     """Validate date range"""
     try:
@@ -92,121 +169,114 @@ def validate_date_range(from_date, to_date):
         return False
 
 # ================ Database Functions ================
+def get_selection(select_all, selected, options):
+    """Turn a report multiselect into the values to filter on
+
+    Returns None when everything is selected, which reports treat as no
+    filter at all, and otherwise the selected values (possibly empty).
+    """
+    if select_all or (options and set(selected) >= set(options)):
+        return None
+    return list(selected)
+
+def session_owner():
+    """Own connections by Streamlit session so reruns reuse them"""
+    ctx = get_script_run_ctx()
+    if ctx is None or not st.runtime.exists():
+        return thread_owner()
+    runtime = st.runtime.get_instance()
+    return ctx.session_id, lambda: runtime.is_active_session(ctx.session_id)
+
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get this session's database connection"""
+    return get_manager(DB_FILE, owner=session_owner).get()
 
-def init_db():
-    """Initialize database with tables and sample data"""
-    if not os.path.exists(DB_FILE):
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-        
-        # Create tables
-        cur.executescript('''
-            CREATE TABLE faculty (
-                id INTEGER PRIMARY KEY,
-                name TEXT UNIQUE NOT NULL,
-                credential TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE sections (
-                id INTEGER PRIMARY KEY,
-                name TEXT UNIQUE NOT NULL,
-                is_original BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE subjects (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                program TEXT NOT NULL,
-                year TEXT NOT NULL,
-                branch TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE students (
-                id INTEGER PRIMARY KEY,
-                ht_number TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                manipulated_section_id INTEGER,
-                original_section_id INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (manipulated_section_id) REFERENCES sections(id),
-                FOREIGN KEY (original_section_id) REFERENCES sections(id)
-            );
-
-            CREATE TABLE attendance (
-                id INTEGER PRIMARY KEY,
-                student_id INTEGER,
-                faculty_id INTEGER,
-                subject_id INTEGER,
-                section_id INTEGER,
-                date DATE NOT NULL,
-                time TIME NOT NULL,
-                period TEXT NOT NULL,
-                status TEXT NOT NULL CHECK (status IN ('P', 'A')),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (student_id) REFERENCES students(id),
-                FOREIGN KEY (faculty_id) REFERENCES faculty(id),
-                FOREIGN KEY (subject_id) REFERENCES subjects(id),
-                FOREIGN KEY (section_id) REFERENCES sections(id),
-                UNIQUE (student_id, date, period)
-            );
-
-            CREATE TABLE faculty_workload (
-                id INTEGER PRIMARY KEY,
-                faculty_id INTEGER,
-                section_id INTEGER,
-                subject_id INTEGER,
-                date DATE NOT NULL,
-                time TIME NOT NULL,
-                period TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (faculty_id) REFERENCES faculty(id),
-                FOREIGN KEY (section_id) REFERENCES sections(id),
-                FOREIGN KEY (subject_id) REFERENCES subjects(id)
-            );
-        ''')
-        
-        # Insert initial data
-        # Add faculty
-        for faculty_name, credential in FACULTY:
-            cur.execute('INSERT INTO faculty (name, credential) VALUES (?, ?)',
-                       (faculty_name, credential))
-        
-        # Add sections and subjects
-        for program, prog_data in SECTIONS.items():
-            for year in prog_data['years']:
-                for branch, sections in prog_data['branches'].items():
-                    # Add subjects for this combination
-                    key = f"{program}-{year}-{branch}"
-                    if key in SUBJECTS:
-                        for subject in SUBJECTS[key]:
-                            cur.execute('''
-                                INSERT INTO subjects (name, program, year, branch)
-                                VALUES (?, ?, ?, ?)
-                            ''', (subject, program, year, branch))
-                    
-                    # Add sections (both original and manipulated)
-                    for section in sections:
-                        section_name = get_section_name(program, year, branch, section)
-                        # Add manipulated section
-                        cur.execute('INSERT INTO sections (name, is_original) VALUES (?, 0)',
-                                  (section_name,))
-                        # Add original section
-                        cur.execute('INSERT INTO sections (name, is_original) VALUES (?, 1)',
-                                  (get_original_section_name(section_name),))
-        
-        conn.commit()
-        conn.close()
-        return True
+def get_read_db():
+    """Get this session's read-only connection for reports"""
+    return get_manager(DB_FILE, owner=session_owner).get_read_only()
+
+@st.cache_resource(show_spinner=False)
+def get_replica():
+    """Get the process-wide in-memory report replica"""
+    return ReadReplica(DB_FILE, REPLICA_REFRESH_SECONDS)
+
+def get_report_db():
+    """Get the connection report pages read from
+
+    This is the in-memory replica when REPLICA_ENABLED is set, so heavy
+    reports never compete with attendance writes for the database file;
+    otherwise it is the session's read-only connection.
+    """
+    if REPLICA_ENABLED:
+        return get_replica().connection()
+    return get_read_db()
+
+@st.cache_resource(show_spinner=False)
+def get_mirror():
+    """Get the process's handle on the analytics mirror"""
+    return AttendanceMirror(DB_FILE, MIRROR_DIR)
+
+@st.cache_resource(show_spinner=False)
+def get_report_cache():
+    """Get the process's handle on the shared report cache"""
+    return ReportCache(REPORT_CACHE_FILE, REPORT_CACHE_MAX_BYTES)
+
+@st.cache_resource(show_spinner=False)
+def prepare_db():
+    """Migrate the database and add initial data, once per process"""
+    ensure_migrated(DB_FILE)
+    with get_db() as conn:
+        seed_db(conn)
+        if ATTENDANCE_BITMAPS:
+            install_triggers(conn)
+            conn.commit()
     return True
 
+def init_db():
+    """Initialize the database; failures are retried on the next run"""
+    try:
+        return prepare_db()
+    except sqlite3.Error as e:
+        print(f"Database initialization error: {e}")
+        return False
+
+def seed_db(conn):
+    """Insert initial data into an empty database"""
+    cur = conn.cursor()
+    cur.execute('SELECT COUNT(*) FROM faculty')
+    if cur.fetchone()[0]:
+        return
+    
+    # Add faculty
+    for faculty_name, credential in FACULTY:
+        cur.execute('INSERT INTO faculty (name, credential) VALUES (?, ?)',
+                   (faculty_name, credential))
+    
+    # Add sections and subjects
+    for program, prog_data in SECTIONS.items():
+        for year in prog_data['years']:
+            for branch, sections in prog_data['branches'].items():
+                # Add subjects for this combination
+                key = f"{program}-{year}-{branch}"
+                if key in SUBJECTS:
+                    for subject in SUBJECTS[key]:
+                        cur.execute('''
+                            INSERT INTO subjects (name, program, year, branch)
+                            VALUES (?, ?, ?, ?)
+                        ''', (subject, program, year, branch))
+                
+                # Add sections (both original and manipulated)
+                for section in sections:
+                    section_name = get_section_name(program, year, branch, section)
+                    # Add manipulated section
+                    cur.execute('INSERT INTO sections (name, is_original) VALUES (?, 0)',
+                              (section_name,))
+                    # Add original section
+                    cur.execute('INSERT INTO sections (name, is_original) VALUES (?, 1)',
+                              (get_original_section_name(section_name),))
+    
+    conn.commit()
+
 def check_credentials(username, password, is_admin=False):
     """Verify login credentials"""
     if is_admin:
@@ -218,12 +288,37 @@ def check_credentials(username, password, is_admin=False):
         result = cur.fetchone()
         return result and result['credential'] == password
 
+@st.cache_resource(show_spinner=False)
+def get_catalog():
+    """Get the process-wide reference data cache"""
+    return CatalogCache(DB_FILE)
+
 def get_sections_for_faculty():
     """Get available sections for faculty"""
-    with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute('SELECT name FROM sections WHERE is_original = 0 ORDER BY name')
-        return [row['name'] for row in cur.fetchall()]
+    def load():
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT name FROM sections WHERE is_original = 0 ORDER BY name')
+            return [row['name'] for row in cur.fetchall()]
+    return list(get_catalog().get('faculty_sections', 'sections', load))
+
+def get_section_ids():
+    """Get the ID of every section by name"""
+    def load():
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT id, name FROM sections')
+            return {row['name']: row['id'] for row in cur.fetchall()}
+    return dict(get_catalog().get('section_ids', 'sections', load))
+
+def get_faculty_names():
+    """Get the names of all faculty"""
+    def load():
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT name FROM faculty ORDER BY name')
+            return [row['name'] for row in cur.fetchall()]
+    return list(get_catalog().get('faculty_names', 'faculty', load))
 
 def get_subjects_for_section(section_name):
     """Get subjects for a section"""
@@ -231,100 +326,391 @@ def get_subjects_for_section(section_name):
     key = f"{program}-{year}-{branch}"
     return SUBJECTS.get(key, [])
 
+def query_students_in_section(conn, section_name):
+    """Execute the roster query for a section and return the cursor"""
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT s.ht_number, s.name, orig.name as original_section
+        FROM students s
+        JOIN sections manip ON s.manipulated_section_id = manip.id
+        JOIN sections orig ON s.original_section_id = orig.id
+        WHERE manip.name = ?
+        ORDER BY s.ht_number
+    ''', (section_name,))
+    return cur
+
 def get_students_in_section(section_name):
     """Get students in a section"""
     with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute('''
-            SELECT s.ht_number, s.name, orig.name as original_section
-            FROM students s
-            JOIN sections manip ON s.manipulated_section_id = manip.id
-            JOIN sections orig ON s.original_section_id = orig.id
-            WHERE manip.name = ?
-            ORDER BY s.ht_number
-        ''', (section_name,))
-        return [dict(row) for row in cur.fetchall()]
+        return [dict(row) for row in query_students_in_section(conn, section_name).fetchall()]
+
+def get_session_claim(conn, section_id, date, period):
+    """Describe who already marked a class session, or return '' if nobody has"""
+    result = conn.execute('''
+        SELECT f.name AS faculty, sub.name AS subject, ses.time
+        FROM attendance_sessions ses
+        JOIN faculty f ON ses.faculty_id = f.id
+        JOIN subjects sub ON ses.subject_id = sub.id
+        WHERE ses.section_id = ? AND ses.date = ? AND ses.period = ?
+    ''', (section_id, date, period)).fetchone()
+    if result:
+        return f"Attendance already marked by {result['faculty']} for {result['subject']} at {result['time']}"
+    return ""
 
 def check_duplicate_attendance(section_name, period, date):
-    """Check for duplicate attendance entries"""
+    """Check whether a section's class session has already been marked"""
     with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute('''
-            SELECT f.name, sub.name, a.time
-            FROM attendance a
-            JOIN students s ON a.student_id = s.id
-            JOIN sections sec ON s.original_section_id = sec.id
-            JOIN faculty f ON a.faculty_id = f.id
-            JOIN subjects sub ON a.subject_id = sub.id
-            WHERE sec.name = ? AND a.period = ? AND a.date = ?
-            LIMIT 1
-        ''', (section_name, period, date))
-        result = cur.fetchone()
+        section = conn.execute('SELECT id FROM sections WHERE name = ?', (section_name,)).fetchone()
+        message = get_session_claim(conn, section['id'], date, period) if section else ""
+        return bool(message), message
+
+def write_attendance(conn, attendance_data, faculty_name, marked_at=None):
+    """Write one attendance submission inside the caller's transaction
+
+    Student and subject IDs are resolved with one query each and all rows
+    are written with executemany, so the statement count stays constant
+    regardless of section size. Returns (success, results) where results
+    holds one entry per submitted student.
+
+    Every class session is claimed in attendance_sessions before any row
+    is written, and each student's row then only records the session and
+    their status. If another submission already holds the claim, the
+    submission's savepoint is rolled back and each result carries the
+    conflict message.
+    """
+    conn.execute('SAVEPOINT write_attendance')
+    cur = conn.cursor()
+    
+    # Get faculty ID
+    cur.execute('SELECT id FROM faculty WHERE name = ?', (faculty_name,))
+    faculty_id = cur.fetchone()['id']
+    
+    now = marked_at or datetime.now()
+    current_date = now.date().isoformat()
+    current_time = now.time().isoformat()
+    
+    # Resolve all HT numbers in one query
+    cur.execute('''
+        SELECT s.id, s.ht_number, s.manipulated_section_id
+        FROM students s
+        WHERE s.ht_number IN (SELECT value FROM json_each(?))
+    ''', (json.dumps([student['ht_number'] for student in attendance_data]),))
+    students = {row['ht_number']: row for row in cur.fetchall()}
+    
+    # Resolve subject IDs in one query
+    cur.execute('''
+        SELECT name, MIN(id) as id
+        FROM subjects
+        WHERE name IN (SELECT value FROM json_each(?))
+        GROUP BY name
+    ''', (json.dumps(sorted({student['subject'] for student in attendance_data})),))
+    subject_ids = {row['name']: row['id'] for row in cur.fetchall()}
+    
+    attendance_rows = []
+    sessions = set()
+    results = []
+    for student in attendance_data:
+        student_data = students.get(student['ht_number'])
+        subject_id = subject_ids.get(student['subject'])
+        if not student_data:
+            results.append({'ht_number': student['ht_number'], 'recorded': False,
+                            'reason': 'Unknown HT number'})
+            continue
+        if subject_id is None:
+            results.append({'ht_number': student['ht_number'], 'recorded': False,
+                            'reason': f"Unknown subject {student['subject']}"})
+            continue
         
-        if result:
-            return True, f"Attendance already marked by {result['name']} for {result[1]} at {result[2]}"
-        return False, ""
+        session = (student_data['manipulated_section_id'], subject_id, student['period'])
+        attendance_rows.append((session, student_data['id'], 'P' if student['present'] else 'A'))
+        sessions.add(session)
+        results.append({'ht_number': student['ht_number'], 'recorded': True,
+                        'reason': ''})
+    
+    # Claim the class sessions first; the unique (section, date, period)
+    # index settles concurrent submissions before any row is written
+    session_ids = {}
+    for section_id, subject_id, period in sessions:
+        cur.execute('''
+            INSERT INTO attendance_sessions
+            (section_id, date, period, faculty_id, subject_id, time)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (section_id, date, period) DO NOTHING
+        ''', (section_id, current_date, period, faculty_id, subject_id, current_time))
+        session_ids[section_id, subject_id, period] = cur.lastrowid
+        if not cur.rowcount:
+            conflict = get_session_claim(conn, section_id, current_date, period)
+            conn.execute('ROLLBACK TO write_attendance')
+            conn.execute('RELEASE write_attendance')
+            return False, [{'ht_number': student['ht_number'], 'recorded': False,
+                            'reason': conflict} for student in attendance_data]
+    
+    # Insert all rows in the same transaction
+    cur.executemany('''
+        INSERT INTO attendance (session_id, student_id, status)
+        VALUES (?, ?, ?)
+    ''', [(session_ids[session], student_id, status)
+          for session, student_id, status in attendance_rows])
+    if ATTENDANCE_BITMAPS:
+        build_bitmaps(conn, session_ids.values())
+    
+    # Record faculty workload once per class session
+    for section_id, subject_id, period in sessions:
+        cur.execute('''
+            INSERT OR IGNORE INTO faculty_workload
+            (faculty_id, section_id, subject_id, date, time, period)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (faculty_id, section_id, subject_id, current_date, current_time, period))
+        if cur.rowcount:
+            cur.execute('''
+                INSERT INTO faculty_daily_workload
+                (faculty_id, date, classes, teaching_minutes)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT (faculty_id, date) DO UPDATE SET
+                    classes = classes + 1,
+                    teaching_minutes = teaching_minutes + excluded.teaching_minutes
+            ''', (faculty_id, current_date, get_period_minutes(period)))
+    
+    conn.execute('RELEASE write_attendance')
+    return True, results
+
+def mark_attendance(attendance_data, faculty_name, marked_at=None):
+    """Mark attendance for a class
+
+    The submission goes through the shared group-commit writer, so a burst
+    of submissions from many sessions lands in a few transactions instead
+    of each fighting for the write lock. marked_at overrides the current
+    time for backfills. Returns (success, results) as write_attendance.
+    """
+    if not attendance_data:
+        return False, []
 
-def mark_attendance(attendance_data, faculty_name):
-    """Mark attendance for students"""
     try:
-        with get_db() as conn:
-            cur = conn.cursor()
-            
-            # Get faculty ID
-            cur.execute('SELECT id FROM faculty WHERE name = ?', (faculty_name,))
-            faculty_id = cur.fetchone()['id']
-            
-            current_date = datetime.now().date().isoformat()
-            current_time = datetime.now().time().isoformat()
-            
-            for student in attendance_data:
-                # Get student and subject IDs
-                cur.execute('''
-                    SELECT s.id, s.original_section_id 
-                    FROM students s 
-                    WHERE s.ht_number = ?
-                ''', (student['ht_number'],))
-                student_data = cur.fetchone()
-                if not student_data:
-                    continue
-                
-                student_id = student_data['id']
-                original_section_id = student_data['original_section_id']
-                
-                # Get subject ID
-                cur.execute('SELECT id FROM subjects WHERE name = ?', (student['subject'],))
-                subject_id = cur.fetchone()['id']
-                
-                # Insert attendance record
-                cur.execute('''
-                    INSERT INTO attendance 
-                    (student_id, faculty_id, subject_id, section_id, date, time, period, status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    student_id, faculty_id, subject_id, original_section_id,
-                    current_date, current_time,
-                    student['period'],
-                    'P' if student['present'] else 'A'
-                ))
-                
-                # Record faculty workload
-                cur.execute('''
-                    INSERT INTO faculty_workload
-                    (faculty_id, section_id, subject_id, date, time, period)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    faculty_id, original_section_id, subject_id,
-                    current_date, current_time, student['period']
-                ))
-            
-            conn.commit()
-            return True
+        return get_writer(DB_FILE).run(
+            write_attendance, attendance_data, faculty_name, marked_at, timeout=WRITE_TIMEOUT_SECONDS
+        )
     except Exception as e:
         print(f"Error marking attendance: {e}")
-        return False
+        return False, []
+
+# ================ Attendance Grid ================
+def load_roster(section_name):
+    """Load a section's roster as the marking grid's frame, everyone present"""
+    with get_db() as conn:
+        cur = query_students_in_section(conn, section_name)
+        roster = pd.DataFrame.from_records(
+            cur.fetchall(),
+            columns=['HT Number', 'Student Name', 'Original Section']
+        )
+    roster['Present'] = True
+    return roster
+
+def open_attendance_form(form_key):
+    """Run the duplicate check and load the roster for a new marking form"""
+    section, _, period, date = form_key
+    is_duplicate, message = check_duplicate_attendance(section, period, date)
+    st.session_state.form_key = form_key
+    st.session_state.duplicate_message = message if is_duplicate else ''
+    st.session_state.roster = None if is_duplicate else load_roster(section)
+    st.session_state.grid_version = 0
+    st.session_state.absentee_text = ''
+    st.session_state.absentee_unknown = []
+
+def grid_key():
+    """Widget key of the current attendance grid
+
+    Bulk toggles rewrite the roster's Present column and bump the version,
+    which gives the grid a fresh key so it drops the edits it was holding.
+    """
+    return f"attendance_grid_{st.session_state.grid_version}"
+
+def grid_presence():
+    """Present column of the roster with the grid's pending edits applied"""
+    present = st.session_state.roster['Present'].copy()
+    edits = st.session_state.get(grid_key(), {}).get('edited_rows', {})
+    for row, change in edits.items():
+        if 'Present' in change:
+            present.iat[int(row)] = bool(change['Present'])
+    return present
+
+def set_presence(present):
+    """Replace the roster's Present column and reset the grid"""
+    st.session_state.roster['Present'] = present.to_numpy(dtype=bool)
+    st.session_state.grid_version += 1
+
+def mark_all_present():
+    set_presence(pd.Series(True, index=st.session_state.roster.index))
+
+def invert_presence():
+    set_presence(~grid_presence())
+
+def apply_absentees():
+    """Mark the HT numbers typed into the absentee box absent, everyone else present"""
+    entered = {value.upper() for value in re.split(r'[\s,;]+', st.session_state.absentee_text) if value}
+    ht_numbers = st.session_state.roster['HT Number']
+    absent = ht_numbers.isin(entered)
+    st.session_state.absentee_unknown = sorted(entered - set(ht_numbers[absent]))
+    set_presence(~absent)
 
 # ================ Streamlit Interface Functions ================
+def export_report(cur, file_stem, export_format, group_column=None):
+    """Stream an executed query into an export file
+
+    With group_column set, the rows (ordered by that column) are split
+    into one file per group inside a zip. Returns (file object, file
+    name, MIME type).
+    """
+    extension, mime = EXPORT_FORMATS[export_format]
+    if group_column:
+        return export_bundle(cur, export_format, group_column), f"{file_stem}.zip", "application/zip"
+    return export_cursor(cur, export_format), f"{file_stem}.{extension}", mime
+
+def offer_download(cur, label, file_stem, export_format, group_column=None):
+    """Stream an executed query into a download button"""
+    data, file_name, mime = export_report(cur, file_stem, export_format, group_column)
+    # Streamlit keeps download payloads as bytes, so the finished file is
+    # the only full copy of the report held in memory
+    with data:
+        st.download_button(label, data.read(), file_name, mime)
+
+def cancel_report():
+    st.session_state.report_cancelled = True
+
+@contextmanager
+def report_guard(conn):
+    """Run a report block with a progress bar, a Cancel button and a time budget
+
+    Clicking Cancel, like any other interaction, makes Streamlit rerun the
+    script. The next progress bar update raises that rerun from inside the
+    running query, which aborts it instead of finishing unseen.
+    """
+    progress = st.empty()
+    cancel = st.empty()
+    cancel.button("Cancel", on_click=cancel_report)
+    
+    def show_progress(elapsed):
+        progress.progress(
+            min(elapsed / REPORT_TIME_BUDGET_SECONDS, 1.0),
+            text=f"Running report... {elapsed:.0f}s"
+        )
+    
+    try:
+        with QueryGuard(conn, REPORT_TIME_BUDGET_SECONDS, on_progress=show_progress):
+            yield
+    except QueryTimedOut:
+        st.error(
+            f"The report took longer than {REPORT_TIME_BUDGET_SECONDS} seconds and was stopped. "
+            "Try a shorter date range or fewer selections."
+        )
+    finally:
+        progress.empty()
+        cancel.empty()
+
+# ================ Report Jobs ================
+def queue_report(kind, selection, from_date, to_date, export_format, group_column=None):
+    """Queue a report to run in the background and return its job id"""
+    job_id = get_writer(DB_FILE).run(submit_job, kind, {
+        'selection': selection,
+        'from_date': from_date,
+        'to_date': to_date,
+        'export_format': export_format,
+        'group_column': group_column
+    }, st.session_state.username, timeout=WRITE_TIMEOUT_SECONDS)
+    if JOB_RUNNER_IN_APP:
+        get_runner(DB_FILE, JOB_DIR, JOB_WORKERS).wake()
+    return job_id
+
+def load_report_jobs(kind):
+    """Get the current admin's recent background reports of one kind"""
+    with get_read_db() as conn:
+        return list_jobs(conn, st.session_state.username, kind)
+
+def cancel_report_job(job_id):
+    get_writer(DB_FILE).run(cancel_job, job_id, timeout=WRITE_TIMEOUT_SECONDS)
+
+def describe_job(job):
+    """One-line summary of a job's parameters"""
+    params = job['params']
+    selection = params['selection']
+    chosen = "all" if selection is None else f"{len(selection)} selected"
+    return (f"#{job['id']}: {params['from_date']} to {params['to_date']}, "
+            f"{chosen}, {params['export_format']}")
+
+def show_finished_job(job):
+    """Show a finished job with its download, error or cancellation"""
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.write(describe_job(job))
+        if job['status'] == 'done':
+            st.caption(f"Finished {job['finished_at']} with {job['rows']} rows")
+        elif job['status'] == 'failed':
+            st.caption(f"Failed: {job['error']}")
+        else:
+            st.caption("Cancelled")
+    path = os.path.join(JOB_DIR, job['file_name'] or '')
+    if job['status'] != 'done' or not os.path.isfile(path):
+        return
+    # Streamlit reads a download's whole payload on every run that draws
+    # its button, so a job's file is only loaded once it is asked for
+    prepared = st.session_state.setdefault('prepared_jobs', set())
+    with col2:
+        if job['id'] not in prepared:
+            st.button(
+                "Prepare download", key=f"job_prepare_{job['id']}",
+                on_click=prepared.add, args=(job['id'],)
+            )
+            return
+        if job['params']['group_column']:
+            mime = "application/zip"
+        else:
+            mime = EXPORT_FORMATS[job['params']['export_format']][1]
+        with open(path, 'rb') as data:
+            st.download_button(
+                "Download", data, job_download_name(job), mime, key=f"job_download_{job['id']}"
+            )
+
+@st.fragment(run_every=JOB_POLL_SECONDS * 2)
+def poll_report_jobs(kind, job_ids):
+    """Follow jobs that were queued or running when the page was drawn
+
+    Only this fragment reruns while they work. Finished ones offer a
+    button to redraw the page, where they get their download, so large
+    files are not re-sent on every poll.
+    """
+    for job in load_report_jobs(kind):
+        if job['id'] not in job_ids:
+            continue
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.write(describe_job(job))
+            if job['status'] == 'queued':
+                st.caption("Queued")
+            elif job['status'] == 'running':
+                st.caption(f"Running since {job['started_at']}")
+            else:
+                st.caption(job['status'].capitalize())
+        with col2:
+            if job['status'] in ACTIVE_JOB_STATUSES:
+                st.button(
+                    "Cancel", key=f"job_cancel_{job['id']}",
+                    on_click=cancel_report_job, args=(job['id'],)
+                )
+            elif st.button("Refresh", key=f"job_show_{job['id']}"):
+                st.rerun()
+
+def display_report_jobs(kind):
+    """List the current admin's background reports of one kind"""
+    jobs = load_report_jobs(kind)
+    if not jobs:
+        return
+    st.subheader("Background Reports")
+    active = [job['id'] for job in jobs if job['status'] in ACTIVE_JOB_STATUSES]
+    if active:
+        poll_report_jobs(kind, active)
+    for job in jobs:
+        if job['status'] not in ACTIVE_JOB_STATUSES:
+            show_finished_job(job)
+
 def display_login_page():
     """Display login page"""
     st.title("Attendance Management System")
@@ -400,69 +786,94 @@ def display_faculty_page():
         st.error("Selected period is not currently active.")
         return
     
-    # Check duplicate attendance
-    is_duplicate, message = check_duplicate_attendance(
+    # Pin the duplicate check and roster for this form; the marking
+    # fragment below reruns on its own and never touches them again
+    form_key = (
         st.session_state.section,
+        st.session_state.subject,
         st.session_state.period,
         datetime.now().date().isoformat()
     )
-    if is_duplicate:
-        st.warning(message)
+    if st.session_state.get('form_key') != form_key:
+        open_attendance_form(form_key)
+    
+    if st.session_state.duplicate_message:
+        st.warning(st.session_state.duplicate_message)
         return
     
     # Display attendance form
     st.subheader(f"Mark Attendance for {st.session_state.section} - {st.session_state.subject}")
-    
-    students = get_students_in_section(st.session_state.section)
-    if not students:
+    attendance_form()
+
+@st.fragment
+def attendance_form():
+    """Attendance grid, bulk toggles and submit button
+
+    Runs as a fragment: grid edits and toggles rerun only this function
+    against the roster pinned in session state, skipping the sidebar,
+    catalog lookups and database queries of the full page.
+    """
+    _, subject, period, _ = st.session_state.form_key
+    roster = st.session_state.roster
+    if roster.empty:
         st.error("No students found in selected section")
         return
     
-    # Create attendance form
-    attendance_data = []
-    
-    cols = st.columns([2, 2, 2, 1])
-    with cols[0]:
-        st.markdown("**HT Number**")
-    with cols[1]:
-        st.markdown("**Student Name**")
-    with cols[2]:
-        st.markdown("**Original Section**")
-    with cols[3]:
-        st.markdown("**Present**")
-    
-    st.markdown("<hr>", unsafe_allow_html=True)
-    
-    for student in students:
-        cols = st.columns([2, 2, 2, 1])
-        with cols[0]:
-            st.write(student['ht_number'])
-        with cols[1]:
-            st.write(student['name'])
-        with cols[2]:
-            st.write(student['original_section'])
-        with cols[3]:
-            present = st.checkbox(
-                "Present",
-                key=f"{student['ht_number']}",
-                value=True
-            )
-        
-        attendance_data.append({
-            'ht_number': student['ht_number'],
-            'subject': st.session_state.subject,
-            'period': st.session_state.period,
-            'present': present
-        })
+    # Bulk toggles
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("Mark All Present", on_click=mark_all_present, use_container_width=True)
+    with col2:
+        st.button("Invert Selection", on_click=invert_presence, use_container_width=True)
+    with st.expander("Mark absentees by HT number"):
+        st.text_area(
+            "Absentee HT numbers",
+            key='absentee_text',
+            help="Separate HT numbers with commas, spaces or new lines. Everyone else is marked present."
+        )
+        st.button("Apply Absentees", on_click=apply_absentees)
+        if st.session_state.absentee_unknown:
+            st.warning(f"Not in this section: {', '.join(st.session_state.absentee_unknown)}")
+    
+    # One editable grid for the whole roster
+    edited = st.data_editor(
+        roster,
+        key=grid_key(),
+        column_config={
+            'Present': st.column_config.CheckboxColumn("Present", default=True)
+        },
+        disabled=['HT Number', 'Student Name', 'Original Section'],
+        hide_index=True,
+        use_container_width=True
+    )
+    present_count = int(edited['Present'].sum())
+    st.caption(f"Present: {present_count} | Absent: {len(edited) - present_count} | Total: {len(edited)}")
     
     if st.button("Submit Attendance", type="primary"):
-        if mark_attendance(attendance_data, st.session_state.username):
+        attendance_data = (
+            edited[['HT Number', 'Present']]
+            .rename(columns={'HT Number': 'ht_number', 'Present': 'present'})
+            .assign(subject=subject, period=period)
+            .to_dict('records')
+        )
+        success, results = mark_attendance(attendance_data, st.session_state.username)
+        if success:
+            skipped = [r for r in results if not r['recorded']]
+            if skipped:
+                st.warning("\n".join(
+                    f"{r['ht_number']}: {r['reason']}" for r in skipped
+                ))
             st.success("Attendance marked successfully!")
             # Clear form
             st.session_state.period = ''
             st.session_state.section = ''
             st.session_state.subject = ''
+            st.session_state.form_key = None
             st.rerun()
+        elif results:
+            # Another submission claimed this session first
+            st.session_state.form_key = None
+            st.error(results[0]['reason'])
         else:
             st.error("Failed to mark attendance")
 
@@ -472,10 +883,41 @@ def display_admin_page():
     
     with st.sidebar:
         st.header("Navigation")
-        page = st.radio(
-            "Select Page",
-            ["Student Statistics", "Faculty Workload", "Manage Data"]
+        pages = ["Student Statistics", "Faculty Workload", "Manage Data"]
+        if ANALYTICS_MIRROR:
+            pages.insert(2, "Attendance Analytics")
+        page = st.radio("Select Page", pages)
+        
+        handles = get_manager(DB_FILE, owner=session_owner).stats()
+        st.caption(
+            f"DB connections: {handles['open']} open, "
+            f"{handles['leaked']} leaked"
+        )
+        writes = get_writer(DB_FILE).stats()
+        st.caption(
+            f"Attendance writes: {writes['submissions']} submissions "
+            f"in {writes['commits']} commits"
         )
+        reports = get_report_cache().stats()
+        st.caption(
+            f"Report cache: {reports['entries']} entries, "
+            f"{reports['hits']} hits, {reports['misses']} misses"
+        )
+        if JOB_RUNNER_IN_APP:
+            jobs = get_runner(DB_FILE, JOB_DIR, JOB_WORKERS).stats()
+            st.caption(
+                f"Background reports: {jobs['running']} running, "
+                f"{jobs['completed']} completed, {jobs['failed']} failed"
+            )
+        if REPLICA_ENABLED:
+            replica = get_replica().stats()
+            if replica['age_seconds'] is None:
+                st.caption("Report replica: not loaded yet")
+            else:
+                st.caption(f"Report replica: refreshed {replica['age_seconds']}s ago")
+        if ANALYTICS_MIRROR:
+            mirrored = get_mirror().stats()
+            st.caption(f"Analytics mirror: {mirrored['rows']} rows")
         
         if st.button("Logout"):
             for key in list(st.session_state.keys()):
@@ -486,6 +928,8 @@ def display_admin_page():
         display_student_statistics()
     elif page == "Faculty Workload":
         display_faculty_workload()
+    elif page == "Attendance Analytics":
+        display_attendance_analytics()
     else:
         display_manage_data()
 
@@ -506,65 +950,83 @@ def display_student_statistics():
     
     # Section selection
     sections = get_sections_for_faculty()
-    selected_sections = st.multiselect("Select Sections", sections)
+    all_sections = st.checkbox("All sections")
+    selected_sections = st.multiselect("Select Sections", sections, disabled=all_sections)
     
-    if st.button("Generate Report"):
-        with get_db() as conn:
-            cur = conn.cursor()
-            placeholders = ','.join(['?'] * len(selected_sections))
-            
-            query = f"""
-                SELECT 
-                    s.ht_number,
-                    s.name as student_name,
-                    sec.name as section,
-                    sub.name as subject,
-                    COUNT(*) as total_classes,
-                    SUM(CASE WHEN a.status = 'P' THEN 1 ELSE 0 END) as present_classes,
-                    ROUND(CAST(SUM(CASE WHEN a.status = 'P' THEN 1 ELSE 0 END) AS FLOAT) / 
-                          COUNT(*) * 100, 2) as attendance_percentage
-                FROM students s
-                JOIN sections sec ON s.manipulated_section_id = sec.id
-                JOIN attendance a ON s.id = a.student_id
-                JOIN subjects sub ON a.subject_id = sub.id
-                WHERE sec.name IN ({placeholders})
-                AND date(a.date) BETWEEN ? AND ?
-                GROUP BY s.ht_number, s.name, sec.name, sub.name
-                ORDER BY sec.name, s.ht_number, sub.name
-            """
+    col1, col2 = st.columns(2)
+    with col1:
+        export_format = st.selectbox("Export Format", list(EXPORT_FORMATS))
+    with col2:
+        per_section = st.checkbox("One file per section (zip)")
+    
+    if st.session_state.pop('report_cancelled', False):
+        st.info("Report cancelled")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        generate = st.button("Generate Report")
+    with col2:
+        in_background = st.button("Run in Background")
+    
+    if generate or in_background:
+        selection = get_selection(all_sections, selected_sections, sections)
+        dates = (from_date.isoformat(), to_date.isoformat())
+        group_column = 'section' if per_section else None
+        if selection == []:
+            st.warning("Select at least one section")
+        elif in_background:
+            job_id = queue_report('student_statistics', selection, *dates, export_format, group_column)
+            st.success(f"Report queued as #{job_id}")
+        else:
+            show_student_statistics(selection, *dates, export_format, group_column)
+    
+    display_report_jobs('student_statistics')
+
+def show_student_statistics(selection, from_date, to_date, export_format, group_column):
+    """Run the student statistics report and show it with a download"""
+    with (get_report_db() as conn,
+          report_filter(conn, selection) as section_filter,
+          report_guard(conn)):
+        cache = get_report_cache()
+        archives = attach_archives(conn, from_date, to_date)
+        query, params = student_statistics_query(section_filter, from_date, to_date, archives)
+        
+        # One pass over the report writes the export, keeps the preview
+        # rows and tallies the summary, so the query runs once
+        cur = cache.query(conn, 'student_statistics', selection, from_date, to_date, query, params)
+        summary = StudentStatisticsSummary(get_columns(cur))
+        report = PreviewCursor(cur, REPORT_PREVIEW_ROWS, on_rows=summary.add)
+        data, file_name, mime = export_report(
+            report, "attendance_report", export_format, group_column=group_column
+        )
+        
+        with data:
+            if not report.rows:
+                st.warning("No attendance records found for selected criteria")
+                return
             
-            cur.execute(query, selected_sections + [from_date, to_date])
-            results = [dict(row) for row in cur.fetchall()]
+            figures = summary.figures()
+            st.subheader("Summary")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Total Students", figures['total_students'])
+            with col2:
+                st.metric("Average Attendance", f"{figures['avg_attendance']:.2f}%")
+            with col3:
+                st.metric("Students Below 75%", figures['below_75'])
             
-            if results:
-                df = pd.DataFrame(results)
-                
-                # Summary statistics
-                st.subheader("Summary")
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Total Students", len(df['ht_number'].unique()))
-                with col2:
-                    avg_attendance = df['attendance_percentage'].mean()
-                    st.metric("Average Attendance", f"{avg_attendance:.2f}%")
-                with col3:
-                    below_75 = len(df[df['attendance_percentage'] < 75]['ht_number'].unique())
-                    st.metric("Students Below 75%", below_75)
-                
-                # Detailed report
-                st.subheader("Detailed Report")
-                st.dataframe(df)
-                
-                # Download option
-                csv = df.to_csv(index=False)
-                st.download_button(
-                    "Download Report",
-                    csv,
-                    "attendance_report.csv",
-                    "text/csv"
+            # Detailed report
+            st.subheader("Detailed Report")
+            st.dataframe(pd.DataFrame(report.preview, columns=get_columns(report)))
+            if report.rows > REPORT_PREVIEW_ROWS:
+                st.caption(
+                    f"Showing the first {REPORT_PREVIEW_ROWS} of {report.rows} rows; "
+                    "download the report for all of them."
                 )
-            else:
-                st.warning("No attendance records found for selected criteria")
+            
+            # Download option; Streamlit keeps the payload as bytes, so the
+            # finished file is the only full copy of the report held in memory
+            st.download_button("Download Report", data.read(), file_name, mime)
 
 def display_faculty_workload():
     """Display faculty workload analysis"""
@@ -582,66 +1044,127 @@ def display_faculty_workload():
         return
     
     # Faculty selection
-    with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM faculty ORDER BY name")
-        faculty_list = [row['name'] for row in cur.fetchall()]
+    faculty_names = get_faculty_names()
+    all_faculty = st.checkbox("All faculty")
+    selected_faculty = st.multiselect("Select Faculty", faculty_names, disabled=all_faculty)
+    export_format = st.selectbox("Export Format", list(EXPORT_FORMATS))
     
-    selected_faculty = st.multiselect("Select Faculty", faculty_list)
+    if st.session_state.pop('report_cancelled', False):
+        st.info("Report cancelled")
     
-    if st.button("Generate Report"):
-        with get_db() as conn:
-            cur = conn.cursor()
-            placeholders = ','.join(['?'] * len(selected_faculty))
-            
-            query = f"""
-                SELECT 
-                    f.name as faculty_name,
-                    COUNT(DISTINCT fw.date || fw.period) as total_classes,
-                    COUNT(DISTINCT fw.date) as working_days,
-                    COUNT(DISTINCT sub.id) as unique_subjects,
-                    COUNT(DISTINCT sec.id) as unique_sections,
-                    GROUP_CONCAT(DISTINCT sub.name) as subjects_handled,
-                    GROUP_CONCAT(DISTINCT sec.name) as sections_handled
-                FROM faculty f
-                LEFT JOIN faculty_workload fw ON f.id = fw.faculty_id
-                LEFT JOIN subjects sub ON fw.subject_id = sub.id
-                LEFT JOIN sections sec ON fw.section_id = sec.id
-                WHERE f.name IN ({placeholders})
-                AND date(fw.date) BETWEEN ? AND ?
-                GROUP BY f.name
-            """
-            
-            cur.execute(query, selected_faculty + [from_date, to_date])
-            results = [dict(row) for row in cur.fetchall()]
+    col1, col2 = st.columns(2)
+    with col1:
+        generate = st.button("Generate Report")
+    with col2:
+        in_background = st.button("Run in Background")
+    
+    if generate or in_background:
+        selection = get_selection(all_faculty, selected_faculty, faculty_names)
+        dates = (from_date.isoformat(), to_date.isoformat())
+        if selection == []:
+            st.warning("Select at least one faculty member")
+        elif in_background:
+            job_id = queue_report('faculty_workload', selection, *dates, export_format)
+            st.success(f"Report queued as #{job_id}")
+        else:
+            show_faculty_workload(selection, *dates, export_format)
+    
+    display_report_jobs('faculty_workload')
+
+def show_faculty_workload(selection, from_date, to_date, export_format):
+    """Run the faculty workload report and show it with a download"""
+    with (get_report_db() as conn,
+          report_filter(conn, selection) as faculty_filter,
+          report_guard(conn)):
+        cache = get_report_cache()
+        archives = attach_archives(conn, from_date, to_date)
+        query, params = faculty_workload_query(faculty_filter, from_date, to_date, archives)
+        cur = cache.query(conn, 'faculty_workload', selection, from_date, to_date, query, params)
+        columns = get_columns(cur)
+        rows = [tuple(row) for row in cur.fetchall()]
+        results = [dict(zip(columns, row)) for row in rows]
+        
+        if results:
+            for faculty in results:
+                with st.expander(f"📊 {faculty['faculty_name']}", expanded=True):
+                    col1, col2, col3, col4, col5 = st.columns(5)
+                    with col1:
+                        st.metric("Total Classes", faculty['total_classes'])
+                    with col2:
+                        st.metric("Working Days", faculty['working_days'])
+                    with col3:
+                        st.metric("Teaching Hours", faculty['teaching_hours'])
+                    with col4:
+                        st.metric("Subjects", faculty['unique_subjects'])
+                    with col5:
+                        st.metric("Sections", faculty['unique_sections'])
+                    
+                    st.write("**Subjects Handled:**", faculty['subjects_handled'])
+                    st.write("**Sections Handled:**", faculty['sections_handled'])
             
-            if results:
-                for faculty in results:
-                    with st.expander(f"📊 {faculty['faculty_name']}", expanded=True):
-                        col1, col2, col3, col4 = st.columns(4)
-                        with col1:
-                            st.metric("Total Classes", faculty['total_classes'])
-                        with col2:
-                            st.metric("Working Days", faculty['working_days'])
-                        with col3:
-                            st.metric("Subjects", faculty['unique_subjects'])
-                        with col4:
-                            st.metric("Sections", faculty['unique_sections'])
-                        
-                        st.write("**Subjects Handled:**", faculty['subjects_handled'])
-                        st.write("**Sections Handled:**", faculty['sections_handled'])
-                
-                # Create downloadable report
-                df = pd.DataFrame(results)
-                csv = df.to_csv(index=False)
-                st.download_button(
-                    "Download Workload Report",
-                    csv,
-                    "faculty_workload.csv",
-                    "text/csv"
-                )
-            else:
-                st.warning("No workload data found for selected criteria")
+            # Create downloadable report from the rows already read
+            offer_download(
+                RowCursor(columns, rows), "Download Workload Report", "faculty_workload", export_format
+            )
+        else:
+            st.warning("No workload data found for selected criteria")
+
+def display_attendance_analytics():
+    """Display attendance trends and section cohorts from the analytics mirror"""
+    st.header("Attendance Analytics")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        from_date = st.date_input("From Date")
+    with col2:
+        to_date = st.date_input("To Date")
+    
+    if not validate_date_range(from_date.isoformat(), to_date.isoformat()):
+        st.error("Invalid date range")
+        return
+    
+    section_ids = get_section_ids()
+    selected = st.multiselect("Sections (all when empty)", get_sections_for_faculty())
+    sections = [section_ids[name] for name in selected] or None
+    
+    mirror = get_mirror()
+    mirror.refresh_in_background(MIRROR_REFRESH_SECONDS)
+    age = mirror.stats()['age_seconds']
+    if age is None:
+        st.info("The analytics mirror is being built; reload the page in a moment")
+        return
+    st.caption(f"Figures as of {age}s ago, archived terms included")
+    columns = mirror.columns()
+    
+    _, present, total, percentage = student_percentages(columns, from_date, to_date, sections)
+    if not len(total):
+        st.warning("No attendance records found for selected criteria")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total Students", len(total))
+    with col2:
+        st.metric("Average Attendance", f"{percentage.mean():.2f}%")
+    with col3:
+        st.metric("Students Below 75%", int((percentage < 75).sum()))
+    
+    st.subheader("Daily Attendance")
+    days, present, total = daily_trend(columns, from_date, to_date, sections)
+    st.line_chart(pd.DataFrame(
+        {'Attendance %': (100 * present / total).round(2)},
+        index=pd.to_datetime(days)
+    ))
+    
+    st.subheader("Sections")
+    section_names = {section_id: name for name, section_id in section_ids.items()}
+    cohort_ids, students, average, below = cohort_summary(columns, from_date, to_date, 75, sections)
+    st.dataframe(pd.DataFrame({
+        'section': [section_names.get(int(section_id), section_id) for section_id in cohort_ids],
+        'students': students,
+        'average_percentage': average,
+        'below_75': below
+    }).sort_values('section'), hide_index=True)
 
 def display_manage_data():
     """Display data management interface"""
@@ -664,17 +1187,16 @@ def display_manage_data():
             
             # Export option
             if not df.empty:
-                csv = df.to_csv(index=False)
-                st.download_button(
-                    "Export Student Data",
-                    csv,
-                    "students.csv",
-                    "text/csv"
-                )
+                export_format = st.selectbox("Export Format", list(EXPORT_FORMATS))
+                with get_read_db() as conn:
+                    offer_download(
+                        query_students_in_section(conn, section),
+                        "Export Student Data", "students", export_format
+                    )
     
     with tab2:
         st.subheader("Faculty Management")
-        with get_db() as conn:
+        with get_read_db() as conn:
             cur = conn.cursor()
             cur.execute("SELECT name, created_at FROM faculty")
             faculty = [dict(row) for row in cur.fetchall()]
@@ -693,16 +1215,33 @@ def display_manage_data():
     
     with tab4:
         st.subheader("Upload Data")
-        uploaded_file = st.file_uploader("Choose Excel file", type="xlsx")
-        if uploaded_file:
+        st.caption("Columns: HT Number, Name, Section and optionally Original Section")
+        uploaded_files = st.file_uploader(
+            "Choose Excel files", type="xlsx", accept_multiple_files=True
+        )
+        if uploaded_files and st.button("Process Upload"):
             try:
-                df = pd.read_excel(uploaded_file)
-                st.write("Preview of uploaded data:")
-                st.dataframe(df)
-                if st.button("Process Upload"):
-                    st.info("Data processing functionality to be implemented")
+                rosters = parse_rosters([f.getvalue() for f in uploaded_files])
             except Exception as e:
                 st.error(f"Error processing file: {e}")
+                return
+            
+            with get_db() as conn:
+                section_ids = load_section_ids(conn)
+                for uploaded_file, columns in zip(uploaded_files, rosters):
+                    rows, errors = validate_roster(columns, section_ids)
+                    if errors:
+                        st.warning(f"{uploaded_file.name}: {len(errors)} rows rejected")
+                        st.dataframe(pd.DataFrame(
+                            errors, columns=["Row", "HT Number", "Problem"]
+                        ))
+                    if rows:
+                        progress = st.progress(0.0, text=f"Loading {uploaded_file.name}")
+                        upsert_students(
+                            conn, rows,
+                            lambda done, total: progress.progress(done / total)
+                        )
+                        st.success(f"{uploaded_file.name}: loaded {len(rows)} students")
 
 def main():
     """Main application entry point"""
@@ -0,0 +1,454 @@
+# archive.py
+"""Academic terms and their cold-storage archives
+
+A closed term's attendance, workload and rollups move into a database
+file of their own, together with frozen term totals and a snapshot of
+the catalog they refer to. The totals are also kept in the hot database,
+so a report spanning whole archived terms reads them without opening
+any archive; only terms a report's range cuts through are ATTACHed and
+read row by row.
+
+Archiving a term happens in three steps: the archive file is built from
+a read snapshot without blocking writers, the term is marked archived in
+one short transaction (reports read it from the archive from then on),
+and the hot copies are deleted in small chunks.
+"""
+import os
+import re
+import sqlite3
+import time
+from datetime import date, datetime
+from urllib.parse import quote
+from connections import BUSY_TIMEOUT_SECONDS, begin_immediate
+
+# Where archive files are written, relative to the working directory
+ARCHIVE_DIR = 'archives'
+
+# Archives are attached read-only through the platform's default VFS, as
+# the in-memory report replica's connections would otherwise open them in
+# its memdb VFS
+ARCHIVE_VFS = 'win32' if os.name == 'nt' else 'unix'
+
+# Rows and sessions deleted from the hot database per transaction, and
+# the pause between chunks that lets attendance writes in
+PURGE_CHUNK_ROWS = 5000
+PURGE_CHUNK_SESSIONS = 50
+PURGE_PAUSE_SECONDS = 0.05
+
+TERM_TABLES = '''
+    CREATE TABLE IF NOT EXISTS academic_terms (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        archive_file TEXT,                  -- absolute path, once archived
+        archived_at TIMESTAMP,              -- reports read the archive from here on
+        purged_at TIMESTAMP,                -- hot copies all deleted
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        CHECK (start_date <= end_date)
+    );
+
+    CREATE TABLE IF NOT EXISTS term_attendance_totals (
+        term_id INTEGER NOT NULL,
+        student_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        present INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (term_id, student_id, subject_id),
+        FOREIGN KEY (term_id) REFERENCES academic_terms(id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS term_faculty_totals (
+        term_id INTEGER NOT NULL,
+        faculty_id INTEGER NOT NULL,
+        classes INTEGER NOT NULL,
+        working_days INTEGER NOT NULL,
+        teaching_minutes INTEGER NOT NULL,
+        PRIMARY KEY (term_id, faculty_id),
+        FOREIGN KEY (term_id) REFERENCES academic_terms(id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS term_faculty_classes (
+        term_id INTEGER NOT NULL,
+        faculty_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        section_id INTEGER NOT NULL,
+        PRIMARY KEY (term_id, faculty_id, subject_id, section_id),
+        FOREIGN KEY (term_id) REFERENCES academic_terms(id)
+    ) WITHOUT ROWID;
+'''
+
+# Rows of a term copied into its archive, as SELECTs over the hot
+# database taking the term's first and last day. Each table keeps the hot
+# database's definition and indexes.
+ARCHIVED_ROWS = {
+    'attendance_sessions': '''
+        SELECT * FROM main.attendance_sessions WHERE date BETWEEN ? AND ?
+    ''',
+    'attendance': '''
+        SELECT a.* FROM main.attendance a
+        JOIN main.attendance_sessions ses ON a.session_id = ses.id
+        WHERE ses.date BETWEEN ? AND ?
+    ''',
+    'attendance_daily_rollup': '''
+        SELECT * FROM main.attendance_daily_rollup WHERE date BETWEEN ? AND ?
+    ''',
+    'faculty_workload': '''
+        SELECT * FROM main.faculty_workload WHERE date BETWEEN ? AND ?
+    ''',
+    'faculty_daily_workload': '''
+        SELECT * FROM main.faculty_daily_workload WHERE date BETWEEN ? AND ?
+    ''',
+}
+
+# The catalog the archived rows refer to, as it stood when archived
+CATALOG_SNAPSHOT = {
+    'faculty': 'SELECT id, name FROM main.faculty',
+    'sections': 'SELECT * FROM main.sections',
+    'subjects': 'SELECT * FROM main.subjects',
+    'students': 'SELECT * FROM main.students',
+}
+
+# Frozen totals inside an archive; the hot copies add the term id
+ARCHIVE_TOTALS = '''
+    CREATE TABLE archive.term_attendance_totals (
+        student_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        present INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (student_id, subject_id)
+    ) WITHOUT ROWID;
+
+    INSERT INTO archive.term_attendance_totals (student_id, subject_id, present, total)
+    SELECT student_id, subject_id, SUM(present), SUM(total)
+    FROM archive.attendance_daily_rollup
+    GROUP BY student_id, subject_id
+    HAVING SUM(total) > 0;
+
+    CREATE TABLE archive.term_faculty_totals (
+        faculty_id INTEGER PRIMARY KEY,
+        classes INTEGER NOT NULL,
+        working_days INTEGER NOT NULL,
+        teaching_minutes INTEGER NOT NULL
+    );
+
+    INSERT INTO archive.term_faculty_totals (faculty_id, classes, working_days, teaching_minutes)
+    SELECT faculty_id, SUM(classes), COUNT(*), SUM(teaching_minutes)
+    FROM archive.faculty_daily_workload
+    GROUP BY faculty_id;
+
+    CREATE TABLE archive.term_faculty_classes (
+        faculty_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        section_id INTEGER NOT NULL,
+        PRIMARY KEY (faculty_id, subject_id, section_id)
+    ) WITHOUT ROWID;
+
+    INSERT INTO archive.term_faculty_classes (faculty_id, subject_id, section_id)
+    SELECT DISTINCT faculty_id, subject_id, section_id
+    FROM archive.faculty_workload
+    WHERE faculty_id IS NOT NULL AND subject_id IS NOT NULL AND section_id IS NOT NULL;
+
+    CREATE TABLE archive.archive_info (
+        key TEXT PRIMARY KEY,
+        value
+    );
+'''
+
+# Figures compared between the hot database and a finished archive
+# before the term is switched over; any write in between changes one
+TERM_FINGERPRINT = '''
+    SELECT
+        (SELECT COUNT(*) FROM {schema}.attendance_sessions WHERE date BETWEEN :start AND :end),
+        (SELECT COUNT(*) FROM {schema}.attendance a
+         JOIN {schema}.attendance_sessions ses ON a.session_id = ses.id
+         WHERE ses.date BETWEEN :start AND :end),
+        (SELECT COALESCE(SUM(a.status = 'P'), 0) FROM {schema}.attendance a
+         JOIN {schema}.attendance_sessions ses ON a.session_id = ses.id
+         WHERE ses.date BETWEEN :start AND :end),
+        (SELECT COUNT(*) FROM {schema}.faculty_workload WHERE date BETWEEN :start AND :end)
+'''
+
+
+# ================ Terms ================
+def add_term(conn, name, start_date, end_date):
+    """Record an academic term; terms may not overlap
+
+    Returns (success, message).
+    """
+    try:
+        start_date = date.fromisoformat(str(start_date)).isoformat()
+        end_date = date.fromisoformat(str(end_date)).isoformat()
+    except ValueError:
+        return False, "Dates must be given as YYYY-MM-DD"
+    if start_date > end_date:
+        return False, "The term must start before it ends"
+    clash = conn.execute('''
+        SELECT name FROM academic_terms
+        WHERE start_date <= ? AND end_date >= ?
+    ''', (end_date, start_date)).fetchone()
+    if clash:
+        return False, f"Overlaps term {clash[0]}"
+    try:
+        conn.execute(
+            'INSERT INTO academic_terms (name, start_date, end_date) VALUES (?, ?, ?)',
+            (name, start_date, end_date)
+        )
+    except sqlite3.IntegrityError:
+        return False, f"Term {name} already exists"
+    return True, f"Added term {name} ({start_date} to {end_date})"
+
+def list_terms(conn):
+    """Get every term with its archive state, oldest first"""
+    return conn.execute('''
+        SELECT id, name, start_date, end_date, archive_file, archived_at, purged_at
+        FROM academic_terms
+        ORDER BY start_date
+    ''').fetchall()
+
+def get_term(conn, name):
+    """Get a term by name, or None"""
+    return conn.execute('''
+        SELECT id, name, start_date, end_date, archive_file, archived_at, purged_at
+        FROM academic_terms WHERE name = ?
+    ''', (name,)).fetchone()
+
+
+# ================ Archiving ================
+def get_archive_file(archive_dir, term_name):
+    """Get the absolute path of a term's archive file"""
+    return os.path.abspath(os.path.join(archive_dir, re.sub(r'[^\w.-]+', '-', term_name) + '.db'))
+
+def copy_schema(conn, table):
+    """Create a hot table and its indexes in the attached archive"""
+    for kind, sql in conn.execute('''
+        SELECT type, sql FROM main.sqlite_master
+        WHERE tbl_name = ? AND type IN ('table', 'index') AND sql IS NOT NULL
+        ORDER BY type = 'index'
+    ''', (table,)).fetchall():
+        conn.execute(re.sub(rf'^CREATE {kind.upper()} ("?)(\w+)\1', rf'CREATE {kind.upper()} archive.\2',
+                            sql, flags=re.IGNORECASE))
+
+def build_archive(conn, term, path):
+    """Write a term's rows, totals and catalog snapshot to an archive file
+
+    Reads one snapshot of the hot database, so attendance writes carry on
+    meanwhile. The file is built under a temporary name and renamed once
+    complete. Returns the archive's fingerprint of the term.
+    """
+    _, name, start_date, end_date = term[:4]
+    partial = path + '.part'
+    if os.path.exists(partial):
+        os.remove(partial)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn.execute('ATTACH DATABASE ? AS archive', (partial,))
+    try:
+        conn.execute('BEGIN')
+        try:
+            for table, select in ARCHIVED_ROWS.items():
+                copy_schema(conn, table)
+                conn.execute(f'INSERT INTO archive.{table} {select}', (start_date, end_date))
+            for table, select in CATALOG_SNAPSHOT.items():
+                conn.execute(f'CREATE TABLE archive.{table} AS {select}')
+            for statement in ARCHIVE_TOTALS.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+            fingerprint = conn.execute(
+                TERM_FINGERPRINT.format(schema='archive'), {'start': start_date, 'end': end_date}
+            ).fetchone()
+            conn.executemany('INSERT INTO archive.archive_info (key, value) VALUES (?, ?)', [
+                ('term', name),
+                ('start_date', start_date),
+                ('end_date', end_date),
+                ('archived_at', datetime.now().isoformat(timespec='seconds')),
+            ])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.execute('DETACH DATABASE archive')
+    os.replace(partial, path)
+    return tuple(fingerprint)
+
+def switch_to_archive(conn, term, path, fingerprint):
+    """Mark a term archived and copy its frozen totals into the hot database
+
+    Fails, leaving the term in the hot database, if its rows changed
+    since the archive was built.
+    """
+    term_id, name, start_date, end_date = term[:4]
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    try:
+        begin_immediate(conn)
+        try:
+            current = conn.execute(
+                TERM_FINGERPRINT.format(schema='main'), {'start': start_date, 'end': end_date}
+            ).fetchone()
+            if tuple(current) != fingerprint:
+                raise RuntimeError(f"Term {name} changed while it was being archived; run again")
+            conn.execute('''
+                INSERT INTO term_attendance_totals (term_id, student_id, subject_id, present, total)
+                SELECT ?, student_id, subject_id, present, total FROM archive.term_attendance_totals
+            ''', (term_id,))
+            conn.execute('''
+                INSERT INTO term_faculty_totals (term_id, faculty_id, classes, working_days, teaching_minutes)
+                SELECT ?, faculty_id, classes, working_days, teaching_minutes FROM archive.term_faculty_totals
+            ''', (term_id,))
+            conn.execute('''
+                INSERT INTO term_faculty_classes (term_id, faculty_id, subject_id, section_id)
+                SELECT ?, faculty_id, subject_id, section_id FROM archive.term_faculty_classes
+            ''', (term_id,))
+            conn.execute('''
+                UPDATE academic_terms
+                SET archive_file = ?, archived_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (path, term_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.execute('DETACH DATABASE archive')
+
+# Deletes of one chunk of a term's hot rows, as (rows, statements) run in
+# order in one transaction until they find nothing left. Rollups go first
+# so the rollup triggers on attendance have nothing left to adjust, and a
+# chunk of sessions goes together with its attendance rows.
+_CHUNK_SESSIONS = f'''
+    SELECT id FROM attendance_sessions
+    WHERE date BETWEEN :start AND :end
+    ORDER BY id
+    LIMIT {PURGE_CHUNK_SESSIONS}
+'''
+
+PURGE_STEPS = [
+    ('rollup', [f'''
+        DELETE FROM attendance_daily_rollup
+        WHERE (student_id, date, subject_id) IN (
+            SELECT student_id, date, subject_id FROM attendance_daily_rollup
+            WHERE date BETWEEN :start AND :end
+            LIMIT {PURGE_CHUNK_ROWS}
+        )
+    ''']),
+    ('attendance', [
+        f'DELETE FROM attendance WHERE session_id IN ({_CHUNK_SESSIONS})',
+        f'DELETE FROM attendance_sessions WHERE id IN ({_CHUNK_SESSIONS})',
+    ]),
+    ('faculty workload', [f'''
+        DELETE FROM faculty_workload
+        WHERE id IN (
+            SELECT id FROM faculty_workload
+            WHERE date BETWEEN :start AND :end
+            LIMIT {PURGE_CHUNK_ROWS}
+        )
+    ''']),
+    ('faculty daily workload', [f'''
+        DELETE FROM faculty_daily_workload
+        WHERE rowid IN (
+            SELECT rowid FROM faculty_daily_workload
+            WHERE date BETWEEN :start AND :end
+            LIMIT {PURGE_CHUNK_ROWS}
+        )
+    ''']),
+]
+
+def purge_term(conn, term, log=print):
+    """Delete an archived term's hot rows, one short transaction per chunk
+
+    Safe to interrupt and run again. Returns the rows deleted per step,
+    counting a step's first statement.
+    """
+    term_id, name, start_date, end_date = term[:4]
+    deleted = {}
+    for step, statements in PURGE_STEPS:
+        deleted[step] = 0
+        while True:
+            begin_immediate(conn)
+            try:
+                counts = [conn.execute(statement, {'start': start_date, 'end': end_date}).rowcount
+                          for statement in statements]
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            deleted[step] += counts[0]
+            if not any(counts):
+                break
+            time.sleep(PURGE_PAUSE_SECONDS)
+        log(f"{name}: deleted {deleted[step]} {step} rows")
+    conn.execute('UPDATE academic_terms SET purged_at = CURRENT_TIMESTAMP WHERE id = ?', (term_id,))
+    return deleted
+
+def archive_term(db_file, name, archive_dir=ARCHIVE_DIR, log=print):
+    """Move a closed term out of the hot database into its archive file
+
+    A term that was archived but not fully purged resumes at the purge.
+    Returns (success, message).
+    """
+    conn = sqlite3.connect(db_file, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        term = get_term(conn, name)
+        if not term:
+            return False, f"No term named {name}"
+        if term[3] >= date.today().isoformat():
+            return False, f"Term {name} has not ended yet"
+        if term[6]:
+            return False, f"Term {name} is already archived in {term[4]}"
+        if not term[5]:
+            path = get_archive_file(archive_dir, name)
+            if os.path.exists(path):
+                return False, f"{path} already exists"
+            started = time.perf_counter()
+            fingerprint = build_archive(conn, term, path)
+            try:
+                switch_to_archive(conn, term, path, fingerprint)
+            except Exception:
+                os.remove(path)
+                raise
+            log(f"{name}: archived {fingerprint[1]} attendance rows of {fingerprint[0]} sessions "
+                f"to {path} in {time.perf_counter() - started:.1f}s")
+        purge_term(conn, term, log)
+        return True, f"Term {name} archived; run VACUUM to return the freed pages"
+    finally:
+        conn.close()
+
+
+# ================ Reading ================
+def attach_archives(conn, from_date, to_date):
+    """Attach the archives a report over a date range has to read
+
+    Returns (term_id, start_date, end_date, schema) for every archived
+    term overlapping the range, oldest first. schema is None for terms
+    the range fully covers, which reports read from their frozen totals;
+    the others are attached as term_<id> and stay attached for later
+    reports; the connection must be opened with uri=True, as report
+    connections are. Archives this report does not need are detached
+    first, keeping within SQLite's limit on attachments; one read earlier
+    in the current transaction stays attached until a later report.
+    """
+    from_date, to_date = str(from_date), str(to_date)
+    terms = conn.execute('''
+        SELECT id, name, start_date, end_date, archive_file
+        FROM academic_terms
+        WHERE archived_at IS NOT NULL
+        AND start_date <= ? AND end_date >= ?
+        ORDER BY start_date
+    ''', (to_date, from_date)).fetchall()
+    archives = [(term_id, start, end, None if from_date <= start and end <= to_date else f'term_{term_id}')
+                for term_id, _, start, end, _ in terms]
+    needed = {archive[3] for archive in archives}
+    attached = {row[1] for row in conn.execute('PRAGMA database_list')}
+    for schema in attached - needed:
+        if schema.startswith('term_'):
+            try:
+                conn.execute(f'DETACH DATABASE {schema}')
+            except sqlite3.OperationalError:
+                pass
+    for (_, name, _, _, path), (_, _, _, schema) in zip(terms, archives):
+        if schema and schema not in attached:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"The archive of term {name} is missing: {path}")
+            conn.execute(f'ATTACH DATABASE ? AS {schema}',
+                         (f"file:{quote(path)}?mode=ro&vfs={ARCHIVE_VFS}",))
+    return archives
@@ -0,0 +1,598 @@
+# bench.py
+"""Synthetic dataset generator and benchmarks for the attendance hot paths
+
+Usage:
+    python bench.py generate --db bench.db [--sections-per-branch 4 --students-per-section 120]
+    python bench.py run --db bench.db --output results.json [--baseline baseline.json]
+    python bench.py compare results.json baseline.json
+    python bench.py stress [--processes 8 --sessions-per-process 40]
+    python bench.py layout --db bench.db
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+from config import SECTIONS, SUBJECTS, get_original_section_name, get_section_name
+from archive import attach_archives
+from bitmaps import student_percentages, sync_bitmaps
+from connections import begin_immediate
+import mirror
+from migrations import ATTENDANCE_LAYOUTS, migrate, set_attendance_layout
+from rollups import rebuild_rollups
+from reports import faculty_workload_query, report_filter, student_statistics_query
+
+PERIOD_NAMES = ['P1', 'P2', 'P3', 'P4', 'P5', 'P6']
+PERIOD_STARTS = ['09:00', '10:00', '11:00', '12:00', '13:45', '14:45']
+
+# Median slowdown, relative to the baseline, that counts as a regression
+DEFAULT_THRESHOLD = 0.25
+
+
+# ================ Dataset Generation ================
+def get_app(db_file):
+    """Import the Streamlit app pointed at a benchmark database
+
+    The app's own functions are exercised so the benchmarks follow the
+    real code paths as they change.
+    """
+    import app
+    app.DB_FILE = db_file
+    return app
+
+def build_structure(sections_per_branch=None):
+    """Get [(section, original_section, [subjects])] for the institution
+
+    Sections follow config.SECTIONS; sections_per_branch widens every
+    branch to that many sections (A, B, C, ...) for larger datasets.
+    Branches without configured subjects get five synthetic ones.
+    """
+    structure = []
+    for program, prog_data in SECTIONS.items():
+        for year in prog_data['years']:
+            for branch, branch_sections in prog_data['branches'].items():
+                key = f"{program}-{year}-{branch}"
+                subjects = SUBJECTS.get(key) or [f"{key} Subject {n}" for n in range(1, 6)]
+                if sections_per_branch:
+                    branch_sections = [chr(ord('A') + n) for n in range(sections_per_branch)]
+                for section in branch_sections:
+                    section_name = get_section_name(program, year, branch, section)
+                    structure.append((section_name, get_original_section_name(section_name), subjects))
+    return structure
+
+def academic_days(start, days):
+    """Get the first `days` working days (Monday to Saturday) from start"""
+    result = []
+    current = start
+    while len(result) < days:
+        if current.weekday() != 6:
+            result.append(current)
+        current += timedelta(days=1)
+    return result
+
+def generate(db_file, sections_per_branch=None, students_per_section=60, days=180,
+             start=date(2024, 7, 1), faculty_count=60, seed=7, log=print):
+    """Bulk-create a synthetic institution with a year of attendance
+
+    Reference data and students are inserted directly; attendance goes
+    through app.mark_attendance, one call per class session.
+    """
+    rng = random.Random(seed)
+    # A stale WAL left beside a new file would be replayed into it
+    for path in (db_file, db_file + '-wal', db_file + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    migrate(db_file)
+    structure = build_structure(sections_per_branch)
+
+    conn = sqlite3.connect(db_file)
+    with conn:
+        faculty = [f"faculty{n:03d}" for n in range(1, faculty_count + 1)]
+        conn.executemany('INSERT INTO faculty (name, credential) VALUES (?, ?)',
+                         [(name, 'bench') for name in faculty])
+        subjects = sorted({subject for _, _, names in structure for subject in names})
+        conn.executemany('''
+            INSERT INTO subjects (name, program, year, branch) VALUES (?, '', '', '')
+        ''', [(subject,) for subject in subjects])
+        for section_name, original_name, _ in structure:
+            conn.execute('INSERT INTO sections (name, is_original) VALUES (?, 0)', (section_name,))
+            conn.execute('INSERT INTO sections (name, is_original) VALUES (?, 1)', (original_name,))
+        section_ids = dict(conn.execute('SELECT name, id FROM sections'))
+
+        students = []
+        rosters = {}
+        for section_name, original_name, _ in structure:
+            roster = rosters[section_name] = []
+            for _ in range(students_per_section):
+                ht_number = f"24SY{len(students):06d}"
+                roster.append((ht_number, rng.uniform(0.55, 0.98)))
+                students.append((ht_number, f"Student {len(students)}",
+                                 section_ids[section_name], section_ids[original_name]))
+        conn.executemany('''
+            INSERT INTO students (ht_number, name, manipulated_section_id, original_section_id)
+            VALUES (?, ?, ?, ?)
+        ''', students)
+    conn.close()
+    log(f"{len(structure)} sections, {len(students)} students")
+
+    app = get_app(db_file)
+    teachers = {(section_name, subject): rng.choice(faculty)
+                for section_name, _, names in structure for subject in names}
+    sessions = 0
+    for day_number, day in enumerate(academic_days(start, days)):
+        for section_name, _, names in structure:
+            for period_index, period in enumerate(PERIOD_NAMES):
+                subject = names[(day_number + period_index) % len(names)]
+                marked_at = datetime.combine(day, datetime.strptime(PERIOD_STARTS[period_index], '%H:%M').time())
+                attendance_data = [{
+                    'ht_number': ht_number,
+                    'subject': subject,
+                    'period': period,
+                    'present': rng.random() < propensity
+                } for ht_number, propensity in rosters[section_name]]
+                success, _ = app.mark_attendance(attendance_data, teachers[(section_name, subject)], marked_at)
+                if not success:
+                    raise RuntimeError(f"Failed to mark {section_name} {period} on {day}")
+                sessions += 1
+        if day_number % 20 == 0:
+            log(f"{day}: {sessions} sessions marked")
+    log(f"{sessions} sessions marked")
+
+
+def copy_database(source_file, target_file):
+    """Copy a database with the backup API, including pages still in its WAL"""
+    source = sqlite3.connect(source_file)
+    target = sqlite3.connect(target_file)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+# ================ Benchmarks ================
+def time_case(func, repeat):
+    """Run func repeat times and summarize wall-clock times in ms"""
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        func(i)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'repeat': repeat
+    }
+
+def describe_dataset(conn):
+    """Get row counts and the date range of a benchmark database"""
+    first, last = conn.execute('SELECT MIN(date), MAX(date) FROM attendance_sessions').fetchone()
+    return {
+        'students': conn.execute('SELECT COUNT(*) FROM students').fetchone()[0],
+        'attendance_rows': conn.execute('SELECT COUNT(*) FROM attendance').fetchone()[0],
+        'sessions': conn.execute('SELECT COUNT(*) FROM attendance_sessions').fetchone()[0],
+        'first_date': first,
+        'last_date': last,
+        'size_bytes': conn.execute(
+            'SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size()'
+        ).fetchone()[0]
+    }
+
+def storage_bytes(conn, tables):
+    """Get the bytes used by tables and their indexes, or None without dbstat"""
+    try:
+        return conn.execute(f'''
+            SELECT COALESCE(SUM(pgsize), 0) FROM dbstat
+            WHERE name IN (
+                SELECT name FROM sqlite_master
+                WHERE tbl_name IN ({', '.join('?' for _ in tables)})
+            )
+        ''', tables).fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+def run(db_file, repeat=20):
+    """Time each hot path against a copy of db_file
+
+    Writes land in the copy, so the source database stays comparable
+    between runs. The copy is migrated to the current schema first.
+    """
+    workdir = tempfile.mkdtemp()
+    bench_db = os.path.join(workdir, 'bench.db')
+    copy_database(db_file, bench_db)
+    migrate(bench_db)
+    try:
+        app = get_app(bench_db)
+        conn = app.get_db()
+        dataset = describe_dataset(conn)
+        with conn:
+            sync_bitmaps(conn)
+        dataset['attendance_bytes'] = storage_bytes(conn, ['attendance'])
+        dataset['bitmap_bytes'] = storage_bytes(conn, ['attendance_bitmaps', 'attendance_rosters'])
+        attendance_mirror = mirror.AttendanceMirror(bench_db, os.path.join(workdir, 'mirror'))
+        attendance_mirror.refresh()
+        dataset['mirror_bytes'] = sum(column.nbytes for column in attendance_mirror.columns().values())
+        sections = [row[0] for row in conn.execute(
+            'SELECT name FROM sections WHERE is_original = 0 ORDER BY name')]
+        faculty = [row[0] for row in conn.execute('SELECT name FROM faculty ORDER BY name')]
+        section = sections[len(sections) // 2]
+        roster = app.get_students_in_section(section)
+        subject = conn.execute('''
+            SELECT sub.name
+            FROM faculty_workload fw
+            JOIN sections sec ON fw.section_id = sec.id
+            JOIN subjects sub ON fw.subject_id = sub.id
+            WHERE sec.name = ?
+            LIMIT 1
+        ''', (section,)).fetchone()[0]
+        last_day = date.fromisoformat(dataset['last_date'])
+        first, last = dataset['first_date'], dataset['last_date']
+
+        def mark(i):
+            success, _ = app.mark_attendance([{
+                'ht_number': student['ht_number'],
+                'subject': subject,
+                'period': 'P1',
+                'present': True
+            } for student in roster], faculty[0], datetime.combine(last_day + timedelta(days=i + 1),
+                                                                   datetime.min.time()))
+            if not success:
+                raise RuntimeError("mark_attendance failed")
+
+        reader = app.get_read_db()
+
+        def fetch(builder, names):
+            def case(i):
+                with reader, report_filter(reader, names) as selection:
+                    archives = attach_archives(reader, first, last)
+                    reader.execute(*builder(selection, first, last, archives)).fetchall()
+            return case
+
+        def rollup_sweep(i):
+            conn.execute('''
+                SELECT student_id, SUM(present), SUM(total)
+                FROM attendance_daily_rollup
+                WHERE date BETWEEN ? AND ?
+                GROUP BY student_id
+            ''', (first, last)).fetchall()
+
+        results = {
+            'mark_attendance': time_case(mark, repeat),
+            'check_duplicate_attendance': time_case(
+                lambda i: app.check_duplicate_attendance(section, 'P3', last), repeat),
+            'get_students_in_section': time_case(
+                lambda i: app.get_students_in_section(section), repeat),
+            'student_statistics': time_case(
+                fetch(student_statistics_query, sections), max(1, repeat // 4)),
+            'faculty_workload': time_case(
+                fetch(faculty_workload_query, faculty), max(1, repeat // 4)),
+            'percentage_sweep_rollups': time_case(rollup_sweep, max(1, repeat // 4)),
+            'percentage_sweep_bitmaps': time_case(
+                lambda i: student_percentages(conn, first, last), max(1, repeat // 4)),
+            'percentage_sweep_mirror': time_case(
+                lambda i: mirror.student_percentages(attendance_mirror.columns(), first, last),
+                max(1, repeat // 4)),
+        }
+        attendance_mirror.close()
+        return {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'section_size': len(roster),
+                **dataset
+            },
+            'results': results
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def layout(db_file, repeat=20):
+    """Compare the attendance layouts on vacuumed copies of db_file
+
+    Every case runs once untimed first, so neither layout pays for a cold
+    cache. Returns {layout: {'size': ..., 'results': ...}} with the storage of
+    the attendance rows and timings of the reads and writes that touch
+    them.
+    """
+    workdir = tempfile.mkdtemp()
+    try:
+        report = {}
+        for name in sorted(ATTENDANCE_LAYOUTS):
+            bench_db = os.path.join(workdir, f'{name}.db')
+            copy_database(db_file, bench_db)
+            migrate(bench_db)
+            conn = sqlite3.connect(bench_db, isolation_level=None)
+            begin_immediate(conn)
+            set_attendance_layout(conn, name)
+            conn.execute('COMMIT')
+            conn.execute('VACUUM')
+            first, last = conn.execute(
+                'SELECT MIN(date), MAX(date) FROM attendance_sessions').fetchone()
+            students = [row[0] for row in conn.execute('SELECT id FROM students ORDER BY id')]
+            sessions = [row[0] for row in conn.execute('SELECT id FROM attendance_sessions ORDER BY id')]
+            rng = random.Random(7)
+
+            def student_history(i):
+                conn.execute('''
+                    SELECT ses.date, ses.period, ses.subject_id, a.status
+                    FROM attendance a
+                    JOIN attendance_sessions ses ON a.session_id = ses.id
+                    WHERE a.student_id = ? AND ses.date BETWEEN ? AND ?
+                    ORDER BY ses.date, ses.period
+                ''', (rng.choice(students), first, last)).fetchall()
+
+            def session_rows(i):
+                conn.execute(
+                    'SELECT student_id, status FROM attendance WHERE session_id = ?',
+                    (rng.choice(sessions),)
+                ).fetchall()
+
+            def insert_session(i):
+                conn.execute('BEGIN')
+                session_id = conn.execute('''
+                    INSERT INTO attendance_sessions
+                    (section_id, date, period, faculty_id, subject_id, time)
+                    SELECT section_id, '2100-01-01', period, faculty_id, subject_id, time
+                    FROM attendance_sessions WHERE id = ?
+                ''', (sessions[-1],)).lastrowid
+                conn.execute('''
+                    INSERT INTO attendance (session_id, student_id, status)
+                    SELECT ?, student_id, status FROM attendance WHERE session_id = ?
+                ''', (session_id, sessions[-1]))
+                conn.execute('ROLLBACK')
+
+            def rebuild(i):
+                conn.execute('BEGIN')
+                rebuild_rollups(conn)
+                conn.execute('ROLLBACK')
+
+            cases = {
+                'student_history': (student_history, repeat),
+                'session_rows': (session_rows, repeat),
+                'insert_session': (insert_session, repeat),
+                'rebuild_rollups': (rebuild, max(1, repeat // 10)),
+            }
+            for func, _ in cases.values():
+                func(-1)
+            report[name] = {
+                'size': {
+                    'file_bytes': os.path.getsize(bench_db),
+                    'attendance_bytes': storage_bytes(conn, ['attendance'])
+                },
+                'results': {case: time_case(func, times)
+                            for case, (func, times) in cases.items()}
+            }
+            conn.close()
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare median timings against a baseline
+
+    Returns a list of (case, baseline_ms, current_ms, ratio, regressed).
+    """
+    rows = []
+    for case, result in current['results'].items():
+        if case not in baseline['results']:
+            continue
+        before = baseline['results'][case]['median_ms']
+        after = result['median_ms']
+        ratio = after / before if before else float('inf')
+        rows.append((case, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+def print_comparison(rows, threshold):
+    """Print a comparison table; returns True when anything regressed"""
+    print(f"{'case':32} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for case, before, after, ratio, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{case:32} {before:12.3f} {after:12.3f} {ratio:7.2f}{flag}")
+    regressed = [row[0] for row in rows if row[4]]
+    if regressed:
+        print(f"{len(regressed)} case(s) slower than baseline by more than {threshold:.0%}")
+    return bool(regressed)
+
+
+# ================ Multi-process Stress ================
+def stress_worker(db_file, assignments, barrier, results):
+    """Submit a share of class sessions from one process
+
+    Every worker waits at the barrier so the submissions start together.
+    Puts (marked, conflicts, failures, seconds) on the results queue.
+    """
+    app = get_app(db_file)
+    barrier.wait()
+    started = time.perf_counter()
+    marked = conflicts = failures = 0
+    for faculty, subject, period, marked_at, ht_numbers in assignments:
+        success, outcome = app.mark_attendance([{
+            'ht_number': ht_number,
+            'subject': subject,
+            'period': period,
+            'present': True
+        } for ht_number in ht_numbers], faculty, datetime.fromisoformat(marked_at))
+        if success:
+            marked += 1
+        elif outcome:
+            conflicts += 1
+        else:
+            failures += 1
+    results.put((marked, conflicts, failures, time.perf_counter() - started))
+
+def stress(processes=8, sessions_per_process=40, students_per_section=60, log=print):
+    """Submit attendance from several processes at once and count what landed
+
+    Each process marks its own class sessions, and every process also
+    races for one shared session that exactly one of them must win. Runs
+    against a fresh temporary database. Returns a summary where 'lost' is
+    the number of accepted submissions missing from the database.
+    """
+    workdir = tempfile.mkdtemp()
+    db_file = os.path.join(workdir, 'stress.db')
+    try:
+        generate(db_file, students_per_section=students_per_section, days=0, log=log)
+        conn = sqlite3.connect(db_file)
+        rosters = {}
+        for section, ht_number in conn.execute('''
+            SELECT sec.name, s.ht_number
+            FROM students s
+            JOIN sections sec ON s.manipulated_section_id = sec.id
+            ORDER BY s.ht_number
+        '''):
+            rosters.setdefault(section, []).append(ht_number)
+        faculty = [row[0] for row in conn.execute('SELECT name FROM faculty ORDER BY name')]
+        conn.close()
+
+        # One distinct (section, date, period) slot per submission, plus the contested one
+        structure = build_structure()
+        slots = ((day, section_name, subjects, period_index, period)
+                 for day in academic_days(date(2024, 7, 1), processes * sessions_per_process)
+                 for section_name, _, subjects in structure
+                 for period_index, period in enumerate(PERIOD_NAMES))
+        sessions = []
+        for day, section_name, subjects, period_index, period in islice(slots, processes * sessions_per_process + 1):
+            marked_at = datetime.combine(day, datetime.strptime(PERIOD_STARTS[period_index], '%H:%M').time())
+            sessions.append((faculty[len(sessions) % len(faculty)], subjects[0], period,
+                             marked_at.isoformat(), rosters[section_name]))
+        contested, sessions = sessions[-1], sessions[:-1]
+
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(processes)
+        results = context.Queue()
+        workers = [context.Process(
+            target=stress_worker,
+            args=(db_file, sessions[n::processes] + [contested], barrier, results)
+        ) for n in range(processes)]
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        marked = sum(outcome[0] for outcome in outcomes)
+        conn = sqlite3.connect(db_file)
+        stored_sessions = conn.execute('SELECT COUNT(*) FROM attendance_sessions').fetchone()[0]
+        stored_rows = conn.execute('SELECT COUNT(*) FROM attendance').fetchone()[0]
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        conn.close()
+        expected_rows = sum(len(session[4]) for session in sessions) + len(contested[4])
+        return {
+            'processes': processes,
+            'submissions': len(sessions) + processes,
+            'marked': marked,
+            'conflicts': sum(outcome[1] for outcome in outcomes),
+            'failures': sum(outcome[2] for outcome in outcomes),
+            'stored_sessions': stored_sessions,
+            'lost': (len(sessions) + 1 - stored_sessions) + (expected_rows - stored_rows),
+            'journal_mode': journal_mode,
+            'elapsed_s': round(max(outcome[3] for outcome in outcomes), 3)
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ================ Command Line ================
+def cmd_generate(args):
+    generate(args.db, args.sections_per_branch, args.students_per_section, args.days,
+             date.fromisoformat(args.start), args.faculty, args.seed)
+
+def cmd_run(args):
+    report = run(args.db, args.repeat)
+    for case, result in report['results'].items():
+        print(f"{case:32} median {result['median_ms']:10.3f} ms  p95 {result['p95_ms']:10.3f} ms")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            rows = compare(report, json.load(baseline), args.threshold)
+        if print_comparison(rows, args.threshold):
+            sys.exit(1)
+
+def cmd_compare(args):
+    with open(args.current) as current, open(args.baseline) as baseline:
+        rows = compare(json.load(current), json.load(baseline), args.threshold)
+    if print_comparison(rows, args.threshold):
+        sys.exit(1)
+
+def cmd_stress(args):
+    summary = stress(args.processes, args.sessions_per_process, args.students_per_section)
+    for key, value in summary.items():
+        print(f"{key:16} {value}")
+    expected_sessions = summary['submissions'] - summary['processes'] + 1
+    if (summary['lost'] or summary['failures'] or summary['marked'] != expected_sessions
+            or summary['conflicts'] != summary['processes'] - 1):
+        print("Submissions were lost or failed")
+        sys.exit(1)
+
+def cmd_layout(args):
+    report = layout(args.db, args.repeat)
+    names = sorted(report)
+    print(f"{'':24}" + ''.join(f"{name:>16}" for name in names))
+    for key in report[names[0]]['size']:
+        print(f"{key:24}" + ''.join(f"{report[name]['size'][key] or 0:>16,}" for name in names))
+    for case in report[names[0]]['results']:
+        print(f"{case + ' median ms':24}"
+              + ''.join(f"{report[name]['results'][case]['median_ms']:>16.3f}" for name in names))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help='create a synthetic database')
+    generate_parser.add_argument('--db', default='bench.db')
+    generate_parser.add_argument('--sections-per-branch', type=int, default=None)
+    generate_parser.add_argument('--students-per-section', type=int, default=60)
+    generate_parser.add_argument('--days', type=int, default=180, help='working days of attendance')
+    generate_parser.add_argument('--start', default='2024-07-01')
+    generate_parser.add_argument('--faculty', type=int, default=60)
+    generate_parser.add_argument('--seed', type=int, default=7)
+    generate_parser.set_defaults(func=cmd_generate)
+
+    run_parser = subparsers.add_parser('run', help='time the hot paths')
+    run_parser.add_argument('--db', default='bench.db')
+    run_parser.add_argument('--repeat', type=int, default=20)
+    run_parser.add_argument('--output', help='write results as JSON')
+    run_parser.add_argument('--baseline', help='flag regressions against this JSON')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    run_parser.set_defaults(func=cmd_run)
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    compare_parser.set_defaults(func=cmd_compare)
+
+    stress_parser = subparsers.add_parser('stress', help='submit from several processes at once')
+    stress_parser.add_argument('--processes', type=int, default=8)
+    stress_parser.add_argument('--sessions-per-process', type=int, default=40)
+    stress_parser.add_argument('--students-per-section', type=int, default=60)
+    stress_parser.set_defaults(func=cmd_stress)
+
+    layout_parser = subparsers.add_parser('layout', help='compare the attendance layouts')
+    layout_parser.add_argument('--db', default='bench.db')
+    layout_parser.add_argument('--repeat', type=int, default=200)
+    layout_parser.add_argument('--output', help='write results as JSON')
+    layout_parser.set_defaults(func=cmd_layout)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# bitmaps.py
+"""Bit-packed presence per marked session, for institution-wide sweeps
+
+Each session's presence is stored as one bit per student over the roster
+it was marked for, ordered by HT number as get_students_in_section lists
+them. Rosters are stored once and shared by every session marked for the
+same students. The attendance rows stay the record: rollups, reports and
+date versions all hang off them, so bitmaps are a derived copy that any
+change to a session's rows drops and sync_bitmaps() rebuilds. The
+triggers doing the dropping are installed by sync_bitmaps(), or by the
+app at start when it builds bitmaps as classes are marked, so a database
+that never uses bitmaps pays nothing for them on each write.
+
+The analytics back `python manage.py defaulters` and `attendance-trend`.
+"""
+import hashlib
+import json
+import re
+from itertools import groupby
+import numpy as np
+from reports import filter_join
+
+BITMAP_TABLES = '''
+    CREATE TABLE IF NOT EXISTS attendance_rosters (
+        id INTEGER PRIMARY KEY,
+        digest BLOB NOT NULL UNIQUE,
+        student_ids BLOB NOT NULL           -- little-endian int64, HT number order
+    );
+
+    CREATE TABLE IF NOT EXISTS attendance_bitmaps (
+        session_id INTEGER PRIMARY KEY,
+        roster_id INTEGER NOT NULL,
+        present BLOB NOT NULL,              -- bit i, most significant first, is roster student i
+        FOREIGN KEY (session_id) REFERENCES attendance_sessions(id),
+        FOREIGN KEY (roster_id) REFERENCES attendance_rosters(id)
+    );
+'''
+
+# Any write to a session's rows drops its bitmap until the next sync;
+# installed by install_triggers() once bitmaps are in use
+BITMAP_TRIGGERS = '''
+    CREATE TRIGGER IF NOT EXISTS attendance_bitmap_insert
+    AFTER INSERT ON attendance
+    BEGIN
+        DELETE FROM attendance_bitmaps WHERE session_id = NEW.session_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS attendance_bitmap_update
+    AFTER UPDATE OF session_id, student_id, status ON attendance
+    BEGIN
+        DELETE FROM attendance_bitmaps WHERE session_id IN (OLD.session_id, NEW.session_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS attendance_bitmap_delete
+    AFTER DELETE ON attendance
+    BEGIN
+        DELETE FROM attendance_bitmaps WHERE session_id = OLD.session_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS attendance_sessions_bitmap_delete
+    AFTER DELETE ON attendance_sessions
+    BEGIN
+        DELETE FROM attendance_bitmaps WHERE session_id = OLD.id;
+    END;
+'''
+
+# Sessions converted per transaction by sync_bitmaps
+SYNC_CHUNK_SESSIONS = 500
+
+
+# ================ Storage ================
+def install_triggers(conn):
+    """Create the triggers dropping stale bitmaps unless they exist"""
+    for statement in re.findall(r'CREATE TRIGGER.*?END;', BITMAP_TRIGGERS, re.S):
+        conn.execute(statement)
+
+def drop_triggers(conn):
+    """Drop the stale-bitmap triggers; only safe once no bitmaps are left"""
+    for name in re.findall(r'CREATE TRIGGER IF NOT EXISTS (\w+)', BITMAP_TRIGGERS):
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+def get_roster_id(conn, student_ids):
+    """Get the id of a stored roster, storing it first if it is new"""
+    data = np.asarray(student_ids, dtype='<i8').tobytes()
+    digest = hashlib.sha256(data).digest()
+    conn.execute('''
+        INSERT OR IGNORE INTO attendance_rosters (digest, student_ids)
+        VALUES (?, ?)
+    ''', (digest, data))
+    return conn.execute(
+        'SELECT id FROM attendance_rosters WHERE digest = ?', (digest,)
+    ).fetchone()[0]
+
+def build_bitmaps(conn, session_ids):
+    """Write the bitmaps of sessions from their attendance rows
+
+    Runs inside the caller's transaction; the triggers must already be
+    installed. Each bitmap is allocated as a zeroblob and filled through
+    incremental blob I/O. Returns the number of bitmaps written.
+    """
+    rows = conn.execute('''
+        SELECT a.session_id, a.student_id, a.status = 'P'
+        FROM attendance a
+        LEFT JOIN students s ON a.student_id = s.id
+        WHERE a.session_id IN (SELECT value FROM json_each(?))
+        ORDER BY a.session_id, s.ht_number, a.student_id
+    ''', (json.dumps(list(session_ids)),)).fetchall()
+    written = 0
+    for session_id, group in groupby(rows, key=lambda row: row[0]):
+        _, student_ids, present = zip(*group)
+        bits = np.packbits(np.array(present, dtype=bool))
+        conn.execute('''
+            INSERT OR REPLACE INTO attendance_bitmaps (session_id, roster_id, present)
+            VALUES (?, ?, zeroblob(?))
+        ''', (session_id, get_roster_id(conn, student_ids), len(bits)))
+        with conn.blobopen('attendance_bitmaps', 'present', session_id) as blob:
+            blob.write(bits.tobytes())
+        written += 1
+    return written
+
+def stale_sessions(conn, limit=None):
+    """Get ids of marked sessions without a bitmap"""
+    return [row[0] for row in conn.execute('''
+        SELECT ses.id
+        FROM attendance_sessions ses
+        WHERE NOT EXISTS (SELECT 1 FROM attendance_bitmaps b WHERE b.session_id = ses.id)
+        AND EXISTS (SELECT 1 FROM attendance a WHERE a.session_id = ses.id)
+        ORDER BY ses.id
+        LIMIT ?
+    ''', (-1 if limit is None else limit,))]
+
+def prune_rosters(conn):
+    """Drop rosters no bitmap uses any more"""
+    return conn.execute('''
+        DELETE FROM attendance_rosters
+        WHERE id NOT IN (SELECT roster_id FROM attendance_bitmaps)
+    ''').rowcount
+
+
+# ================ Loading ================
+def load_presence(conn, from_date, to_date, section_filter=None):
+    """Yield (student_ids, subject_ids, dates, bits) per roster in a date range
+
+    student_ids holds the roster, and subject_ids and dates hold one entry
+    per session. bits is the packed presence matrix, one row of bytes per
+    session. section_filter is a filter id from report_filter() over
+    section names, or None for every section.
+    """
+    join, params = filter_join(section_filter, 'sec.name')
+    rows = conn.execute(f'''
+        SELECT b.roster_id, ses.subject_id, ses.date, b.present
+        FROM attendance_sessions ses
+        JOIN attendance_bitmaps b ON b.session_id = ses.id
+        JOIN sections sec ON ses.section_id = sec.id
+        {join}
+        WHERE ses.date BETWEEN ? AND ?
+        ORDER BY b.roster_id, ses.date, ses.period
+    ''', params + [from_date, to_date]).fetchall()
+    rosters = dict(conn.execute('''
+        SELECT id, student_ids FROM attendance_rosters
+        WHERE id IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(sorted({row[0] for row in rows})),)).fetchall())
+    for roster_id, group in groupby(rows, key=lambda row: row[0]):
+        _, subject_ids, dates, presents = zip(*group)
+        student_ids = np.frombuffer(rosters[roster_id], dtype='<i8')
+        bits = np.frombuffer(b''.join(presents), dtype=np.uint8).reshape(len(presents), -1)
+        yield student_ids, np.array(subject_ids), np.array(dates), bits
+
+
+# ================ Analytics ================
+def _combine(keys, *counts):
+    """Sum count arrays over duplicate keys, or duplicate rows of 2-D keys"""
+    keys, inverse = np.unique(keys, axis=0 if keys.ndim > 1 else None, return_inverse=True)
+    inverse = inverse.ravel()
+    return (keys,) + tuple(np.bincount(inverse, weights=c, minlength=len(keys)).astype(np.int64)
+                           for c in counts)
+
+def subject_counts(conn, from_date, to_date, section_filter=None):
+    """Get (student_ids, subject_ids, present, total) per student and subject
+
+    Per roster the sessions are unpacked into a 0/1 matrix and a one-hot
+    subject matrix multiplied into it, giving every student's present
+    count per subject in one product.
+    """
+    keys, present, total = [np.empty((0, 2), np.int64)], [], []
+    for student_ids, subject_ids, _, bits in load_presence(conn, from_date, to_date, section_filter):
+        matrix = np.unpackbits(bits, axis=1, count=len(student_ids))
+        subjects, codes = np.unique(subject_ids, return_inverse=True)
+        onehot = np.zeros((len(subjects), len(codes)), dtype=np.int32)
+        onehot[codes, np.arange(len(codes))] = 1
+        present.append((onehot @ matrix).ravel())
+        total.append(np.repeat(onehot.sum(axis=1), len(student_ids)))
+        keys.append(np.column_stack([np.tile(student_ids, len(subjects)),
+                                     np.repeat(subjects, len(student_ids))]))
+    keys, present, total = _combine(np.concatenate(keys),
+                                    np.concatenate(present or [[]]),
+                                    np.concatenate(total or [[]]))
+    return keys[:, 0], keys[:, 1], present, total
+
+def student_percentages(conn, from_date, to_date, section_filter=None):
+    """Get (student_ids, present, total, percentage) over every subject
+
+    Present counts are popcounts down each student's bit column.
+    """
+    keys, present, total = [np.empty(0, np.int64)], [], []
+    for student_ids, _, _, bits in load_presence(conn, from_date, to_date, section_filter):
+        matrix = np.unpackbits(bits, axis=1, count=len(student_ids))
+        present.append(matrix.sum(axis=0))
+        total.append(np.full(len(student_ids), len(bits)))
+        keys.append(student_ids)
+    keys, present, total = _combine(np.concatenate(keys),
+                                    np.concatenate(present or [[]]),
+                                    np.concatenate(total or [[]]))
+    percentage = np.round(100 * present / np.maximum(total, 1), 2)
+    return keys, present, total, percentage
+
+def defaulters(conn, from_date, to_date, threshold=75, section_filter=None):
+    """Get (student_ids, percentage) of students below a percentage, lowest first"""
+    student_ids, _, total, percentage = student_percentages(
+        conn, from_date, to_date, section_filter)
+    below = (percentage < threshold) & (total > 0)
+    order = np.argsort(percentage[below], kind='stable')
+    return student_ids[below][order], percentage[below][order]
+
+def daily_trend(conn, from_date, to_date, student_ids=None, section_filter=None):
+    """Get (dates, present, total) per day, optionally for chosen students
+
+    Each session's bitmap is ANDed with a mask of the chosen students in
+    its roster and the result popcounted, without unpacking.
+    """
+    chosen = None if student_ids is None else np.asarray(student_ids, dtype=np.int64)
+    keys, present, total = [np.empty(0, str)], [], []
+    for roster, _, dates, bits in load_presence(conn, from_date, to_date, section_filter):
+        if chosen is None:
+            mask = np.packbits(np.ones(len(roster), dtype=bool))
+        else:
+            mask = np.packbits(np.isin(roster, chosen))
+        present.append(np.bitwise_count(bits & mask).sum(axis=1))
+        total.append(np.full(len(bits), np.bitwise_count(mask).sum()))
+        keys.append(dates.astype(str))
+    keys, present, total = _combine(np.concatenate(keys),
+                                    np.concatenate(present or [[]]),
+                                    np.concatenate(total or [[]]))
+    return keys, present, total
+
+
+# ================ Sync ================
+def sync_bitmaps(conn, chunk_sessions=SYNC_CHUNK_SESSIONS, begin=None):
+    """Install the triggers and build bitmaps for every marked session lacking one
+
+    Works in chunks; when begin is given it is called to open a
+    transaction for each chunk, which is committed before the next, so
+    writers are never held off for long. Returns the number of bitmaps
+    written.
+    """
+    written = 0
+    installed = False
+    while True:
+        if begin:
+            begin(conn)
+        try:
+            if not installed:
+                install_triggers(conn)
+                installed = True
+            session_ids = stale_sessions(conn, chunk_sessions)
+            written += build_bitmaps(conn, session_ids)
+            if not session_ids:
+                prune_rosters(conn)
+            if begin:
+                conn.execute('COMMIT')
+        except Exception:
+            if begin:
+                conn.execute('ROLLBACK')
+            raise
+        if not session_ids:
+            return written
+
+def clear_bitmaps(conn):
+    """Delete every bitmap and roster and drop the triggers
+
+    Runs inside the caller's transaction, for databases that stop using
+    bitmaps. Returns the number of bitmaps deleted.
+    """
+    deleted = conn.execute('DELETE FROM attendance_bitmaps').rowcount
+    conn.execute('DELETE FROM attendance_rosters')
+    drop_triggers(conn)
+    return deleted
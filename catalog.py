@@ -0,0 +1,65 @@
+# catalog.py
+import sqlite3
+import threading
+
+# Tables whose contents are cached as reference data
+CATALOG_TABLES = ('faculty', 'sections', 'subjects')
+
+
+class CatalogCache:
+    """In-process cache for rarely changing reference data
+
+    Entries are tagged with the catalog_versions counter of the table they
+    were loaded from; triggers bump that counter on every insert, update or
+    delete. A dedicated watch connection polls PRAGMA data_version, which
+    changes whenever any other connection, in this process or another one,
+    commits to the file. Only then are the counters re-read, so the common
+    case costs one pragma and no table reads, and a change made anywhere
+    is visible on the next lookup.
+    """
+
+    def __init__(self, db_file):
+        self._watch = sqlite3.connect(db_file, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._versions = {}
+        self._entries = {}  # key -> (table, version, value)
+
+    def _refresh_locked(self):
+        data_version = self._watch.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        self._versions = dict(self._watch.execute(
+            'SELECT name, version FROM catalog_versions'
+        ).fetchall())
+        self._entries = {
+            key: entry for key, entry in self._entries.items()
+            if self._versions.get(entry[0]) == entry[1]
+        }
+
+    def get(self, key, table, loader):
+        """Get a cached value, calling loader() when it is missing or stale"""
+        with self._lock:
+            self._refresh_locked()
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry[2]
+            # The version is taken before loading, so a change racing with
+            # the load leaves a stale tag and is evicted on the next lookup.
+            version = self._versions.get(table)
+
+        value = loader()
+        with self._lock:
+            # Skip caching if another lookup already saw a newer version
+            if self._versions.get(table) == version:
+                self._entries[key] = (table, version, value)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one cached entry, or all of them"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
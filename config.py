@@ -10,6 +10,9 @@ ADMIN_CREDENTIALS = {
     'admin': 'admin123'  # Change for production
 }
 
+# Hall ticket numbers, e.g. '21B81A0501'
+HT_NUMBER_PATTERN = r'^[0-9A-Z]{10}$'
+
 # Program structure
 SECTIONS = {
     'B.Tech': {
@@ -50,6 +53,16 @@ FACULTY = [
     ('faculty3', 'pass3')
 ]
 
+# Period timings as (start, end)
+PERIOD_TIMINGS = {
+    'P1': ('09:00', '10:00'),
+    'P2': ('10:00', '11:00'),
+    'P3': ('11:00', '12:00'),
+    'P4': ('12:00', '13:00'),
+    'P5': ('13:45', '14:45'),
+    'P6': ('14:45', '16:00')
+}
+
 # Time periods with timings
 PERIODS = {
     'P1': '09:00-10:00',
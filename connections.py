@@ -0,0 +1,200 @@
+# connections.py
+import atexit
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+# Prepared statements kept per connection by the sqlite3 module
+STATEMENT_CACHE_SIZE = 256
+
+# How long a statement waits on another connection's lock before failing
+BUSY_TIMEOUT_SECONDS = 10
+
+# Extra BEGIN IMMEDIATE attempts after the busy timeout gives up, and the
+# first backoff between them (doubled on every attempt, with jitter)
+WRITE_RETRIES = 4
+RETRY_BACKOFF_SECONDS = 0.1
+
+
+# ================ Locking and Journal ================
+def is_busy_error(error):
+    """Tell whether an OperationalError means another connection holds the lock"""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+def begin_immediate(conn, retries=WRITE_RETRIES, backoff=RETRY_BACKOFF_SECONDS):
+    """Open a write transaction, retrying with backoff while the database is busy
+
+    BEGIN IMMEDIATE takes the write lock up front, so a transaction never
+    fails halfway through on a lock upgrade. Each attempt already waits up
+    to the busy timeout; the retries cover writers from other processes
+    holding the lock for longer than that.
+    """
+    for attempt in range(retries + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if attempt == retries or not is_busy_error(e):
+                raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+def enable_wal(conn):
+    """Switch a database to write-ahead logging and return the journal mode
+
+    WAL lets readers in any process keep reading while one connection
+    writes. The mode is stored in the database file, so this only has to
+    run once, e.g. when the schema is migrated at startup. WAL needs all
+    processes on the same host; do not put the database on a network share.
+    """
+    return conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+
+def checkpoint(conn, mode='PASSIVE'):
+    """Copy committed WAL pages back into the database file
+
+    PASSIVE never waits on readers or writers and is safe at any time;
+    TRUNCATE also resets the WAL file but waits for readers to finish.
+    Returns (busy, wal_pages, checkpointed_pages).
+    """
+    if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+    return tuple(conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone())
+
+
+# ================ Connection Management ================
+def thread_owner():
+    """Own connections by the calling thread"""
+    thread = threading.current_thread()
+    return thread, thread.is_alive
+
+
+class ConnectionManager:
+    """Reused SQLite connections for one database file
+
+    Each owner gets one read-write connection (and optionally one read-only
+    connection) that is reused for the rest of its life. An owner is
+    whatever the ``owner`` callable returns for the caller: a key plus a
+    function telling whether that owner is still alive. By default this is
+    the calling thread; the app uses the Streamlit session so reruns reuse
+    the same handles. Keeping connections open is also what makes the
+    sqlite3 prepared-statement cache effective.
+
+    Connections whose owner has gone away are closed the next time anyone
+    asks for a connection and are counted as leaked, since their owner
+    never closed them.
+    """
+
+    def __init__(self, db_file, owner=thread_owner, cached_statements=STATEMENT_CACHE_SIZE):
+        self.db_file = db_file
+        self.owner = owner
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._connections = {}  # owner key -> {'alive': fn, 'rw': conn, 'ro': conn}
+        self._opened = 0
+        self._closed = 0
+        self._leaked = 0
+
+    def _connect(self, read_only):
+        if read_only:
+            target = f"file:{quote(self.db_file)}?mode=ro"
+        else:
+            target = self.db_file
+        # An owner never uses its connection from two threads at once; the
+        # flag lets a session's successive script threads share it and lets
+        # the reaper close connections left behind by dead owners.
+        conn = sqlite3.connect(
+            target,
+            uri=read_only,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        # In WAL mode NORMAL still survives application crashes; only an OS
+        # crash can lose the last commits, and it never corrupts the file
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _get(self, kind):
+        key, alive = self.owner()
+        with self._lock:
+            self._reap_locked()
+            owned = self._connections.setdefault(key, {'alive': alive})
+            conn = owned.get(kind)
+            if conn is None:
+                conn = self._connect(read_only=kind == 'ro')
+                owned[kind] = conn
+                self._opened += 1
+            return conn
+
+    def get(self):
+        """Get the caller's read-write connection"""
+        return self._get('rw')
+
+    def get_read_only(self):
+        """Get the caller's read-only connection"""
+        return self._get('ro')
+
+    def _close_owned(self, owned):
+        owned.pop('alive')
+        for conn in owned.values():
+            conn.close()
+            self._closed += 1
+        return len(owned)
+
+    def _reap_locked(self):
+        dead = [key for key, owned in self._connections.items() if not owned['alive']()]
+        for key in dead:
+            self._leaked += self._close_owned(self._connections.pop(key))
+
+    def reap(self):
+        """Close connections whose owner has gone away"""
+        with self._lock:
+            self._reap_locked()
+
+    def close(self):
+        """Close the caller's connections"""
+        key, _ = self.owner()
+        with self._lock:
+            if key in self._connections:
+                self._close_owned(self._connections.pop(key))
+
+    def close_all(self):
+        """Close every connection, regardless of owner"""
+        with self._lock:
+            for owned in self._connections.values():
+                self._close_owned(owned)
+            self._connections.clear()
+
+    def stats(self):
+        """Get handle counters for monitoring"""
+        with self._lock:
+            return {
+                'open': sum(len(owned) - 1 for owned in self._connections.values()),
+                'opened': self._opened,
+                'closed': self._closed,
+                'leaked': self._leaked
+            }
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(db_file, owner=thread_owner):
+    """Get the shared connection manager for a database file
+
+    The owner only applies when the manager is first created.
+    """
+    with _managers_lock:
+        if db_file not in _managers:
+            _managers[db_file] = ConnectionManager(db_file, owner=owner)
+        return _managers[db_file]
+
+
+@atexit.register
+def _close_managers():
+    for manager in _managers.values():
+        manager.close_all()
@@ -1,96 +1,75 @@
 # database.py
 import sqlite3
-import os
-from datetime import datetime
-from config import DB_FILE, SECTIONS, SUBJECTS, FACULTY
-
-# database.py
-import sqlite3
-import os
 from datetime import datetime
 from config import (
     DB_FILE, 
     SECTIONS, 
-    SUBJECTS, 
     FACULTY, 
     get_section_name,
     get_original_section_name,
-    get_available_sections
+    get_subjects_for_section
 )
+from connections import get_manager
+from migrations import ensure_migrated
+from utils import get_period_minutes
 
 
-# database.py
 def init_db():
-    """Initialize database with tables and sample data"""
+    """Migrate the database and add sample data to an empty one"""
     try:
-        # Check if file exists and if it's a valid SQLite database
-        if os.path.exists(DB_FILE):
-            try:
-                conn = sqlite3.connect(DB_FILE)
-                conn.close()
-            except sqlite3.DatabaseError:
-                # If file exists but is corrupted, delete it
-                os.remove(DB_FILE)
-        
-        # Create new database
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-        
-        # Read and execute schema
-        with open('schema.sql', 'r') as schema_file:
-            cur.executescript(schema_file.read())
+        ensure_migrated(DB_FILE)
         
-        # Check if faculty table is empty before inserting sample data
-        cur.execute("SELECT COUNT(*) FROM faculty")
-        if cur.fetchone()[0] == 0:
-            # Insert sample data
-            # Add faculty
-            for faculty_name, credential in FACULTY:
-                cur.execute('INSERT INTO faculty (name, credential) VALUES (?, ?)',
-                           (faculty_name, credential))
-            
-            # Add sections
-            for section in SECTIONS:
-                cur.execute('INSERT INTO sections (name) VALUES (?)', (section,))
+        with get_db() as conn:
+            cur = conn.cursor()
             
-            # Add subjects and map to sections
-            for section in SECTIONS:
-                section_subjects = SUBJECTS[section]
-                for subject in section_subjects:
-                    cur.execute('INSERT INTO subjects (name) VALUES (?)', (subject,))
-                    cur.execute('''
-                        INSERT INTO section_subjects (section_id, subject_id)
-                        SELECT s.id, sub.id
-                        FROM sections s, subjects sub
-                        WHERE s.name = ? AND sub.name = ?
-                    ''', (section, subject))
+            # Check if faculty table is empty before inserting sample data
+            cur.execute("SELECT COUNT(*) FROM faculty")
+            if cur.fetchone()[0] == 0:
+                # Add faculty
+                for faculty_name, credential in FACULTY:
+                    cur.execute('INSERT INTO faculty (name, credential) VALUES (?, ?)',
+                               (faculty_name, credential))
+                
+                for program, prog_data in SECTIONS.items():
+                    for year in prog_data['years']:
+                        for branch, branch_sections in prog_data['branches'].items():
+                            # Add subjects for this combination
+                            for subject in get_subjects_for_section(program, year, branch):
+                                cur.execute('''
+                                    INSERT INTO subjects (name, program, year, branch)
+                                    VALUES (?, ?, ?, ?)
+                                ''', (subject, program, year, branch))
+                            
+                            for section in branch_sections:
+                                section_name = get_section_name(program, year, branch, section)
+                                original_name = get_original_section_name(section_name)
+                                cur.execute('INSERT INTO sections (name, is_original) VALUES (?, 0)',
+                                           (section_name,))
+                                cur.execute('INSERT INTO sections (name, is_original) VALUES (?, 1)',
+                                           (original_name,))
+                                
+                                # Add sample students
+                                for i in range(1, 6):  # 5 students per section
+                                    cur.execute('''
+                                        INSERT INTO students
+                                        (ht_number, name, manipulated_section_id, original_section_id)
+                                        SELECT ?, ?, manip.id, orig.id
+                                        FROM sections manip, sections orig
+                                        WHERE manip.name = ? AND orig.name = ?
+                                    ''', (f'{section_name}-{i:02d}', f'Student {section_name}-{i}',
+                                          section_name, original_name))
             
-            # Add sample students
-            for section in SECTIONS:
-                for i in range(1, 6):  # 5 students per section
-                    ht_number = f'{section}-{i:02d}'
-                    name = f'Student {section}-{i}'
-                    cur.execute('''
-                        INSERT INTO students (ht_number, name, section_id)
-                        SELECT ?, ?, id FROM sections WHERE name = ?
-                    ''', (ht_number, name, section))
-        
-        conn.commit()
-        conn.close()
+            conn.commit()
         return True
         
-    except Exception as e:
+    except sqlite3.Error as e:
         print(f"Database initialization error: {e}")
-        if os.path.exists(DB_FILE):
-            os.remove(DB_FILE)
         return False
 
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get this thread's database connection"""
+    return get_manager(DB_FILE).get()
 
 # Authentication functions
 def check_credentials(username, password, is_admin=False):
@@ -130,7 +109,7 @@ def get_students(section):
         cur.execute('''
             SELECT s.id, s.ht_number, s.name
             FROM students s
-            JOIN sections sec ON s.section_id = sec.id
+            JOIN sections sec ON s.manipulated_section_id = sec.id
             WHERE sec.name = ?
             ORDER BY s.ht_number
         ''', (section,))
@@ -140,14 +119,12 @@ def check_duplicate_attendance(section, period, date):
     with get_db() as conn:
         cur = conn.cursor()
         cur.execute('''
-            SELECT f.name, sub.name, a.time
-            FROM attendance a
-            JOIN students s ON a.student_id = s.id
-            JOIN sections sec ON s.section_id = sec.id
-            JOIN faculty f ON a.faculty_id = f.id
-            JOIN subjects sub ON a.subject_id = sub.id
-            WHERE sec.name = ? AND a.period = ? AND a.date = ?
-            LIMIT 1
+            SELECT f.name, sub.name, ses.time
+            FROM attendance_sessions ses
+            JOIN sections sec ON ses.section_id = sec.id
+            JOIN faculty f ON ses.faculty_id = f.id
+            JOIN subjects sub ON ses.subject_id = sub.id
+            WHERE sec.name = ? AND ses.period = ? AND ses.date = ?
         ''', (section, period, date))
         result = cur.fetchone()
         
@@ -156,6 +133,14 @@ def check_duplicate_attendance(section, period, date):
         return False, ""
 
 def mark_attendance(attendance_data, faculty_name):
+    """Mark attendance for a class
+
+    Follows app.write_attendance: each class session is claimed before
+    its rows are written, a claim already held by another submission
+    rolls the whole submission back, and faculty workload is recorded
+    once per claimed session. Returns (success, results) with one entry
+    per submitted student.
+    """
     try:
         with get_db() as conn:
             cur = conn.cursor()
@@ -164,34 +149,85 @@ def mark_attendance(attendance_data, faculty_name):
             cur.execute('SELECT id FROM faculty WHERE name = ?', (faculty_name,))
             faculty_id = cur.fetchone()['id']
             
-            current_date = datetime.now().date().isoformat()
-            current_time = datetime.now().time().isoformat()
+            now = datetime.now()
+            current_date = now.date().isoformat()
+            current_time = now.time().isoformat()
             
+            session_ids = {}
+            attendance_rows = []
+            results = []
             for student in attendance_data:
                 # Get student and subject IDs
-                cur.execute('SELECT id FROM students WHERE ht_number = ?', (student['ht_number'],))
-                student_id = cur.fetchone()['id']
-                
-                cur.execute('SELECT id FROM subjects WHERE name = ?', (student['subject'],))
+                cur.execute(
+                    'SELECT id, manipulated_section_id FROM students WHERE ht_number = ?',
+                    (student['ht_number'],)
+                )
+                student_row = cur.fetchone()
+                cur.execute('SELECT MIN(id) AS id FROM subjects WHERE name = ?', (student['subject'],))
                 subject_id = cur.fetchone()['id']
+                if not student_row:
+                    results.append({'ht_number': student['ht_number'], 'recorded': False,
+                                    'reason': 'Unknown HT number'})
+                    continue
+                if subject_id is None:
+                    results.append({'ht_number': student['ht_number'], 'recorded': False,
+                                    'reason': f"Unknown subject {student['subject']}"})
+                    continue
                 
-                # Insert attendance record
-                cur.execute('''
-                    INSERT INTO attendance 
-                    (student_id, faculty_id, subject_id, date, time, period, status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    student_id, faculty_id, subject_id,
-                    current_date, current_time,
-                    student['period'],
-                    'P' if student['present'] else 'A'
-                ))
+                # Claim the class session; the unique (section, date, period)
+                # index refuses it when another class already holds the slot
+                section_id, period = student_row['manipulated_section_id'], student['period']
+                session = (section_id, subject_id, period)
+                if session not in session_ids:
+                    cur.execute('''
+                        INSERT INTO attendance_sessions
+                        (section_id, date, period, faculty_id, subject_id, time)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (section_id, date, period) DO NOTHING
+                    ''', (section_id, current_date, period, faculty_id, subject_id, current_time))
+                    if not cur.rowcount:
+                        conn.rollback()
+                        claim = cur.execute('''
+                            SELECT f.name, sub.name, ses.time
+                            FROM attendance_sessions ses
+                            JOIN faculty f ON ses.faculty_id = f.id
+                            JOIN subjects sub ON ses.subject_id = sub.id
+                            WHERE ses.section_id = ? AND ses.date = ? AND ses.period = ?
+                        ''', (section_id, current_date, period)).fetchone()
+                        reason = f"Attendance already marked by {claim[0]} for {claim[1]} at {claim[2]}"
+                        return False, [{'ht_number': row['ht_number'], 'recorded': False,
+                                        'reason': reason} for row in attendance_data]
+                    session_ids[session] = cur.lastrowid
+                    
+                    # Record faculty workload once per class session
+                    cur.execute('''
+                        INSERT OR IGNORE INTO faculty_workload
+                        (faculty_id, section_id, subject_id, date, time, period)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (faculty_id, section_id, subject_id, current_date, current_time, period))
+                    if cur.rowcount:
+                        cur.execute('''
+                            INSERT INTO faculty_daily_workload
+                            (faculty_id, date, classes, teaching_minutes)
+                            VALUES (?, ?, 1, ?)
+                            ON CONFLICT (faculty_id, date) DO UPDATE SET
+                                classes = classes + 1,
+                                teaching_minutes = teaching_minutes + excluded.teaching_minutes
+                        ''', (faculty_id, current_date, get_period_minutes(period)))
+                
+                attendance_rows.append((session_ids[session], student_row['id'],
+                                        'P' if student['present'] else 'A'))
+                results.append({'ht_number': student['ht_number'], 'recorded': True, 'reason': ''})
             
+            cur.executemany('''
+                INSERT INTO attendance (session_id, student_id, status)
+                VALUES (?, ?, ?)
+            ''', attendance_rows)
             conn.commit()
-            return True
+            return True, results
     except Exception as e:
         print(f"Error marking attendance: {e}")
-        return False
+        return False, []
 
 # Report generation functions
 def generate_attendance_report(from_date, to_date, sections):
@@ -208,11 +244,12 @@ def generate_attendance_report(from_date, to_date, sections):
                     COUNT(*) as total_classes,
                     SUM(CASE WHEN a.status = 'P' THEN 1 ELSE 0 END) as present_classes
                 FROM students s
-                JOIN sections sec ON s.section_id = sec.id
+                JOIN sections sec ON s.manipulated_section_id = sec.id
                 JOIN attendance a ON s.id = a.student_id
-                JOIN subjects sub ON a.subject_id = sub.id
+                JOIN attendance_sessions ses ON a.session_id = ses.id
+                JOIN subjects sub ON ses.subject_id = sub.id
                 WHERE sec.name = ?
-                AND a.date BETWEEN ? AND ?
+                AND ses.date BETWEEN ? AND ?
                 GROUP BY s.id, sub.id
             ''', (section, from_date, to_date))
             
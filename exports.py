@@ -0,0 +1,186 @@
+# exports.py
+import csv
+import gzip
+import io
+import tempfile
+import zipfile
+from itertools import groupby, islice
+from openpyxl import Workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is only offered when pyarrow is installed
+    pa = pq = None
+
+# Rows pulled from the cursor at a time
+EXPORT_CHUNK_ROWS = 5000
+
+# Exports bigger than this spill from memory to a temporary file
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+# Export format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+if pa is not None:
+    EXPORT_FORMATS['Parquet'] = ('parquet', 'application/vnd.apache.parquet')
+
+
+# ================ Row Streaming ================
+def iter_chunks(cursor, size=EXPORT_CHUNK_ROWS):
+    """Yield lists of rows from an executed cursor"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+def chunked(rows, size=EXPORT_CHUNK_ROWS):
+    """Split a row iterator into lists of at most size rows"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def get_columns(cursor):
+    """Get the column names of an executed cursor"""
+    return [description[0] for description in cursor.description]
+
+
+class PreviewCursor:
+    """Cursor wrapper keeping the first rows an export reads for a preview
+
+    Every chunk fetched through it is also handed to on_rows, so a page
+    can show a preview and figures over the whole report from the same
+    pass that writes the export.
+    """
+
+    def __init__(self, cursor, preview_rows, on_rows=None):
+        self.description = cursor.description
+        self.preview = []
+        self.rows = 0
+        self._cursor = cursor
+        self._preview_rows = preview_rows
+        self._on_rows = on_rows
+
+    def fetchmany(self, size=1):
+        rows = self._cursor.fetchmany(size)
+        room = self._preview_rows - len(self.preview)
+        if room > 0:
+            self.preview.extend(tuple(row) for row in rows[:room])
+        self.rows += len(rows)
+        if rows and self._on_rows:
+            self._on_rows(rows)
+        return rows
+
+
+# ================ Format Writers ================
+def write_csv(columns, chunks, fileobj):
+    """Write rows as UTF-8 CSV to a binary file object"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+    text.flush()
+    text.detach()
+
+def write_xlsx(columns, chunks, fileobj, sheet_title='Report'):
+    """Write rows to a write-only Excel workbook
+
+    Write-only workbooks stream rows to disk as they are appended instead
+    of building the sheet in memory.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append(columns)
+    for rows in chunks:
+        for row in rows:
+            sheet.append(tuple(row))
+    workbook.save(fileobj)
+
+def write_parquet(columns, chunks, fileobj):
+    """Write rows as Parquet, one row group per chunk"""
+    writer = None
+    for rows in chunks:
+        table = pa.Table.from_pydict({
+            column: [row[i] for row in rows] for i, column in enumerate(columns)
+        })
+        if writer is None:
+            writer = pq.ParquetWriter(fileobj, table.schema)
+        writer.write_table(table.cast(writer.schema))
+    if writer is None:
+        writer = pq.ParquetWriter(fileobj, pa.schema([(column, pa.string()) for column in columns]))
+    writer.close()
+
+def write_rows(export_format, columns, chunks, fileobj):
+    """Write rows in one of EXPORT_FORMATS to a binary file object"""
+    if export_format == 'CSV':
+        write_csv(columns, chunks, fileobj)
+    elif export_format == 'CSV (gzip)':
+        with gzip.GzipFile(fileobj=fileobj, mode='wb') as compressed:
+            write_csv(columns, chunks, compressed)
+    elif export_format == 'Excel':
+        write_xlsx(columns, chunks, fileobj)
+    elif export_format == 'Parquet' and pa is not None:
+        write_parquet(columns, chunks, fileobj)
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+
+# ================ Exports ================
+def write_cursor(cursor, export_format, fileobj, group_column=None):
+    """Stream an executed cursor into a binary file object
+
+    With group_column set, rows (ordered by that column, e.g. the section
+    name) go into a zip with one file per group, each group written
+    straight into its zip entry as the cursor advances. Returns the number
+    of rows written.
+    """
+    columns = get_columns(cursor)
+    written = 0
+
+    def counted(chunks):
+        nonlocal written
+        for rows in chunks:
+            written += len(rows)
+            yield rows
+
+    if group_column is None:
+        write_rows(export_format, columns, counted(iter_chunks(cursor)), fileobj)
+        return written
+
+    key_index = columns.index(group_column)
+    extension = EXPORT_FORMATS[export_format][0]
+    rows = (row for chunk in counted(iter_chunks(cursor)) for row in chunk)
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        for key, group in groupby(rows, key=lambda row: row[key_index]):
+            with bundle.open(f"{key}.{extension}", 'w') as entry:
+                write_rows(export_format, columns, chunked(group), entry)
+    return written
+
+def export_cursor(cursor, export_format):
+    """Stream an executed cursor into a single export file
+
+    Returns a file object positioned at the start, ready to be handed to
+    st.download_button.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    write_cursor(cursor, export_format, output)
+    output.seek(0)
+    return output
+
+def export_bundle(cursor, export_format, group_column):
+    """Stream an executed cursor into a zip with one file per group
+
+    Rows must be ordered by group_column, e.g. the section name.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    write_cursor(cursor, export_format, output, group_column)
+    output.seek(0)
+    return output
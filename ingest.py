@@ -0,0 +1,147 @@
+# ingest.py
+import io
+import multiprocessing
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
+from config import HT_NUMBER_PATTERN, get_original_section_name
+from connections import begin_immediate
+
+# Students written per transaction
+INGEST_CHUNK_ROWS = 1000
+
+# Accepted header spellings for each roster column
+ROSTER_COLUMNS = {
+    'ht_number': ('ht number', 'ht no', 'hall ticket number', 'ht_number'),
+    'name': ('name', 'student name', 'student_name'),
+    'section': ('section', 'manipulated section'),
+    'original_section': ('original section', 'original_section'),
+}
+REQUIRED_COLUMNS = ('ht_number', 'name', 'section')
+
+
+# ================ Parsing ================
+def _clean(value):
+    return '' if value is None else str(value).strip()
+
+def parse_roster(fileobj):
+    """Stream a roster workbook into column lists
+
+    The active sheet is read in openpyxl read-only mode, so rows are parsed
+    as they are streamed instead of loading the whole workbook. Returns
+    {column: [values]} with one entry per data row.
+    """
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_clean(value).lower() for value in next(rows, ())]
+        positions = {}
+        for column, spellings in ROSTER_COLUMNS.items():
+            for i, title in enumerate(header):
+                if title in spellings:
+                    positions[column] = i
+                    break
+        missing = [column for column in REQUIRED_COLUMNS if column not in positions]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+        columns = {column: [] for column in positions}
+        for row in rows:
+            if not any(row):
+                continue
+            for column, i in positions.items():
+                columns[column].append(_clean(row[i]) if i < len(row) else '')
+        return columns
+    finally:
+        workbook.close()
+
+def parse_roster_bytes(data):
+    """Parse a roster from raw file contents (picklable for worker processes)"""
+    return parse_roster(io.BytesIO(data))
+
+def parse_rosters(files):
+    """Parse several roster files, in parallel when there is more than one
+
+    Takes a list of raw file contents and returns the parsed columns in the
+    same order. Workers are spawned rather than forked, as this runs inside
+    the multithreaded Streamlit server.
+    """
+    if len(files) < 2:
+        return [parse_roster_bytes(data) for data in files]
+    with ProcessPoolExecutor(max_workers=len(files),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(parse_roster_bytes, files))
+
+
+# ================ Validation ================
+def validate_roster(columns, section_ids):
+    """Check a parsed roster column by column
+
+    Returns (rows, errors): rows are ready-to-write tuples of
+    (ht_number, name, manipulated_section_id, original_section_id) and
+    errors are (row_number, ht_number, message) with row numbers as shown
+    in the sheet.
+    """
+    ht_numbers = [value.upper() for value in columns['ht_number']]
+    names = columns['name']
+    sections = columns['section']
+    originals = columns.get('original_section') or [''] * len(ht_numbers)
+    originals = [original or get_original_section_name(section)
+                 for section, original in zip(sections, originals)]
+
+    pattern = re.compile(HT_NUMBER_PATTERN)
+    bad_format = [not pattern.match(value) for value in ht_numbers]
+    counts = Counter(ht_numbers)
+    duplicated = [counts[value] > 1 for value in ht_numbers]
+    missing_name = [not value for value in names]
+    unknown_sections = (set(sections) | set(originals)) - set(section_ids)
+
+    rows = []
+    errors = []
+    for i, ht_number in enumerate(ht_numbers):
+        problems = []
+        if bad_format[i]:
+            problems.append("invalid HT number")
+        if duplicated[i]:
+            problems.append("duplicate HT number in upload")
+        if missing_name[i]:
+            problems.append("missing name")
+        if sections[i] in unknown_sections:
+            problems.append(f"unknown section {sections[i]}")
+        if originals[i] in unknown_sections:
+            problems.append(f"unknown original section {originals[i]}")
+
+        if problems:
+            errors.append((i + 2, ht_number, ', '.join(problems)))
+        else:
+            rows.append((ht_number, names[i], section_ids[sections[i]], section_ids[originals[i]]))
+    return rows, errors
+
+
+# ================ Writing ================
+def load_section_ids(conn):
+    """Get a name -> id map of every section"""
+    return {name: section_id for section_id, name in conn.execute('SELECT id, name FROM sections')}
+
+def upsert_students(conn, rows, progress=None):
+    """Insert or update students in chunked transactions
+
+    Existing HT numbers get their name and sections updated. progress, if
+    given, is called with (written, total) after every chunk.
+    """
+    total = len(rows)
+    for start in range(0, total, INGEST_CHUNK_ROWS):
+        begin_immediate(conn)
+        with conn:
+            conn.executemany('''
+                INSERT INTO students (ht_number, name, manipulated_section_id, original_section_id)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (ht_number) DO UPDATE SET
+                    name = excluded.name,
+                    manipulated_section_id = excluded.manipulated_section_id,
+                    original_section_id = excluded.original_section_id
+            ''', rows[start:start + INGEST_CHUNK_ROWS])
+        if progress:
+            progress(min(start + INGEST_CHUNK_ROWS, total), total)
+    return total
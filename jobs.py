@@ -0,0 +1,383 @@
+# jobs.py
+import atexit
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import quote
+from archive import attach_archives
+from connections import BUSY_TIMEOUT_SECONDS
+from exports import EXPORT_FORMATS, write_cursor
+from query_guard import QueryGuard
+from reports import faculty_workload_query, report_filter, student_statistics_query
+
+# Directory finished report files are stored in
+JOB_DIR = 'report_jobs'
+
+# Worker processes per runner; each job runs in its own process
+JOB_WORKERS = os.cpu_count() or 1
+
+# How often runners look for jobs queued by other server processes
+JOB_POLL_SECONDS = 1.0
+
+# Longest a background report may run before it is stopped
+JOB_TIME_BUDGET_SECONDS = 30 * 60
+
+# Finished jobs and their files are removed after this long
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+# Queued and running jobs, still waiting on a runner
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+REPORT_JOBS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS report_jobs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL,
+        submitted_by TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        runner_pid INTEGER,
+        file_name TEXT,
+        rows INTEGER,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_report_jobs_status
+        ON report_jobs (status, id);
+
+    CREATE INDEX IF NOT EXISTS idx_report_jobs_submitted_by
+        ON report_jobs (submitted_by, kind, id);
+'''
+
+# Report kind -> (download file stem, query builder)
+REPORT_JOBS = {
+    'student_statistics': ('attendance_report', student_statistics_query),
+    'faculty_workload': ('faculty_workload', faculty_workload_query),
+}
+
+
+# ================ Job Records ================
+def submit_job(conn, kind, params, submitted_by):
+    """Queue a report job and return its id
+
+    params holds selection (None for everything), from_date, to_date,
+    export_format and group_column.
+    """
+    if kind not in REPORT_JOBS:
+        raise ValueError(f"Unknown report kind: {kind}")
+    cur = conn.execute(
+        'INSERT INTO report_jobs (kind, params, submitted_by) VALUES (?, ?, ?)',
+        (kind, json.dumps(params), submitted_by)
+    )
+    return cur.lastrowid
+
+def cancel_job(conn, job_id):
+    """Cancel a queued or running job; returns True if it was still active"""
+    placeholders = ','.join(['?'] * len(ACTIVE_JOB_STATUSES))
+    cur = conn.execute(f'''
+        UPDATE report_jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status IN ({placeholders})
+    ''', (job_id, *ACTIVE_JOB_STATUSES))
+    return cur.rowcount > 0
+
+def list_jobs(conn, submitted_by, kind, limit=20):
+    """Get someone's most recent jobs of one kind, newest first"""
+    cur = conn.execute('''
+        SELECT id, kind, params, status, file_name, rows, error,
+               created_at, started_at, finished_at
+        FROM report_jobs
+        WHERE submitted_by = ? AND kind = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (submitted_by, kind, limit))
+    columns = [description[0] for description in cur.description]
+    jobs = [dict(zip(columns, row)) for row in cur.fetchall()]
+    for job in jobs:
+        job['params'] = json.loads(job['params'])
+    return jobs
+
+def job_download_name(job):
+    """Get the file name a finished job is offered for download as"""
+    file_stem = REPORT_JOBS[job['kind']][0]
+    return f"{file_stem}{os.path.splitext(job['file_name'])[1]}"
+
+
+# ================ Worker Processes ================
+class JobCancelled:
+    """Cancel flag for QueryGuard that reads the job's status
+
+    The job counts as cancelled once it is no longer running under the
+    runner that claimed it: cancelled by its owner, or handed back to the
+    queue by a runner shutting down. The guard's progress handler runs
+    inside the report query, so the status is read on a connection of its
+    own, at most once a second.
+    """
+
+    def __init__(self, db_file, job_id, runner_pid):
+        self.job_id = job_id
+        self.runner_pid = runner_pid
+        self._conn = sqlite3.connect(
+            f"file:{quote(db_file)}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_SECONDS
+        )
+        self._checked_at = 0.0
+        self._cancelled = False
+
+    def is_set(self):
+        if not self._cancelled and time.monotonic() - self._checked_at >= 1.0:
+            self._checked_at = time.monotonic()
+            row = self._conn.execute(
+                'SELECT status, runner_pid FROM report_jobs WHERE id = ?', (self.job_id,)
+            ).fetchone()
+            self._cancelled = row is None or tuple(row) != ('running', self.runner_pid)
+        return self._cancelled
+
+    def close(self):
+        self._conn.close()
+
+def run_report_job(db_file, job_dir, job_id, kind, params, runner_pid):
+    """Write one job's report file; runs in a worker process
+
+    The file is written under a temporary name and renamed once complete,
+    so a file that exists is always whole. Returns (file name, rows).
+    """
+    build_query = REPORT_JOBS[kind][1]
+    export_format = params['export_format']
+    group_column = params.get('group_column')
+    extension = 'zip' if group_column else EXPORT_FORMATS[export_format][0]
+    # Named per worker process, so an attempt that is still winding down
+    # after its job was requeued never touches the next attempt's file
+    file_name = f"{job_id}-{os.getpid()}.{extension}"
+    path = os.path.join(job_dir, file_name)
+    partial = f"{path}.part"
+
+    conn = sqlite3.connect(f"file:{quote(db_file)}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_SECONDS)
+    cancelled = JobCancelled(db_file, job_id, runner_pid)
+    try:
+        with report_filter(conn, params['selection']) as selected:
+            archives = attach_archives(conn, params['from_date'], params['to_date'])
+            query, query_params = build_query(selected, params['from_date'], params['to_date'], archives)
+            with (open(partial, 'wb') as output,
+                  QueryGuard(conn, JOB_TIME_BUDGET_SECONDS, cancel_event=cancelled)):
+                rows = write_cursor(conn.execute(query, query_params), export_format, output, group_column)
+        os.replace(partial, path)
+        return file_name, rows
+    finally:
+        cancelled.close()
+        conn.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+# ================ Runner ================
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobRunner:
+    """Claims queued report jobs and runs them in a pool of processes
+
+    Any number of server processes can run a runner against the same
+    database: a job is claimed by a single UPDATE, so exactly one runner
+    gets it. Each runner keeps at most `workers` jobs in flight, each in a
+    separate process, so large reports run in parallel across cores.
+    Workers only read the database and write files; the runner records
+    every outcome. A runner that stops hands its running jobs back to the
+    queue, which also stops their workers, and jobs left running by a
+    runner that died are requeued when a runner starts.
+    """
+
+    def __init__(self, db_file, job_dir=JOB_DIR, workers=JOB_WORKERS):
+        self.db_file = db_file
+        self.job_dir = job_dir
+        self.workers = workers
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+        self._running = {}
+        self._purged_at = 0.0
+        self._completed = 0
+        self._failed = 0
+
+    def start(self):
+        """Run the runner on a background thread"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self.serve, name='report-jobs', daemon=True)
+                self._thread.start()
+        return self
+
+    def wake(self):
+        """Look for queued jobs now instead of at the next poll"""
+        self._wake.set()
+
+    def serve(self):
+        """Run jobs until stop() is called"""
+        os.makedirs(self.job_dir, exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_file, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False
+        )
+        try:
+            self._recover(conn)
+            while not self._stopping.is_set():
+                try:
+                    self._dispatch(conn)
+                    self._purge(conn)
+                except sqlite3.Error as e:
+                    print(f"Report job runner error: {e}")
+                    time.sleep(JOB_POLL_SECONDS)
+        finally:
+            self._requeue(conn, self._running.values())
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+            self._collect(conn, list(self._running))
+            conn.close()
+
+    def _requeue(self, conn, job_ids):
+        conn.executemany('''
+            UPDATE report_jobs SET status = 'queued', runner_pid = NULL, started_at = NULL
+            WHERE id = ? AND status = 'running'
+        ''', ((job_id,) for job_id in list(job_ids)))
+
+    def _recover(self, conn):
+        self._requeue(conn, [
+            job_id for job_id, pid in conn.execute(
+                "SELECT id, runner_pid FROM report_jobs WHERE status = 'running'"
+            ).fetchall()
+            if pid == os.getpid() or not _pid_alive(pid)
+        ])
+
+    def _claim(self, conn):
+        rows = conn.execute('''
+            UPDATE report_jobs
+            SET status = 'running', runner_pid = ?, started_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM report_jobs WHERE status = 'queued' ORDER BY id LIMIT 1
+            )
+            RETURNING id, kind, params
+        ''', (os.getpid(),)).fetchall()
+        return rows[0] if rows else None
+
+    def _dispatch(self, conn):
+        while len(self._running) < self.workers:
+            job = self._claim(conn)
+            if job is None:
+                break
+            job_id, kind, params = job
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            future = self._pool.submit(
+                run_report_job, self.db_file, self.job_dir, job_id, kind, json.loads(params),
+                os.getpid()
+            )
+            self._running[future] = job_id
+
+        if self._running:
+            done, _ = wait(list(self._running), timeout=JOB_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            self._collect(conn, done)
+        else:
+            self._wake.wait(JOB_POLL_SECONDS)
+            self._wake.clear()
+
+    def _collect(self, conn, futures):
+        broken = False
+        for future in futures:
+            job_id = self._running.pop(future)
+            try:
+                file_name, rows = future.result()
+            except Exception as e:
+                broken = broken or isinstance(e, BrokenProcessPool)
+                # Jobs cancelled or requeued meanwhile keep their new status
+                cur = conn.execute('''
+                    UPDATE report_jobs
+                    SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'running'
+                ''', (str(e) or type(e).__name__, job_id))
+                self._failed += cur.rowcount
+                continue
+            cur = conn.execute('''
+                UPDATE report_jobs
+                SET status = 'done', file_name = ?, rows = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'running'
+            ''', (file_name, rows, job_id))
+            if cur.rowcount:
+                self._completed += 1
+            else:
+                self._remove_file(file_name)
+        if broken and self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _remove_file(self, file_name):
+        try:
+            os.remove(os.path.join(self.job_dir, file_name))
+        except FileNotFoundError:
+            pass
+
+    def _purge(self, conn):
+        if time.monotonic() - self._purged_at < 3600:
+            return
+        self._purged_at = time.monotonic()
+        placeholders = ','.join(['?'] * len(ACTIVE_JOB_STATUSES))
+        expired = conn.execute(f'''
+            SELECT id, file_name FROM report_jobs
+            WHERE status NOT IN ({placeholders})
+            AND finished_at < datetime('now', ?)
+        ''', (*ACTIVE_JOB_STATUSES, f'-{JOB_RETENTION_SECONDS} seconds')).fetchall()
+        for job_id, file_name in expired:
+            if file_name:
+                self._remove_file(file_name)
+            conn.execute('DELETE FROM report_jobs WHERE id = ?', (job_id,))
+
+    def stop(self, timeout=None):
+        """Stop the runner, handing its running jobs back to the queue"""
+        with self._lock:
+            thread = self._thread
+        self._stopping.set()
+        self._wake.set()
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+
+    def stats(self):
+        """Get job counters for monitoring"""
+        return {
+            'running': len(self._running),
+            'completed': self._completed,
+            'failed': self._failed
+        }
+
+
+_runners = {}
+_runners_lock = threading.Lock()
+
+
+def get_runner(db_file, job_dir=JOB_DIR, workers=JOB_WORKERS):
+    """Get this process's started runner for a database file"""
+    with _runners_lock:
+        if db_file not in _runners:
+            _runners[db_file] = JobRunner(db_file, job_dir, workers).start()
+        return _runners[db_file]
+
+
+@atexit.register
+def _stop_runners():
+    for runner in _runners.values():
+        runner.stop(timeout=5)
@@ -0,0 +1,302 @@
+# manage.py
+"""Maintenance commands for the attendance database
+
+Usage: python manage.py <command> [--db attendance.db]
+"""
+import argparse
+import json
+import sqlite3
+import time
+import numpy as np
+from config import DB_FILE
+from connections import BUSY_TIMEOUT_SECONDS, begin_immediate, checkpoint
+from archive import ARCHIVE_DIR, add_term, archive_term, list_terms
+from bitmaps import clear_bitmaps, daily_trend, defaulters, subject_counts, sync_bitmaps
+from mirror import MIRROR_DIR, AttendanceMirror
+from migrations import ATTENDANCE_LAYOUTS, get_attendance_layout, migrate, set_attendance_layout
+from reports import report_filter
+from rollups import rebuild_rollups
+from jobs import JOB_DIR, JOB_WORKERS, JobRunner
+from ingest import load_section_ids, parse_rosters, upsert_students, validate_roster
+
+
+def cmd_migrate(args):
+    """Apply pending schema migrations"""
+    print(f"Schema version: {migrate(args.db)}")
+
+def cmd_rebuild_rollups(args):
+    """Recompute attendance rollups from the raw attendance rows"""
+    migrate(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        begin_immediate(conn)
+        rebuild_rollups(conn)
+        conn.execute('COMMIT')
+        count = conn.execute('SELECT COUNT(*) FROM attendance_daily_rollup').fetchone()[0]
+        print(f"Rebuilt {count} rollup buckets")
+    finally:
+        conn.close()
+
+def cmd_ingest(args):
+    """Load student rosters from Excel files"""
+    migrate(args.db)
+    files = []
+    for path in args.files:
+        with open(path, 'rb') as roster_file:
+            files.append(roster_file.read())
+    
+    conn = sqlite3.connect(args.db, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        section_ids = load_section_ids(conn)
+        for path, columns in zip(args.files, parse_rosters(files)):
+            rows, errors = validate_roster(columns, section_ids)
+            for row_number, ht_number, message in errors:
+                print(f"{path}:{row_number}: {ht_number}: {message}")
+            upsert_students(conn, rows)
+            print(f"{path}: loaded {len(rows)} students, rejected {len(errors)}")
+    finally:
+        conn.close()
+
+def cmd_checkpoint(args):
+    """Checkpoint the write-ahead log into the database file"""
+    conn = sqlite3.connect(args.db, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        busy, wal_pages, checkpointed = checkpoint(conn, args.mode)
+        if wal_pages < 0:
+            print("Database is not in WAL mode; run the migrate command first")
+            return
+        print(f"WAL pages: {wal_pages}, checkpointed: {checkpointed}"
+              + (" (blocked by active readers or writers)" if busy else ""))
+    finally:
+        conn.close()
+
+def cmd_build_bitmaps(args):
+    """Build presence bitmaps for every marked session lacking one"""
+    migrate(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        if args.drop:
+            begin_immediate(conn)
+            deleted = clear_bitmaps(conn)
+            conn.execute('COMMIT')
+            print(f"Deleted {deleted} bitmaps; attendance writes no longer maintain them")
+            return
+        started = time.perf_counter()
+        written = sync_bitmaps(conn, begin=begin_immediate)
+        print(f"Built {written} bitmaps in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+def get_student_names(conn, student_ids):
+    """Get {student id: (ht_number, name)} for chosen students"""
+    return {row[0]: row[1:] for row in conn.execute('''
+        SELECT id, ht_number, name FROM students
+        WHERE id IN (SELECT value FROM json_each(?))
+    ''', (json.dumps([int(student_id) for student_id in student_ids]),))}
+
+def warn_archived(conn, from_date, to_date):
+    """Print the archived terms a date range overlaps, as bitmaps miss them"""
+    for _, name, start, end, _, archived_at, _ in list_terms(conn):
+        if archived_at and start <= to_date and end >= from_date:
+            print(f"Term {name} is archived; its attendance is not counted")
+
+def cmd_defaulters(args):
+    """List students below an attendance percentage, from the bitmaps"""
+    migrate(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        sync_bitmaps(conn, begin=begin_immediate)
+        warn_archived(conn, args.from_date, args.to_date)
+        with report_filter(conn, args.section) as section_filter:
+            if args.by_subject:
+                student_ids, subject_ids, present, total = subject_counts(
+                    conn, args.from_date, args.to_date, section_filter)
+                percentage = np.round(100 * present / np.maximum(total, 1), 2)
+                below = (percentage < args.threshold) & (total > 0)
+                subjects = dict(conn.execute('SELECT id, name FROM subjects'))
+                rows = [(student_id, f"{subjects[subject_id]}: ", value) for student_id, subject_id, value
+                        in zip(student_ids[below], subject_ids[below], percentage[below])]
+            else:
+                student_ids, percentage = defaulters(
+                    conn, args.from_date, args.to_date, args.threshold, section_filter)
+                rows = [(student_id, '', value) for student_id, value in zip(student_ids, percentage)]
+        names = get_student_names(conn, [row[0] for row in rows])
+        for student_id, subject, value in rows:
+            ht_number, name = names[student_id]
+            print(f"{ht_number:12} {name:30} {subject}{value:.2f}%")
+        print(f"{len(rows)} below {args.threshold:g}%")
+    finally:
+        conn.close()
+
+def cmd_attendance_trend(args):
+    """Print attendance per day, from the bitmaps"""
+    migrate(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        sync_bitmaps(conn, begin=begin_immediate)
+        warn_archived(conn, args.from_date, args.to_date)
+        student_ids = None
+        if args.student:
+            student_ids = [row[0] for row in conn.execute('''
+                SELECT id FROM students WHERE ht_number IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(args.student),))]
+        with report_filter(conn, args.section) as section_filter:
+            dates, present, total = daily_trend(
+                conn, args.from_date, args.to_date, student_ids, section_filter)
+        for day, day_present, day_total in zip(dates, present, total):
+            print(f"{day}  {day_present:6} of {day_total:<6} "
+                  f"{100 * day_present / max(day_total, 1):6.2f}%")
+    finally:
+        conn.close()
+
+def cmd_attendance_layout(args):
+    """Rebuild the attendance rows in another physical layout"""
+    migrate(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        if args.layout is None:
+            print(f"Attendance layout: {get_attendance_layout(conn)}")
+            return
+        started = time.perf_counter()
+        begin_immediate(conn)
+        try:
+            changed = set_attendance_layout(conn, args.layout)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if changed:
+            print(f"Rebuilt attendance as {args.layout} in {time.perf_counter() - started:.1f}s; "
+                  f"run VACUUM to return the freed pages")
+        else:
+            print(f"Attendance already uses the {args.layout} layout")
+    finally:
+        conn.close()
+
+def cmd_add_term(args):
+    """Record an academic term"""
+    migrate(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        success, message = add_term(conn, args.name, args.start, args.end)
+        print(message)
+    finally:
+        conn.close()
+    if not success:
+        raise SystemExit(1)
+
+def cmd_terms(args):
+    """List academic terms and where their attendance lives"""
+    migrate(args.db)
+    conn = sqlite3.connect(args.db, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        for _, name, start, end, archive_file, archived_at, purged_at in list_terms(conn):
+            if purged_at:
+                where = f"archived in {archive_file}"
+            elif archived_at:
+                where = f"archived in {archive_file}, hot copies not yet deleted"
+            else:
+                where = "hot"
+            print(f"{name:16} {start} to {end}  {where}")
+    finally:
+        conn.close()
+
+def cmd_archive_term(args):
+    """Move a closed term's attendance into its own archive file"""
+    migrate(args.db)
+    success, message = archive_term(args.db, args.name, args.archive_dir)
+    print(message)
+    if not success:
+        raise SystemExit(1)
+
+def cmd_refresh_mirror(args):
+    """Bring the analytics mirror's column files up to date"""
+    migrate(args.db)
+    mirror = AttendanceMirror(args.db, args.mirror_dir)
+    try:
+        started = time.perf_counter()
+        written = mirror.refresh()
+        print(f"Wrote {written} rows in {time.perf_counter() - started:.1f}s; "
+              f"{mirror.stats()['rows']} mirrored")
+    finally:
+        mirror.close()
+
+def cmd_run_jobs(args):
+    """Run queued background reports until interrupted"""
+    migrate(args.db)
+    runner = JobRunner(args.db, args.job_dir, args.workers)
+    print(f"Running report jobs with {args.workers} workers; Ctrl+C to stop")
+    runner.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        runner.stop()
+        stats = runner.stats()
+        print(f"Stopped: {stats['completed']} completed, {stats['failed']} failed")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=DB_FILE, help='database file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    subparsers.add_parser('migrate', help=cmd_migrate.__doc__).set_defaults(func=cmd_migrate)
+    subparsers.add_parser(
+        'rebuild-rollups', help=cmd_rebuild_rollups.__doc__
+    ).set_defaults(func=cmd_rebuild_rollups)
+    ingest_parser = subparsers.add_parser('ingest', help=cmd_ingest.__doc__)
+    ingest_parser.add_argument('files', nargs='+', help='roster .xlsx files')
+    ingest_parser.set_defaults(func=cmd_ingest)
+    checkpoint_parser = subparsers.add_parser('checkpoint', help=cmd_checkpoint.__doc__)
+    checkpoint_parser.add_argument(
+        '--mode', default='PASSIVE', choices=['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'],
+        help='TRUNCATE also shrinks the WAL file but waits for readers'
+    )
+    checkpoint_parser.set_defaults(func=cmd_checkpoint)
+    bitmaps_parser = subparsers.add_parser('build-bitmaps', help=cmd_build_bitmaps.__doc__)
+    bitmaps_parser.add_argument(
+        '--drop', action='store_true',
+        help='delete every bitmap instead, so attendance writes stop maintaining them'
+    )
+    bitmaps_parser.set_defaults(func=cmd_build_bitmaps)
+    defaulters_parser = subparsers.add_parser('defaulters', help=cmd_defaulters.__doc__)
+    trend_parser = subparsers.add_parser('attendance-trend', help=cmd_attendance_trend.__doc__)
+    for sweep_parser in (defaulters_parser, trend_parser):
+        sweep_parser.add_argument('from_date', help='first day, YYYY-MM-DD')
+        sweep_parser.add_argument('to_date', help='last day, YYYY-MM-DD')
+        sweep_parser.add_argument('--section', action='append', help='section name; repeat for more')
+    defaulters_parser.add_argument('--threshold', type=float, default=75, help='percentage')
+    defaulters_parser.add_argument('--by-subject', action='store_true', help='one row per subject')
+    defaulters_parser.set_defaults(func=cmd_defaulters)
+    trend_parser.add_argument('--student', action='append', help='HT number; repeat for more')
+    trend_parser.set_defaults(func=cmd_attendance_trend)
+    layout_parser = subparsers.add_parser('attendance-layout', help=cmd_attendance_layout.__doc__)
+    layout_parser.add_argument(
+        'layout', nargs='?', choices=sorted(ATTENDANCE_LAYOUTS),
+        help='compact clusters rows per student; omit to show the current layout'
+    )
+    layout_parser.set_defaults(func=cmd_attendance_layout)
+    term_parser = subparsers.add_parser('add-term', help=cmd_add_term.__doc__)
+    term_parser.add_argument('name')
+    term_parser.add_argument('start', help='first day, YYYY-MM-DD')
+    term_parser.add_argument('end', help='last day, YYYY-MM-DD')
+    term_parser.set_defaults(func=cmd_add_term)
+    subparsers.add_parser('terms', help=cmd_terms.__doc__).set_defaults(func=cmd_terms)
+    archive_parser = subparsers.add_parser('archive-term', help=cmd_archive_term.__doc__)
+    archive_parser.add_argument('name')
+    archive_parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    archive_parser.set_defaults(func=cmd_archive_term)
+    mirror_parser = subparsers.add_parser('refresh-mirror', help=cmd_refresh_mirror.__doc__)
+    mirror_parser.add_argument('--mirror-dir', default=MIRROR_DIR)
+    mirror_parser.set_defaults(func=cmd_refresh_mirror)
+    jobs_parser = subparsers.add_parser('run-jobs', help=cmd_run_jobs.__doc__)
+    jobs_parser.add_argument('--job-dir', default=JOB_DIR, help='directory for report files')
+    jobs_parser.add_argument('--workers', type=int, default=JOB_WORKERS, help='worker processes')
+    jobs_parser.set_defaults(func=cmd_run_jobs)
+    
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,578 @@
+# migrations.py
+import os
+import re
+import sqlite3
+import threading
+from archive import TERM_TABLES
+from bitmaps import BITMAP_TABLES, BITMAP_TRIGGERS, drop_triggers
+from catalog import CATALOG_TABLES
+from connections import BUSY_TIMEOUT_SECONDS, begin_immediate, enable_wal
+from config import PERIOD_TIMINGS
+from jobs import REPORT_JOBS_TABLE
+from mirror import ATTENDANCE_EDITS_TABLE, ATTENDANCE_EDITS_TRIGGERS
+from report_cache import DATE_VERSION_TABLE, DATE_VERSION_TRIGGERS, date_version_triggers
+from rollups import ROLLUP_TABLE, ROLLUP_TRIGGERS, rebuild_rollups
+from utils import get_period_minutes
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+
+# ================ Script Helpers ================
+def execute_script(conn, script):
+    """Run a multi-statement script inside the caller's transaction
+
+    Connection.executescript() commits any open transaction first, so
+    migrations split their scripts into complete statements and run them
+    one at a time instead.
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        conn.execute(statement)
+
+def get_columns(conn, table):
+    """Get the column names of a table"""
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+# ================ Migrations ================
+def baseline_schema(conn):
+    """Create the baseline tables from schema.sql"""
+    with open(SCHEMA_FILE, 'r') as schema_file:
+        execute_script(conn, schema_file.read())
+
+def add_created_at_columns(conn):
+    """Add created_at to tables of databases built from the old schema.sql
+
+    That schema left created_at off attendance and faculty_workload, while
+    the app's inline DDL had it.
+    """
+    for table in ('attendance', 'faculty_workload'):
+        if 'created_at' not in get_columns(conn, table):
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN created_at TIMESTAMP')
+
+def compact_faculty_workload(conn):
+    """Collapse per-student workload rows into one row per class session
+
+    Older versions recorded a faculty_workload row for every student
+    marked. Those rows are grouped into one per (faculty, section,
+    subject, date, period) and the per-day counters are filled in.
+    Databases that already have the counters table were created
+    compacted and are left alone.
+
+    The old rows hold each student's original section and keep it, so
+    history does not follow students moved since. Rows written from now
+    on hold the manipulated section the class was marked for, one per
+    class. A class of students from several original sections keeps a
+    row per section, so the counters count distinct periods, as the old
+    report did.
+    """
+    if conn.execute('''
+        SELECT 1 FROM sqlite_master
+        WHERE type = 'table' AND name = 'faculty_daily_workload'
+    ''').fetchone():
+        return
+
+    execute_script(conn, '''
+        CREATE TABLE faculty_workload_new (
+            id INTEGER PRIMARY KEY,
+            faculty_id INTEGER,
+            section_id INTEGER,
+            subject_id INTEGER,
+            date DATE NOT NULL,
+            time TIME NOT NULL,
+            period TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (faculty_id) REFERENCES faculty(id),
+            FOREIGN KEY (section_id) REFERENCES sections(id),
+            FOREIGN KEY (subject_id) REFERENCES subjects(id),
+            UNIQUE (faculty_id, section_id, subject_id, date, period)
+        );
+
+        INSERT INTO faculty_workload_new
+        (faculty_id, section_id, subject_id, date, time, period, created_at)
+        SELECT faculty_id, section_id, subject_id, date, MIN(time), period, MIN(created_at)
+        FROM faculty_workload
+        GROUP BY faculty_id, section_id, subject_id, date, period;
+
+        DROP TABLE faculty_workload;
+        ALTER TABLE faculty_workload_new RENAME TO faculty_workload;
+
+        CREATE TABLE faculty_daily_workload (
+            faculty_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            classes INTEGER NOT NULL DEFAULT 0,
+            teaching_minutes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (faculty_id, date),
+            FOREIGN KEY (faculty_id) REFERENCES faculty(id)
+        );
+    ''')
+
+    # Period lengths live in PERIOD_TIMINGS, so the counters are summed here
+    daily = {}
+    for faculty_id, date, period in conn.execute('''
+        SELECT DISTINCT faculty_id, date, period
+        FROM faculty_workload
+    '''):
+        counters = daily.setdefault((faculty_id, date), [0, 0])
+        counters[0] += 1
+        if period in PERIOD_TIMINGS:
+            counters[1] += get_period_minutes(period)
+
+    conn.executemany('''
+        INSERT INTO faculty_daily_workload (faculty_id, date, classes, teaching_minutes)
+        VALUES (?, ?, ?, ?)
+    ''', [(faculty_id, date, classes, minutes)
+          for (faculty_id, date), (classes, minutes) in daily.items()])
+
+def create_hot_path_indexes(conn):
+    """Create the secondary indexes backing the hot queries"""
+    execute_script(conn, '''
+        -- check_duplicate_attendance searches the section's students on the
+        -- UNIQUE (student_id, date, period) key. attendance.section_id holds
+        -- the original section, so an index on it serves no lookup.
+        DROP INDEX IF EXISTS idx_attendance_section_date_period;
+
+        -- Statistics: a student's attendance over a date range, covering
+        CREATE INDEX IF NOT EXISTS idx_attendance_student_date
+            ON attendance (student_id, date, subject_id, status);
+
+        -- get_students_in_section and section rosters
+        CREATE INDEX IF NOT EXISTS idx_students_manipulated_section
+            ON students (manipulated_section_id, ht_number);
+        CREATE INDEX IF NOT EXISTS idx_students_original_section
+            ON students (original_section_id, ht_number);
+
+        -- Workload report: a faculty member's sessions over a date range
+        CREATE INDEX IF NOT EXISTS idx_faculty_workload_faculty_date
+            ON faculty_workload (faculty_id, date, subject_id, section_id);
+    ''')
+
+def add_catalog_versions(conn):
+    """Track a change counter per reference table for CatalogCache"""
+    conn.execute('''
+        CREATE TABLE catalog_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in CATALOG_TABLES:
+        conn.execute('INSERT INTO catalog_versions (name) VALUES (?)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER {table}_catalog_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE catalog_versions SET version = version + 1
+                    WHERE name = '{table}';
+                END
+            ''')
+
+def add_attendance_rollups(conn):
+    """Add per-student/subject/day counters maintained by triggers
+
+    At this version every attendance row still carried its own date and
+    subject; normalize_attendance replaces these triggers.
+    """
+    execute_script(conn, ROLLUP_TABLE + '''
+        CREATE TRIGGER attendance_rollup_insert
+        AFTER INSERT ON attendance
+        BEGIN
+            INSERT INTO attendance_daily_rollup (student_id, date, subject_id, present, total)
+            VALUES (NEW.student_id, NEW.date, NEW.subject_id, NEW.status = 'P', 1)
+            ON CONFLICT (student_id, date, subject_id) DO UPDATE SET
+                present = present + excluded.present,
+                total = total + 1;
+        END;
+
+        CREATE TRIGGER attendance_rollup_delete
+        AFTER DELETE ON attendance
+        BEGIN
+            UPDATE attendance_daily_rollup
+            SET present = present - (OLD.status = 'P'),
+                total = total - 1
+            WHERE student_id = OLD.student_id
+            AND date = OLD.date
+            AND subject_id = OLD.subject_id;
+        END;
+
+        CREATE TRIGGER attendance_rollup_update
+        AFTER UPDATE OF student_id, subject_id, date, status ON attendance
+        BEGIN
+            UPDATE attendance_daily_rollup
+            SET present = present - (OLD.status = 'P'),
+                total = total - 1
+            WHERE student_id = OLD.student_id
+            AND date = OLD.date
+            AND subject_id = OLD.subject_id;
+
+            INSERT INTO attendance_daily_rollup (student_id, date, subject_id, present, total)
+            VALUES (NEW.student_id, NEW.date, NEW.subject_id, NEW.status = 'P', 1)
+            ON CONFLICT (student_id, date, subject_id) DO UPDATE SET
+                present = present + excluded.present,
+                total = total + 1;
+        END;
+
+        INSERT INTO attendance_daily_rollup (student_id, date, subject_id, present, total)
+        SELECT student_id, date, subject_id,
+               SUM(CASE WHEN status = 'P' THEN 1 ELSE 0 END),
+               COUNT(*)
+        FROM attendance
+        GROUP BY student_id, date, subject_id;
+    ''')
+
+def add_attendance_sessions(conn):
+    """Claim each class session once per (section, date, period)
+
+    Sessions are keyed by the manipulated section faculty mark, and the
+    unique index is what lets concurrent submitters race safely. Existing
+    sessions are backfilled from faculty_workload, earliest first, so
+    classes from before workload was compacted keep the original sections
+    their rows were recorded under. The attendance index that only
+    served the old duplicate check is dropped.
+    """
+    execute_script(conn, '''
+        CREATE TABLE attendance_sessions (
+            id INTEGER PRIMARY KEY,
+            section_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            period TEXT NOT NULL,
+            faculty_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            time TIME NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (section_id) REFERENCES sections(id),
+            FOREIGN KEY (faculty_id) REFERENCES faculty(id),
+            FOREIGN KEY (subject_id) REFERENCES subjects(id),
+            UNIQUE (section_id, date, period)
+        );
+
+        INSERT OR IGNORE INTO attendance_sessions
+        (section_id, date, period, faculty_id, subject_id, time, created_at)
+        SELECT section_id, date, period, faculty_id, subject_id, time, created_at
+        FROM faculty_workload
+        ORDER BY date, time, id;
+
+        DROP INDEX IF EXISTS idx_attendance_section_date_period;
+    ''')
+
+def add_report_versions(conn):
+    """Track per-day and student change counters for the report cache
+
+    Students join the reference tables in catalog_versions, since every
+    report shows student names and sections. Attendance rows still had
+    their own date at this version.
+    """
+    execute_script(conn, DATE_VERSION_TABLE + date_version_triggers({
+        'attendance': '{row}.date',
+        'faculty_workload': '{row}.date',
+    }))
+    conn.execute('''
+        INSERT INTO attendance_date_versions (date, version)
+        SELECT date, 1 FROM attendance
+        UNION
+        SELECT date, 1 FROM faculty_workload
+    ''')
+    conn.execute("INSERT INTO catalog_versions (name) VALUES ('students')")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER students_catalog_{event.lower()}
+            AFTER {event} ON students
+            BEGIN
+                UPDATE catalog_versions SET version = version + 1
+                WHERE name = 'students';
+            END
+        ''')
+
+def add_report_jobs(conn):
+    """Add the queue of background report jobs"""
+    execute_script(conn, REPORT_JOBS_TABLE)
+
+def normalize_attendance(conn):
+    """Store attendance as (session_id, student_id, status) under session headers
+
+    Every old row repeated its class's faculty, subject, section, date,
+    time and period. A row joins the session of its own class, matched on
+    faculty and subject as well as the slot. That is the session in its
+    stored original section, where sessions were backfilled from
+    uncompacted workload, or else in the student's current manipulated
+    section (the original section for students without one). Classes
+    without a session get their header first.
+
+    A slot can hold only one session, so if rows of different classes
+    fall in the same slot, which only the unclaimed era allowed, the
+    migration stops and lists those slots rather than folding one class
+    into another. Rows that cannot be placed, lacking a student or a
+    section, faculty member or subject for their class, are dropped and
+    counted.
+
+    Rollups are rebuilt from the converted rows and every date version is
+    bumped, so no cached report outlives the conversion.
+    """
+    execute_script(conn, '''
+        CREATE TEMP TABLE legacy_attendance AS
+        SELECT a.student_id, a.status, a.date, a.period, a.faculty_id, a.subject_id,
+               a.time, a.created_at,
+               CASE WHEN EXISTS (
+                   SELECT 1 FROM attendance_sessions ses
+                   WHERE ses.section_id = a.section_id
+                   AND ses.date = a.date
+                   AND ses.period = a.period
+                   AND ses.faculty_id = a.faculty_id
+                   AND ses.subject_id = a.subject_id
+               ) THEN a.section_id
+               ELSE COALESCE(s.manipulated_section_id, a.section_id) END AS section_id
+        FROM attendance a
+        LEFT JOIN students s ON a.student_id = s.id
+        WHERE a.student_id IS NOT NULL
+        AND COALESCE(s.manipulated_section_id, a.section_id) IS NOT NULL
+        AND a.faculty_id IS NOT NULL
+        AND a.subject_id IS NOT NULL;
+    ''')
+
+    conflicts = conn.execute('''
+        SELECT COALESCE(sec.name, c.section_id), c.date, c.period
+        FROM (
+            SELECT section_id, date, period, faculty_id, subject_id
+            FROM temp.legacy_attendance
+            UNION
+            SELECT ses.section_id, ses.date, ses.period, ses.faculty_id, ses.subject_id
+            FROM attendance_sessions ses
+            JOIN (SELECT DISTINCT section_id, date, period FROM temp.legacy_attendance) slot
+                USING (section_id, date, period)
+        ) c
+        LEFT JOIN sections sec ON c.section_id = sec.id
+        GROUP BY c.section_id, c.date, c.period
+        HAVING COUNT(*) > 1
+        ORDER BY c.date, c.period, 1
+    ''').fetchall()
+    if conflicts:
+        listed = '; '.join(f"{section} {date} {period}" for section, date, period in conflicts[:20])
+        raise RuntimeError(
+            f"{len(conflicts)} class slots hold attendance of more than one faculty member "
+            f"or subject: {listed}. Move or remove the extra rows and start again."
+        )
+
+    dropped = conn.execute('''
+        SELECT (SELECT COUNT(*) FROM attendance) - (SELECT COUNT(*) FROM temp.legacy_attendance)
+    ''').fetchone()[0]
+    if dropped:
+        print(f"Dropped {dropped} attendance rows lacking a student, section, faculty member or subject")
+
+    execute_script(conn, '''
+        INSERT OR IGNORE INTO attendance_sessions
+        (section_id, date, period, faculty_id, subject_id, time, created_at)
+        SELECT section_id, date, period, faculty_id, subject_id, MIN(time), MIN(created_at)
+        FROM temp.legacy_attendance
+        GROUP BY section_id, date, period, faculty_id, subject_id
+        ORDER BY date, MIN(time);
+
+        CREATE TABLE attendance_new (
+            session_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            status TEXT NOT NULL CHECK (status IN ('P', 'A')),
+            PRIMARY KEY (session_id, student_id),
+            FOREIGN KEY (session_id) REFERENCES attendance_sessions(id),
+            FOREIGN KEY (student_id) REFERENCES students(id)
+        );
+
+        INSERT INTO attendance_new (session_id, student_id, status)
+        SELECT ses.id, a.student_id, a.status
+        FROM temp.legacy_attendance a
+        JOIN attendance_sessions ses
+            ON ses.section_id = a.section_id
+            AND ses.date = a.date
+            AND ses.period = a.period
+            AND ses.faculty_id = a.faculty_id
+            AND ses.subject_id = a.subject_id
+        ORDER BY ses.id, a.student_id;
+
+        DROP TABLE temp.legacy_attendance;
+        DROP TABLE attendance;
+        ALTER TABLE attendance_new RENAME TO attendance;
+
+        -- Statistics: a student's sessions, covering
+        CREATE INDEX idx_attendance_student
+            ON attendance (student_id, session_id, status);
+    ''' + ROLLUP_TRIGGERS + DATE_VERSION_TRIGGERS)
+    rebuild_rollups(conn)
+    conn.execute('UPDATE attendance_date_versions SET version = version + 1')
+
+def add_attendance_bitmaps(conn):
+    """Add per-session presence bitmaps and the triggers dropping stale ones
+
+    The bitmaps start empty; `python manage.py build-bitmaps` fills them.
+    """
+    execute_script(conn, BITMAP_TABLES + BITMAP_TRIGGERS)
+
+def add_academic_terms(conn):
+    """Add academic terms and the frozen totals of archived ones"""
+    execute_script(conn, TERM_TABLES)
+
+def add_attendance_edits(conn):
+    """Count in-place edits of attendance for the analytics mirror"""
+    execute_script(conn, ATTENDANCE_EDITS_TABLE + ATTENDANCE_EDITS_TRIGGERS)
+
+def defer_bitmap_triggers(conn):
+    """Drop the bitmap triggers from databases holding no bitmaps
+
+    They ran on every attendance write whether or not bitmaps were used;
+    bitmaps.install_triggers() now adds them once bitmaps are in use.
+    """
+    if conn.execute('SELECT 1 FROM attendance_bitmaps LIMIT 1').fetchone() is None:
+        drop_triggers(conn)
+
+# Ordered list of (version, migration). Append only: a database at version
+# N has had exactly the first N migrations applied.
+MIGRATIONS = [
+    (1, baseline_schema),
+    (2, add_created_at_columns),
+    (3, compact_faculty_workload),
+    (4, create_hot_path_indexes),
+    (5, add_catalog_versions),
+    (6, add_attendance_rollups),
+    (7, add_attendance_sessions),
+    (8, add_report_versions),
+    (9, add_report_jobs),
+    (10, normalize_attendance),
+    (11, add_attendance_bitmaps),
+    (12, add_academic_terms),
+    (13, add_attendance_edits),
+    (14, defer_bitmap_triggers),
+]
+
+
+# ================ Optional Layouts ================
+# Physical layouts of the attendance rows. Both have the same columns, so
+# every query runs unchanged on either; only the storage differs. The
+# default keeps rows in insertion order with a covering index per
+# student. The compact layout clusters the rows themselves on
+# (student_id, session_id), so a student's history sits on adjacent
+# pages in session order, and drops the separate student index.
+ATTENDANCE_LAYOUTS = {
+    'rowid': '''
+        CREATE TABLE attendance_new (
+            session_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            status TEXT NOT NULL CHECK (status IN ('P', 'A')),
+            PRIMARY KEY (session_id, student_id),
+            FOREIGN KEY (session_id) REFERENCES attendance_sessions(id),
+            FOREIGN KEY (student_id) REFERENCES students(id)
+        );
+    ''',
+    'compact': '''
+        CREATE TABLE attendance_new (
+            student_id INTEGER NOT NULL,
+            session_id INTEGER NOT NULL,
+            status TEXT NOT NULL CHECK (status IN ('P', 'A')),
+            PRIMARY KEY (student_id, session_id),
+            FOREIGN KEY (session_id) REFERENCES attendance_sessions(id),
+            FOREIGN KEY (student_id) REFERENCES students(id)
+        ) WITHOUT ROWID;
+    ''',
+}
+
+ATTENDANCE_LAYOUT_INDEXES = {
+    # Statistics: a student's sessions, covering
+    'rowid': '''
+        CREATE INDEX idx_attendance_student
+            ON attendance (student_id, session_id, status);
+    ''',
+    # A session's rows, for the rollup and bitmap triggers; the key
+    # columns ride along, so with status it is covering
+    'compact': '''
+        CREATE INDEX idx_attendance_session
+            ON attendance (session_id, status);
+    ''',
+}
+
+def get_attendance_layout(conn):
+    """Get the name of the attendance table's current layout"""
+    without_rowid = conn.execute(
+        "SELECT sql LIKE '%WITHOUT ROWID%' FROM sqlite_master WHERE type = 'table' AND name = 'attendance'"
+    ).fetchone()[0]
+    return 'compact' if without_rowid else 'rowid'
+
+def set_attendance_layout(conn, layout):
+    """Rebuild the attendance rows in another layout
+
+    Runs inside the caller's transaction. The rows are copied in the new
+    key order. Every trigger mentioning attendance is dropped for the
+    swap, as the rename refuses to run while one refers to a missing
+    table, and recreated on the new table afterwards. Returns False when
+    the table already has the layout.
+    """
+    if get_attendance_layout(conn) == layout:
+        return False
+    triggers = [(name, sql) for name, sql in conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"
+    ) if re.search(r'\battendance\b', sql)]
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    order = 'student_id, session_id' if layout == 'compact' else 'session_id, student_id'
+    execute_script(conn, ATTENDANCE_LAYOUTS[layout] + f'''
+        INSERT INTO attendance_new (session_id, student_id, status)
+        SELECT session_id, student_id, status FROM attendance
+        ORDER BY {order};
+
+        DROP TABLE attendance;
+        ALTER TABLE attendance_new RENAME TO attendance;
+    ''' + ATTENDANCE_LAYOUT_INDEXES[layout])
+    for _, sql in triggers:
+        conn.execute(sql)
+    return True
+
+
+# ================ Runner ================
+def get_schema_version(conn):
+    """Get the schema version recorded in the database header"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(db_file):
+    """Apply pending migrations to a database file
+
+    Each migration runs in its own IMMEDIATE transaction together with the
+    user_version bump, so a failure leaves the database at the last good
+    version. The version is re-read after taking the write lock, which
+    makes concurrent starts of several processes safe. The database is
+    switched to WAL first, so every process starts in multi-process mode.
+    Returns the resulting schema version.
+    """
+    conn = sqlite3.connect(db_file, isolation_level=None, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        enable_wal(conn)
+        for version, migration in MIGRATIONS:
+            if get_schema_version(conn) >= version:
+                continue
+            begin_immediate(conn)
+            try:
+                if get_schema_version(conn) < version:
+                    migration(conn)
+                    conn.execute(f'PRAGMA user_version = {version}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return get_schema_version(conn)
+    finally:
+        conn.close()
+
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+def ensure_migrated(db_file):
+    """Migrate a database file once per process
+
+    Later calls return immediately without touching the database.
+    """
+    if db_file in _migrated:
+        return
+    with _migrate_lock:
+        if db_file not in _migrated:
+            migrate(db_file)
+            _migrated.add(db_file)
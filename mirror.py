@@ -0,0 +1,383 @@
+# mirror.py
+"""Columnar copy of the attendance rows, memory-mapped by every process
+
+Each column is a file of fixed-width little-endian values, so any number
+of server processes map the same pages and scan them as NumPy arrays
+without copying or querying SQLite. New class sessions are appended past
+a high-water mark on attendance_sessions.id; a session's rows commit
+with its header, so every session below the mark is complete. Rows are
+only ever appended by marking, so any update or delete of attendance or
+a session header bumps attendance_edits and the next refresh rebuilds
+the mirror from scratch.
+
+Archived terms are mirrored too: a rebuild reads their rows from each
+term's archive file and skips their dates in the hot database, as
+reports.archived_union() does, and archiving or purging a term forces
+one, so the mirror covers every term the reports do.
+
+The row count, high-water mark and current file generation live in a
+small SQLite file beside the columns. Refreshes take its write lock, so
+processes never append at once, and readers map exactly the rows it
+records.
+"""
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+import numpy as np
+from archive import ARCHIVE_VFS
+from connections import BUSY_TIMEOUT_SECONDS, begin_immediate, enable_wal
+
+# Directory of the column files and their state
+MIRROR_DIR = 'analytics_mirror'
+
+# Rows fetched from SQLite per batch while appending
+MIRROR_FETCH_ROWS = 100000
+
+# (name, dtype, SQL expression) per column. Days count from 1970-01-01,
+# periods are the number of 'P1'..'P6' and status is 1 for present.
+MIRROR_COLUMNS = [
+    ('student', np.dtype('<i4'), 'a.student_id'),
+    ('subject', np.dtype('<i4'), 'ses.subject_id'),
+    ('section', np.dtype('<i4'), 'ses.section_id'),
+    ('day', np.dtype('<i4'), 'CAST(julianday(ses.date) - 2440587.5 AS INTEGER)'),
+    ('period', np.dtype('i1'), 'CAST(substr(ses.period, 2) AS INTEGER)'),
+    ('status', np.dtype('i1'), "a.status = 'P'"),
+]
+
+# Column list read from the hot database and archives alike, with the
+# session id last for the high-water mark
+MIRROR_SELECT = ', '.join(expression for _, _, expression in MIRROR_COLUMNS) + ', ses.id'
+
+ATTENDANCE_EDITS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS attendance_edits (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        edits INTEGER NOT NULL
+    );
+
+    INSERT OR IGNORE INTO attendance_edits (id, edits) VALUES (1, 0);
+'''
+
+# Marking only inserts; anything else invalidates appended copies
+ATTENDANCE_EDITS_TRIGGERS = '''
+    CREATE TRIGGER IF NOT EXISTS attendance_edits_update
+    AFTER UPDATE ON attendance
+    BEGIN
+        UPDATE attendance_edits SET edits = edits + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS attendance_edits_delete
+    AFTER DELETE ON attendance
+    BEGIN
+        UPDATE attendance_edits SET edits = edits + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS attendance_sessions_edits_update
+    AFTER UPDATE OF section_id, date, period, subject_id ON attendance_sessions
+    BEGIN
+        UPDATE attendance_edits SET edits = edits + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS attendance_sessions_edits_delete
+    AFTER DELETE ON attendance_sessions
+    BEGIN
+        UPDATE attendance_edits SET edits = edits + 1;
+    END;
+'''
+
+
+class AttendanceMirror:
+    """Shared column files of the attendance rows for one database"""
+
+    def __init__(self, db_file, mirror_dir=MIRROR_DIR):
+        self.db_file = db_file
+        self.mirror_dir = mirror_dir
+        self._lock = threading.Lock()
+        self._mapped = None
+        self._columns = None
+        self._refresher = None
+        os.makedirs(mirror_dir, exist_ok=True)
+        self._state = sqlite3.connect(
+            os.path.join(mirror_dir, 'mirror.db'),
+            isolation_level=None,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False
+        )
+        enable_wal(self._state)
+        # State written before archived terms were mirrored lacks their
+        # column; dropping it makes the next refresh rebuild
+        columns = {row[1] for row in self._state.execute('PRAGMA table_info(mirror_state)')}
+        if columns and 'archived_terms' not in columns:
+            self._state.execute('DROP TABLE mirror_state')
+        self._state.execute('''
+            CREATE TABLE IF NOT EXISTS mirror_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL,
+                rows INTEGER NOT NULL,
+                last_session_id INTEGER NOT NULL,
+                edits INTEGER NOT NULL,
+                refreshed_at REAL NOT NULL,
+                archived_terms TEXT NOT NULL        -- ids of the terms read from archives
+            )
+        ''')
+
+    def _path(self, name, generation):
+        return os.path.join(self.mirror_dir, f'{name}.{generation}.bin')
+
+    def _read_state(self):
+        return self._state.execute(
+            'SELECT generation, rows, last_session_id, edits, refreshed_at, archived_terms FROM mirror_state'
+        ).fetchone()
+
+    def refresh(self):
+        """Append sessions marked since the last refresh
+
+        Rebuilds every column into a new generation of files when rows were
+        edited or deleted since, a term was archived, or the files have
+        gone. Returns the number of rows written.
+        """
+        with self._lock:
+            begin_immediate(self._state)
+            try:
+                written = self._refresh()
+                self._state.execute('COMMIT')
+            except Exception:
+                self._state.execute('ROLLBACK')
+                raise
+        return written
+
+    def refresh_in_background(self, max_age_seconds):
+        """Start a refresh on a daemon thread if the last one is too old
+
+        Returns at once, and False when no refresh was started; readers
+        keep mapping the last refresh's rows meanwhile. The thread has its
+        own state connection, and a failed refresh is printed and retried
+        on a later call.
+        """
+        state = self._read_state()
+        if state and time.time() - state[4] < max_age_seconds:
+            return False
+        with self._lock:
+            if self._refresher and self._refresher.is_alive():
+                return False
+            self._refresher = threading.Thread(
+                target=_refresh_mirror, args=(self.db_file, self.mirror_dir),
+                name='mirror-refresh', daemon=True
+            )
+            self._refresher.start()
+        return True
+
+    def _refresh(self):
+        state = self._read_state()
+        source = sqlite3.connect(f"file:{quote(self.db_file)}?mode=ro", uri=True,
+                                 timeout=BUSY_TIMEOUT_SECONDS)
+        try:
+            # One snapshot for the edit counter, the archived terms and the rows
+            source.execute('BEGIN')
+            edits = source.execute('SELECT edits FROM attendance_edits').fetchone()[0]
+            terms = source.execute('''
+                SELECT id, name, start_date, end_date, archive_file
+                FROM academic_terms
+                WHERE archived_at IS NOT NULL
+                ORDER BY start_date
+            ''').fetchall()
+            archived = ','.join(str(term[0]) for term in terms)
+            missing = state and not all(os.path.exists(self._path(name, state[0]))
+                                        for name, _, _ in MIRROR_COLUMNS)
+            rebuild = state is None or state[3] != edits or state[5] != archived or missing
+            if rebuild:
+                generation = state[0] + 1 if state else 1
+                rows, last_session_id = 0, 0
+            else:
+                generation, rows, last_session_id = state[:3]
+            files = {}
+            try:
+                for name, dtype, _ in MIRROR_COLUMNS:
+                    path = self._path(name, generation)
+                    files[name] = open(path, 'r+b' if rows else 'wb')
+                    # Drop anything a refresh that died before committing wrote
+                    files[name].truncate(rows * dtype.itemsize)
+                    files[name].seek(0, os.SEEK_END)
+                written = 0
+                if rebuild:
+                    for _, name, start, end, path in terms:
+                        written += self._copy_archive(files, name, start, end, path)
+                skip = ''.join(' AND ses.date NOT BETWEEN ? AND ?' for _ in terms)
+                cur = source.execute(f'''
+                    SELECT {MIRROR_SELECT}
+                    FROM attendance_sessions ses
+                    JOIN attendance a ON a.session_id = ses.id
+                    WHERE ses.id > ?{skip}
+                    ORDER BY ses.id
+                ''', [last_session_id] + [day for term in terms for day in term[2:4]])
+                appended, last_session_id = self._write(files, cur, last_session_id)
+                written += appended
+                for file in files.values():
+                    file.flush()
+                    os.fsync(file.fileno())
+            finally:
+                for file in files.values():
+                    file.close()
+            source.execute('COMMIT')
+        finally:
+            source.close()
+
+        self._state.execute('''
+            INSERT OR REPLACE INTO mirror_state
+            (id, generation, rows, last_session_id, edits, refreshed_at, archived_terms)
+            VALUES (1, ?, ?, ?, ?, ?, ?)
+        ''', (generation, rows + written, last_session_id, edits, time.time(), archived))
+        if state and state[0] != generation:
+            self._remove_generations(keep=generation)
+        return written
+
+    def _copy_archive(self, files, name, start, end, path):
+        """Write an archived term's rows from its archive file"""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"The archive of term {name} is missing: {path}")
+        archive = sqlite3.connect(f"file:{quote(path)}?mode=ro&vfs={ARCHIVE_VFS}", uri=True)
+        try:
+            cur = archive.execute(f'''
+                SELECT {MIRROR_SELECT}
+                FROM attendance_sessions ses
+                JOIN attendance a ON a.session_id = ses.id
+                WHERE ses.date BETWEEN ? AND ?
+                ORDER BY ses.id
+            ''', (start, end))
+            return self._write(files, cur)[0]
+        finally:
+            archive.close()
+
+    def _write(self, files, cur, last_session_id=0):
+        """Append fetched rows to the column files
+
+        Returns the rows written and the last session id among them.
+        """
+        written = 0
+        while batch := cur.fetchmany(MIRROR_FETCH_ROWS):
+            values = np.array(batch, dtype=np.int64)
+            for index, (name, dtype, _) in enumerate(MIRROR_COLUMNS):
+                files[name].write(values[:, index].astype(dtype).tobytes())
+            written += len(batch)
+            last_session_id = int(values[-1, -1])
+        return written, last_session_id
+
+    def _remove_generations(self, keep):
+        """Delete column files of older generations
+
+        Files another process still has mapped cannot be deleted on
+        Windows; they are retried after the next rebuild.
+        """
+        for entry in os.listdir(self.mirror_dir):
+            parts = entry.split('.')
+            if len(parts) == 3 and parts[2] == 'bin' and parts[1] != str(keep):
+                try:
+                    os.remove(os.path.join(self.mirror_dir, entry))
+                except OSError:
+                    pass
+
+    def columns(self):
+        """Get every column as a read-only array mapped from the shared files
+
+        The arrays cover the rows committed by the last refresh; they are
+        remapped here whenever a refresh has moved on.
+        """
+        state = self._read_state()
+        if state is None:
+            return {name: np.empty(0, dtype) for name, dtype, _ in MIRROR_COLUMNS}
+        generation, rows = state[:2]
+        with self._lock:
+            if self._mapped != (generation, rows):
+                self._columns = {
+                    name: np.memmap(self._path(name, generation), dtype=dtype, mode='r', shape=(rows,))
+                    if rows else np.empty(0, dtype)
+                    for name, dtype, _ in MIRROR_COLUMNS
+                }
+                self._mapped = (generation, rows)
+            return self._columns
+
+    def stats(self):
+        """Get the mirrored row count and seconds since the last refresh"""
+        state = self._read_state()
+        if state is None:
+            return {'rows': 0, 'age_seconds': None}
+        return {'rows': state[1], 'age_seconds': int(time.time() - state[4])}
+
+    def close(self):
+        self._state.close()
+
+
+def _refresh_mirror(db_file, mirror_dir):
+    """Refresh a mirror through a handle of its own, printing any error"""
+    mirror = AttendanceMirror(db_file, mirror_dir)
+    try:
+        mirror.refresh()
+    except Exception as e:
+        print(f"Mirror refresh error: {e}")
+    finally:
+        mirror.close()
+
+
+# ================ Analytics ================
+def day_number(day):
+    """Get the mirror's day number of a date or ISO date string"""
+    return int(np.datetime64(str(day), 'D').astype(np.int64))
+
+def day_string(days):
+    """Get ISO date strings for an array of day numbers"""
+    return np.asarray(days, dtype='datetime64[D]').astype(str)
+
+def select_rows(columns, from_date, to_date, sections=None):
+    """Get a mask of the rows in a date range, optionally in chosen sections"""
+    day = columns['day']
+    mask = (day >= day_number(from_date)) & (day <= day_number(to_date))
+    if sections is not None:
+        mask &= np.isin(columns['section'], np.asarray(list(sections), dtype=np.int32))
+    return mask
+
+def student_percentages(columns, from_date, to_date, sections=None):
+    """Get (student_ids, present, total, percentage) over a date range"""
+    mask = select_rows(columns, from_date, to_date, sections)
+    student_ids, inverse = np.unique(columns['student'][mask], return_inverse=True)
+    total = np.bincount(inverse, minlength=len(student_ids))
+    present = np.bincount(inverse, weights=columns['status'][mask], minlength=len(student_ids))
+    present = present.astype(np.int64)
+    return student_ids, present, total, np.round(100 * present / np.maximum(total, 1), 2)
+
+def subject_percentages(columns, from_date, to_date, sections=None):
+    """Get (student_ids, subject_ids, present, total) per student and subject"""
+    mask = select_rows(columns, from_date, to_date, sections)
+    keys = np.column_stack([columns['student'][mask], columns['subject'][mask]])
+    keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    total = np.bincount(inverse, minlength=len(keys))
+    present = np.bincount(inverse, weights=columns['status'][mask], minlength=len(keys))
+    return keys[:, 0], keys[:, 1], present.astype(np.int64), total
+
+def cohort_summary(columns, from_date, to_date, threshold=75, sections=None):
+    """Get per-section (section_ids, students, average percentage, below threshold)
+
+    Students count towards the section their classes were marked in, and
+    the average is over the students' own percentages.
+    """
+    mask = select_rows(columns, from_date, to_date, sections)
+    keys = np.column_stack([columns['section'][mask], columns['student'][mask]])
+    keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    total = np.bincount(inverse, minlength=len(keys))
+    present = np.bincount(inverse, weights=columns['status'][mask], minlength=len(keys))
+    percentage = 100 * present / np.maximum(total, 1)
+    section_ids, section_index = np.unique(keys[:, 0], return_inverse=True)
+    students = np.bincount(section_index, minlength=len(section_ids))
+    average = np.bincount(section_index, weights=percentage, minlength=len(section_ids)) / students
+    below = np.bincount(section_index, weights=percentage < threshold, minlength=len(section_ids))
+    return section_ids, students, np.round(average, 2), below.astype(np.int64)
+
+def daily_trend(columns, from_date, to_date, sections=None):
+    """Get (dates, present, total) per day with classes in a date range"""
+    mask = select_rows(columns, from_date, to_date, sections)
+    days, inverse = np.unique(columns['day'][mask], return_inverse=True)
+    total = np.bincount(inverse, minlength=len(days))
+    present = np.bincount(inverse, weights=columns['status'][mask], minlength=len(days))
+    return day_string(days), present.astype(np.int64), total
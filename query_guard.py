@@ -0,0 +1,81 @@
+# query_guard.py
+import sqlite3
+import time
+
+# SQLite virtual machine steps between progress handler calls
+PROGRESS_OPCODES = 20000
+
+# Minimum time between on_progress calls
+PROGRESS_REPORT_SECONDS = 0.25
+
+
+class QueryCancelled(Exception):
+    """A guarded query was stopped before it finished"""
+
+
+class QueryTimedOut(QueryCancelled):
+    """A guarded query ran past its time budget"""
+
+
+class QueryGuard:
+    """Watch the queries run on a connection while the guard is active
+
+    Installs an SQLite progress handler that aborts the running statement
+    once budget_seconds have passed or cancel_event is set, and calls
+    on_progress(elapsed_seconds) every PROGRESS_REPORT_SECONDS in between.
+    An aborted statement surfaces as QueryTimedOut or QueryCancelled when
+    the guarded block exits.
+
+    Exceptions raised by on_progress also abort the statement. sqlite3
+    would otherwise swallow them, so they are kept and re-raised in place
+    of the "interrupted" error; this is how Streamlit's rerun and stop
+    signals, raised from a progress bar update, get out of a long query.
+    """
+
+    def __init__(self, conn, budget_seconds=None, on_progress=None, cancel_event=None,
+                 opcodes=PROGRESS_OPCODES):
+        self.conn = conn
+        self.budget_seconds = budget_seconds
+        self.on_progress = on_progress
+        self.cancel_event = cancel_event
+        self.opcodes = opcodes
+        self.started = None
+        self._reported = 0.0
+        self._stopped = None
+        self._error = None
+
+    def elapsed(self):
+        """Seconds since the guard was entered"""
+        return time.monotonic() - self.started
+
+    def _handler(self):
+        elapsed = self.elapsed()
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self._stopped = QueryCancelled("Query cancelled")
+            return 1
+        if self.budget_seconds is not None and elapsed > self.budget_seconds:
+            self._stopped = QueryTimedOut(f"Query ran longer than {self.budget_seconds}s")
+            return 1
+        if self.on_progress is not None and elapsed - self._reported >= PROGRESS_REPORT_SECONDS:
+            self._reported = elapsed
+            try:
+                self.on_progress(elapsed)
+            except BaseException as e:
+                self._error = e
+                return 1
+        return 0
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        self.conn.set_progress_handler(self._handler, self.opcodes)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.conn.set_progress_handler(None, self.opcodes)
+        if exc_type is None or not issubclass(exc_type, sqlite3.OperationalError):
+            return False
+        if self._error is not None:
+            raise self._error from None
+        if self._stopped is not None:
+            raise self._stopped from None
+        return False
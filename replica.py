@@ -0,0 +1,117 @@
+# replica.py
+import sqlite3
+import threading
+import time
+from itertools import count
+from urllib.parse import quote
+from connections import BUSY_TIMEOUT_SECONDS
+
+
+class ReadReplica:
+    """In-memory copy of a database for report queries
+
+    The copy is a snapshot serialized from a read-only connection, so
+    building it never holds up writers. connection() opens a connection to
+    the current copy and refreshes it first when the database has changed
+    (PRAGMA data_version) and at least refresh_seconds have passed since
+    the last copy; with refresh_seconds=0 every change is picked up on the
+    next request.
+
+    Copies live in SQLite's memdb VFS under a unique name, so every
+    caller gets its own connection to the shared copy, with its own temp
+    tables and progress handler. A refresh builds a new copy and swaps it
+    in; connections still reading the previous copy keep it alive and
+    finish against it undisturbed. Only one thread refreshes at a time; the
+    others keep using the current copy meanwhile. The copy is left
+    writable because report filters are loaded into temp tables on it.
+    """
+
+    def __init__(self, db_file, refresh_seconds=60):
+        self.db_file = db_file
+        self.refresh_seconds = refresh_seconds
+        self._source = sqlite3.connect(
+            f"file:{quote(db_file)}?mode=ro",
+            uri=True,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        self._copies = count(1)
+        self._replica = None
+        self._version = None
+        self._refreshed_at = 0.0
+        self._refreshes = 0
+
+    def _data_version(self):
+        return self._source.execute('PRAGMA data_version').fetchone()[0]
+
+    def _open(self, name):
+        conn = sqlite3.connect(f"file:/{name}?vfs=memdb", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _copy(self):
+        # A copy of a WAL database is flagged as WAL too (file format bytes
+        # 18-19), which memdb cannot open, so the flag is cleared on a
+        # snapshot before it is loaded under its shared name
+        image = bytearray(self._source.serialize())
+        image[18:20] = b'\x01\x01'
+        snapshot = sqlite3.connect(':memory:')
+        snapshot.deserialize(bytes(image))
+        del image
+        # Keep the connection that loaded the copy alongside its name: memdb
+        # frees a database once its last connection closes
+        name = f"replica-{id(self)}-{next(self._copies)}"
+        anchor = self._open(name)
+        snapshot.backup(anchor)
+        snapshot.close()
+        return name, anchor
+
+    def _is_stale(self):
+        if self._replica is None:
+            return True
+        if time.monotonic() - self._refreshed_at < self.refresh_seconds:
+            return False
+        return self._data_version() != self._version
+
+    def _swap_locked(self):
+        version = self._data_version()
+        self._replica = self._copy()
+        self._version = version
+        self._refreshed_at = time.monotonic()
+        self._refreshes += 1
+
+    def refresh(self, force=False):
+        """Take a fresh copy if it is due; returns True if one was taken"""
+        with self._lock:
+            if not force and not self._is_stale():
+                return False
+            self._swap_locked()
+            return True
+
+    def connection(self):
+        """Open a connection to the current in-memory copy, refreshing it if due"""
+        if self._replica is None:
+            self.refresh()
+        elif self._lock.acquire(blocking=False):
+            try:
+                if self._is_stale():
+                    self._swap_locked()
+            finally:
+                self._lock.release()
+        # Holding the pair keeps this copy alive until the connection is open
+        name, anchor = self._replica
+        return self._open(name)
+
+    def stats(self):
+        """Get refresh counters for monitoring"""
+        return {
+            'refreshes': self._refreshes,
+            'age_seconds': round(time.monotonic() - self._refreshed_at, 1) if self._replica else None
+        }
+
+    def close(self):
+        """Close the source connection and drop the current copy"""
+        with self._lock:
+            self._source.close()
+            self._replica = None
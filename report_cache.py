@@ -0,0 +1,223 @@
+# report_cache.py
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from itertools import chain, islice
+from connections import BUSY_TIMEOUT_SECONDS, begin_immediate, enable_wal
+
+# Total size of cached report results before least recently used ones go
+REPORT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Reports with more rows than this are streamed live instead of cached
+REPORT_CACHE_MAX_ROWS = 100000
+
+# Per-day change counters, bumped by triggers whenever attendance or
+# workload rows for that day are written. A report over a date range is
+# only invalidated by writes that fall inside it.
+DATE_VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS attendance_date_versions (
+        date DATE PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+'''
+
+_BUMP_DATE = '''
+        INSERT INTO attendance_date_versions (date, version)
+        SELECT {date}, 1 WHERE {date} IS NOT NULL
+        ON CONFLICT (date) DO UPDATE SET version = version + 1;'''
+
+def date_version_triggers(dated_tables):
+    """Build the triggers bumping date versions for a set of tables
+
+    dated_tables maps each table to the SQL expression for a row's date,
+    with {row} standing for NEW or OLD.
+    """
+    def bump(date, row):
+        return _BUMP_DATE.format(date=date.format(row=row))
+
+    return ''.join(f'''
+    CREATE TRIGGER IF NOT EXISTS {table}_date_version_insert
+    AFTER INSERT ON {table}
+    BEGIN{bump(date, 'NEW')}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS {table}_date_version_update
+    AFTER UPDATE ON {table}
+    BEGIN{bump(date, 'OLD')}{bump(date, 'NEW')}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS {table}_date_version_delete
+    AFTER DELETE ON {table}
+    BEGIN{bump(date, 'OLD')}
+    END;
+''' for table, date in dated_tables.items())
+
+# Attendance rows take their date from their session
+DATE_VERSION_TRIGGERS = date_version_triggers({
+    'attendance': '(SELECT date FROM attendance_sessions WHERE id = {row}.session_id)',
+    'attendance_sessions': '{row}.date',
+    'faculty_workload': '{row}.date',
+})
+
+
+# ================ Data Versions ================
+def get_report_version(conn, from_date, to_date):
+    """Get the data version a report over a date range was computed from
+
+    Counters only ever grow, so their sum over the range changes with any
+    write inside it. Reference tables (faculty, sections, subjects,
+    students) appear in every report and are counted as a whole.
+    """
+    return tuple(conn.execute('''
+        SELECT
+            (SELECT COALESCE(SUM(version), 0) FROM attendance_date_versions
+             WHERE date BETWEEN ? AND ?),
+            (SELECT COALESCE(SUM(version), 0) FROM catalog_versions)
+    ''', (from_date, to_date)).fetchone())
+
+
+# ================ Cached Results ================
+class RowCursor:
+    """Cursor-like reader over cached rows
+
+    Offers the parts of sqlite3.Cursor the report pages and exports use:
+    description, fetchone, fetchmany and fetchall. With rest set, the
+    rows are followed by whatever that live cursor has left.
+    """
+
+    def __init__(self, columns, rows, rest=None):
+        self.description = [(column, None, None, None, None, None, None) for column in columns]
+        self._rows = iter(rows) if rest is None else chain(rows, rest)
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=1):
+        return list(islice(self._rows, size))
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class ReportCache:
+    """Report results shared by every process through a local SQLite file
+
+    Values are pickled and stored with their size and last access time.
+    Once the total size passes max_bytes, the least recently used entries
+    are dropped.
+    """
+
+    def __init__(self, cache_file, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.cache_file = cache_file
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._conn = sqlite3.connect(
+            cache_file,
+            isolation_level=None,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False
+        )
+        enable_wal(self._conn)
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS report_cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_report_cache_accessed
+                ON report_cache (accessed)
+        ''')
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash JSON-serializable key parts into a cache key"""
+        return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+    def get(self, key):
+        """Get a cached value, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM report_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._conn.execute(
+                'UPDATE report_cache SET accessed = ? WHERE key = ?', (time.time(), key)
+            )
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        """Store a value and evict least recently used entries over the size limit"""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            begin_immediate(self._conn)
+            try:
+                self._conn.execute('''
+                    INSERT OR REPLACE INTO report_cache (key, value, size, accessed)
+                    VALUES (?, ?, ?, ?)
+                ''', (key, data, len(data), time.time()))
+                self._conn.execute('''
+                    DELETE FROM report_cache WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS kept
+                            FROM report_cache
+                        )
+                        WHERE kept > ?
+                    )
+                ''', (self.max_bytes,))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._conn.execute('DELETE FROM report_cache')
+
+    def stats(self):
+        """Get hit counters and the cache size for monitoring"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM report_cache'
+            ).fetchone()
+        return {'entries': entries, 'bytes': size, 'hits': self._hits, 'misses': self._misses}
+
+    def query(self, conn, name, selection, from_date, to_date, query, params,
+              max_rows=REPORT_CACHE_MAX_ROWS):
+        """Run a report query through the cache and return a cursor over its rows
+
+        The key combines the report name, the selection (None for
+        everything), the date range and the range's data version read from
+        conn, so a hit is always as fresh as a new run would be. Results
+        over max_rows are not cached; the rows already read are returned
+        ahead of the rest of the same live cursor, so the query runs once.
+        """
+        if selection is not None:
+            selection = sorted(selection)
+        key = self.make_key(name, selection, from_date, to_date,
+                            get_report_version(conn, from_date, to_date))
+        cached = self.get(key)
+        if cached is not None:
+            return RowCursor(*cached)
+
+        cur = conn.execute(query, params)
+        columns = [description[0] for description in cur.description]
+        rows = [tuple(row) for row in cur.fetchmany(max_rows + 1)]
+        if len(rows) > max_rows:
+            return RowCursor(columns, rows, cur)
+        self.put(key, (columns, rows))
+        return RowCursor(columns, rows)
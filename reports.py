@@ -0,0 +1,208 @@
+# reports.py
+"""SQL for the admin reports
+
+Each builder returns (query, params) so the same report can be run by the
+Streamlit pages, exports and benchmarks. Selections are passed as filter
+ids from report_filter(), or None to report on everything.
+"""
+from contextlib import contextmanager
+from itertools import count
+
+# Selected values of every running report on a connection, keyed by filter
+# id so concurrent reports sharing a connection never see each other's rows
+FILTER_TABLE = '''
+    CREATE TEMP TABLE IF NOT EXISTS report_filter (
+        filter_id INTEGER NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (filter_id, value)
+    ) WITHOUT ROWID
+'''
+
+_filter_ids = count(1)
+
+
+# ================ Selection Filters ================
+def load_filter(conn, values):
+    """Load selected values into the temp filter table
+
+    Returns the filter id to pass to the query builders, or None when
+    values is None, meaning everything is selected and no filter applies.
+    """
+    if values is None:
+        return None
+    filter_id = next(_filter_ids)
+    conn.execute(FILTER_TABLE)
+    conn.executemany(
+        'INSERT OR IGNORE INTO temp.report_filter (filter_id, value) VALUES (?, ?)',
+        ((filter_id, value) for value in values)
+    )
+    return filter_id
+
+def drop_filter(conn, filter_id):
+    """Remove a loaded selection from the temp filter table"""
+    if filter_id is not None:
+        conn.execute('DELETE FROM temp.report_filter WHERE filter_id = ?', (filter_id,))
+
+@contextmanager
+def report_filter(conn, values):
+    """Load a selection for the duration of a block and yield its filter id"""
+    filter_id = load_filter(conn, values)
+    try:
+        yield filter_id
+    finally:
+        drop_filter(conn, filter_id)
+
+def filter_join(filter_id, column, alias='chosen'):
+    """Get (join clause, params) restricting column to a loaded selection"""
+    if filter_id is None:
+        return '', []
+    return (f"JOIN temp.report_filter {alias} "
+            f"ON {alias}.filter_id = ? AND {alias}.value = {column}"), [filter_id]
+
+
+def archived_union(select, totals, from_date, to_date, archives=()):
+    """Get (subquery, params) for dated rows over the hot database and archives
+
+    select reads one dated table, with {schema} for the database holding
+    it; totals reads the same columns from the frozen totals of the term
+    whose id it takes. archives comes from archive.attach_archives(). The
+    hot database is read outside archived terms, attached archives within
+    the range, and frozen totals for terms the range fully covers.
+    """
+    skip = ''.join(' AND date NOT BETWEEN ? AND ?' for _ in archives)
+    parts = [f"{select.format(schema='main')} WHERE date BETWEEN ? AND ?{skip}"]
+    params = [from_date, to_date] + [day for _, start, end, _ in archives for day in (start, end)]
+    for term_id, _, _, schema in archives:
+        if schema is None:
+            parts.append(totals)
+            params.append(term_id)
+        else:
+            parts.append(f"{select.format(schema=schema)} WHERE date BETWEEN ? AND ?")
+            params += [from_date, to_date]
+    return '(' + '\n            UNION ALL '.join(parts) + ')', params
+
+
+# ================ Reports ================
+
+
+def student_statistics_query(section_filter, from_date, to_date, archives=()):
+    """Per student/subject attendance for sections over a date range"""
+    join, filter_params = filter_join(section_filter, 'sec.name')
+    rollups, rollup_params = archived_union(
+        'SELECT student_id, subject_id, present, total FROM {schema}.attendance_daily_rollup',
+        'SELECT student_id, subject_id, present, total FROM main.term_attendance_totals WHERE term_id = ?',
+        from_date, to_date, archives
+    )
+    query = f"""
+        SELECT 
+            s.ht_number,
+            s.name as student_name,
+            sec.name as section,
+            sub.name as subject,
+            SUM(r.total) as total_classes,
+            SUM(r.present) as present_classes,
+            ROUND(CAST(SUM(r.present) AS FLOAT) / SUM(r.total) * 100, 2) as attendance_percentage
+        FROM students s
+        JOIN sections sec ON s.manipulated_section_id = sec.id
+        {join}
+        JOIN {rollups} r ON s.id = r.student_id
+        JOIN subjects sub ON r.subject_id = sub.id
+        GROUP BY s.ht_number, s.name, sec.name, sub.name
+        HAVING SUM(r.total) > 0
+        ORDER BY sec.name, s.ht_number, sub.name
+    """
+    return query, filter_params + rollup_params
+
+class StudentStatisticsSummary:
+    """Headline figures for the student statistics report
+
+    Tallied from the report's own rows as they are read, by passing add
+    as the on_rows callback of exports.PreviewCursor, so the figures cost
+    no second run of the query.
+    """
+
+    def __init__(self, columns, threshold=75):
+        self._student = columns.index('ht_number')
+        self._percentage = columns.index('attendance_percentage')
+        self.threshold = threshold
+        self.total_rows = 0
+        self._percentage_sum = 0.0
+        self._students = set()
+        self._below = set()
+
+    def add(self, rows):
+        """Tally a chunk of report rows"""
+        for row in rows:
+            self.total_rows += 1
+            self._percentage_sum += row[self._percentage]
+            self._students.add(row[self._student])
+            if row[self._percentage] < self.threshold:
+                self._below.add(row[self._student])
+
+    def figures(self):
+        """Get total_rows, total_students, avg_attendance and below_75"""
+        return {
+            'total_rows': self.total_rows,
+            'total_students': len(self._students),
+            'avg_attendance': self._percentage_sum / max(self.total_rows, 1),
+            'below_75': len(self._below)
+        }
+
+def faculty_workload_query(faculty_filter, from_date, to_date, archives=()):
+    """Classes, days, hours, subjects and sections per faculty member"""
+    join, filter_params = filter_join(faculty_filter, 'f.name')
+    if join:
+        selected = f"selected AS (SELECT f.id FROM faculty f {join}),"
+        restrict = "WHERE {}.faculty_id IN (SELECT id FROM selected)"
+    else:
+        selected = restrict = ''
+    days, day_params = archived_union(
+        'SELECT faculty_id, classes, 1 AS working_days, teaching_minutes FROM {schema}.faculty_daily_workload',
+        'SELECT faculty_id, classes, working_days, teaching_minutes FROM main.term_faculty_totals WHERE term_id = ?',
+        from_date, to_date, archives
+    )
+    classes, class_params = archived_union(
+        'SELECT faculty_id, subject_id, section_id FROM {schema}.faculty_workload',
+        'SELECT faculty_id, subject_id, section_id FROM main.term_faculty_classes WHERE term_id = ?',
+        from_date, to_date, archives
+    )
+    query = f"""
+        WITH {selected}
+        daily AS (
+            SELECT 
+                d.faculty_id,
+                SUM(d.classes) as total_classes,
+                SUM(d.working_days) as working_days,
+                ROUND(SUM(d.teaching_minutes) / 60.0, 2) as teaching_hours
+            FROM {days} d
+            {restrict.format('d')}
+            GROUP BY d.faculty_id
+        ),
+        handled AS (
+            SELECT 
+                fw.faculty_id,
+                COUNT(DISTINCT sub.id) as unique_subjects,
+                COUNT(DISTINCT sec.id) as unique_sections,
+                GROUP_CONCAT(DISTINCT sub.name) as subjects_handled,
+                GROUP_CONCAT(DISTINCT sec.name) as sections_handled
+            FROM {classes} fw
+            JOIN subjects sub ON fw.subject_id = sub.id
+            JOIN sections sec ON fw.section_id = sec.id
+            {restrict.format('fw')}
+            GROUP BY fw.faculty_id
+        )
+        SELECT 
+            f.name as faculty_name,
+            daily.total_classes,
+            daily.working_days,
+            daily.teaching_hours,
+            handled.unique_subjects,
+            handled.unique_sections,
+            handled.subjects_handled,
+            handled.sections_handled
+        FROM faculty f
+        JOIN daily ON daily.faculty_id = f.id
+        LEFT JOIN handled ON handled.faculty_id = f.id
+        ORDER BY f.name
+    """
+    return query, filter_params + day_params + class_params
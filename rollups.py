@@ -0,0 +1,107 @@
+# rollups.py
+
+ROLLUP_TABLE = '''
+    CREATE TABLE IF NOT EXISTS attendance_daily_rollup (
+        student_id INTEGER NOT NULL,
+        date DATE NOT NULL,
+        subject_id INTEGER NOT NULL,
+        present INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (student_id, date, subject_id),
+        FOREIGN KEY (student_id) REFERENCES students(id),
+        FOREIGN KEY (subject_id) REFERENCES subjects(id)
+    ) WITHOUT ROWID;
+'''
+
+# Triggers keeping attendance_daily_rollup in step with attendance. They run
+# inside the writing transaction, so marking attendance and any later
+# correction update the counters atomically. Attendance rows only carry
+# their session, so the date and subject come from attendance_sessions;
+# a session moved to another date or subject moves its counters along.
+ROLLUP_TRIGGERS = '''
+    CREATE TRIGGER IF NOT EXISTS attendance_rollup_insert
+    AFTER INSERT ON attendance
+    BEGIN
+        INSERT INTO attendance_daily_rollup (student_id, date, subject_id, present, total)
+        SELECT NEW.student_id, ses.date, ses.subject_id, NEW.status = 'P', 1
+        FROM attendance_sessions ses
+        WHERE ses.id = NEW.session_id
+        ON CONFLICT (student_id, date, subject_id) DO UPDATE SET
+            present = present + excluded.present,
+            total = total + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS attendance_rollup_delete
+    AFTER DELETE ON attendance
+    BEGIN
+        UPDATE attendance_daily_rollup
+        SET present = present - (OLD.status = 'P'),
+            total = total - 1
+        WHERE (student_id, date, subject_id) = (
+            SELECT OLD.student_id, ses.date, ses.subject_id
+            FROM attendance_sessions ses
+            WHERE ses.id = OLD.session_id
+        );
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS attendance_rollup_update
+    AFTER UPDATE OF session_id, student_id, status ON attendance
+    BEGIN
+        UPDATE attendance_daily_rollup
+        SET present = present - (OLD.status = 'P'),
+            total = total - 1
+        WHERE (student_id, date, subject_id) = (
+            SELECT OLD.student_id, ses.date, ses.subject_id
+            FROM attendance_sessions ses
+            WHERE ses.id = OLD.session_id
+        );
+
+        INSERT INTO attendance_daily_rollup (student_id, date, subject_id, present, total)
+        SELECT NEW.student_id, ses.date, ses.subject_id, NEW.status = 'P', 1
+        FROM attendance_sessions ses
+        WHERE ses.id = NEW.session_id
+        ON CONFLICT (student_id, date, subject_id) DO UPDATE SET
+            present = present + excluded.present,
+            total = total + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS attendance_sessions_rollup_update
+    AFTER UPDATE OF date, subject_id ON attendance_sessions
+    BEGIN
+        UPDATE attendance_daily_rollup
+        SET present = present - (
+                SELECT a.status = 'P' FROM attendance a
+                WHERE a.session_id = OLD.id
+                AND a.student_id = attendance_daily_rollup.student_id
+            ),
+            total = total - 1
+        WHERE date = OLD.date
+        AND subject_id = OLD.subject_id
+        AND student_id IN (SELECT student_id FROM attendance WHERE session_id = OLD.id);
+
+        INSERT INTO attendance_daily_rollup (student_id, date, subject_id, present, total)
+        SELECT a.student_id, NEW.date, NEW.subject_id, a.status = 'P', 1
+        FROM attendance a
+        WHERE a.session_id = NEW.id
+        ON CONFLICT (student_id, date, subject_id) DO UPDATE SET
+            present = present + excluded.present,
+            total = total + 1;
+    END;
+'''
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup bucket from the raw attendance rows
+
+    Runs inside the caller's transaction.
+    """
+    conn.execute('DELETE FROM attendance_daily_rollup')
+    conn.execute('''
+        INSERT INTO attendance_daily_rollup (student_id, date, subject_id, present, total)
+        SELECT a.student_id, ses.date, ses.subject_id,
+               SUM(CASE WHEN a.status = 'P' THEN 1 ELSE 0 END),
+               COUNT(*)
+        FROM attendance a
+        JOIN attendance_sessions ses ON a.session_id = ses.id
+        GROUP BY a.student_id, ses.date, ses.subject_id
+    ''')
@@ -1,4 +1,6 @@
 -- schema.sql
+-- Baseline schema, applied as migration 1 by migrations.py.
+-- Later schema changes are separate migrations; do not edit this file.
 CREATE TABLE IF NOT EXISTS faculty (
     id INTEGER PRIMARY KEY,
     name TEXT UNIQUE NOT NULL,
@@ -8,7 +10,7 @@ CREATE TABLE IF NOT EXISTS faculty (
 
 CREATE TABLE IF NOT EXISTS sections (
     id INTEGER PRIMARY KEY,
-    name TEXT UNIQUE NOT NULL,  -- e.g., 'B.Tech-I-CSE-A'
+    name TEXT UNIQUE NOT NULL,  -- e.g., 'B.Tech-I-CSE-A' or '(O)B.Tech-I-CSE-A'
     is_original BOOLEAN DEFAULT 0,  -- 0 for manipulated, 1 for original
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -17,7 +19,7 @@ CREATE TABLE IF NOT EXISTS subjects (
     id INTEGER PRIMARY KEY,
     name TEXT NOT NULL,
     program TEXT NOT NULL,  -- e.g., 'B.Tech', 'MCA', 'Diploma'
-    year INTEGER NOT NULL,  -- 1, 2, 3, 4
+    year TEXT NOT NULL,     -- 'I', 'II', 'III', 'IV'
     branch TEXT NOT NULL,   -- 'CSE', 'ECE', etc.
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -43,6 +45,7 @@ CREATE TABLE IF NOT EXISTS attendance (
     time TIME NOT NULL,
     period TEXT NOT NULL,
     status TEXT NOT NULL CHECK (status IN ('P', 'A')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (student_id) REFERENCES students(id),
     FOREIGN KEY (faculty_id) REFERENCES faculty(id),
     FOREIGN KEY (subject_id) REFERENCES subjects(id),
@@ -53,12 +56,13 @@ CREATE TABLE IF NOT EXISTS attendance (
 CREATE TABLE IF NOT EXISTS faculty_workload (
     id INTEGER PRIMARY KEY,
     faculty_id INTEGER,
-    subject_id INTEGER,
     section_id INTEGER,
+    subject_id INTEGER,
     date DATE NOT NULL,
     time TIME NOT NULL,
     period TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (faculty_id) REFERENCES faculty(id),
-    FOREIGN KEY (subject_id) REFERENCES subjects(id),
-    FOREIGN KEY (section_id) REFERENCES sections(id)
-);
\ No newline at end of file
+    FOREIGN KEY (section_id) REFERENCES sections(id),
+    FOREIGN KEY (subject_id) REFERENCES subjects(id)
+);
@@ -0,0 +1,80 @@
+# test_bitmaps.py
+"""Bitmap sweeps agree with the attendance rollups"""
+import sqlite3
+import numpy as np
+import pytest
+import bench
+from migrations import migrate
+from bitmaps import daily_trend, defaulters, student_percentages, subject_counts, sync_bitmaps
+from reports import report_filter
+
+FROM_DATE, TO_DATE = '2024-07-01', '2024-07-05'
+
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    db_file = str(tmp_path_factory.mktemp('bitmaps') / 'attendance.db')
+    bench.generate(db_file, sections_per_branch=1, students_per_section=6, days=6,
+                   log=lambda *args: None)
+    conn = sqlite3.connect(db_file)
+    sync_bitmaps(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+def rollup_totals(conn, group_by, where='', params=()):
+    """Get {key: (present, total)} summed from the daily rollup"""
+    return {row[:-2]: tuple(row[-2:]) for row in conn.execute(f'''
+        SELECT {group_by}, SUM(r.present), SUM(r.total)
+        FROM attendance_daily_rollup r
+        JOIN students s ON s.id = r.student_id
+        JOIN sections sec ON sec.id = s.manipulated_section_id
+        WHERE r.date BETWEEN ? AND ? {where}
+        GROUP BY {group_by}
+    ''', (FROM_DATE, TO_DATE) + tuple(params))}
+
+
+def test_bitmap_triggers_installed_by_sync(tmp_path, conn):
+    fresh = str(tmp_path / 'fresh.db')
+    migrate(fresh)
+    check = sqlite3.connect(fresh)
+    assert not check.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%bitmap%'").fetchall()
+    check.close()
+    session_id = conn.execute('SELECT MIN(session_id) FROM attendance_bitmaps').fetchone()[0]
+    conn.execute("UPDATE attendance SET status = 'A' WHERE session_id = ?", (session_id,))
+    assert conn.execute('SELECT 1 FROM attendance_bitmaps WHERE session_id = ?', (session_id,)).fetchone() is None
+    conn.rollback()
+
+def test_student_percentages_match_rollups(conn):
+    student_ids, present, total, _ = student_percentages(conn, FROM_DATE, TO_DATE)
+    expected = rollup_totals(conn, 'r.student_id')
+    assert dict(zip(((int(s),) for s in student_ids), zip(present, total))) == expected
+
+def test_subject_counts_match_rollups(conn):
+    student_ids, subject_ids, present, total = subject_counts(conn, FROM_DATE, TO_DATE)
+    expected = rollup_totals(conn, 'r.student_id, r.subject_id')
+    actual = {(int(s), int(j)): (p, t) for s, j, p, t in zip(student_ids, subject_ids, present, total)}
+    assert actual == expected
+
+def test_daily_trend_matches_rollups(conn):
+    dates, present, total = daily_trend(conn, FROM_DATE, TO_DATE)
+    expected = rollup_totals(conn, 'r.date')
+    assert dict(zip(((str(d),) for d in dates), zip(present, total))) == expected
+
+def test_section_filtered_sweeps_match_rollups(conn):
+    section = conn.execute('SELECT name FROM sections WHERE is_original = 0 ORDER BY name').fetchone()[0]
+    expected = rollup_totals(conn, 'r.student_id', 'AND sec.name = ?', [section])
+    with report_filter(conn, [section]) as section_filter:
+        student_ids, present, total, _ = student_percentages(conn, FROM_DATE, TO_DATE, section_filter)
+        chosen = list(student_ids[:2])
+        dates, day_present, _ = daily_trend(conn, FROM_DATE, TO_DATE, chosen, section_filter)
+    assert dict(zip(((int(s),) for s in student_ids), zip(present, total))) == expected
+    assert day_present.sum() == sum(expected[(int(s),)][0] for s in chosen)
+
+def test_defaulters_match_rollups(conn):
+    student_ids, percentage = defaulters(conn, FROM_DATE, TO_DATE, threshold=75)
+    expected = {key[0]: round(100 * present / total, 2)
+                for key, (present, total) in rollup_totals(conn, 'r.student_id').items()
+                if 100 * present / total < 75}
+    assert dict(zip(student_ids.tolist(), percentage.tolist())) == expected
+    assert np.all(np.diff(percentage) >= 0)
@@ -0,0 +1,16 @@
+# test_concurrent_marking.py
+"""Concurrent attendance submissions from several processes"""
+import tempfile
+import bench
+
+
+def test_concurrent_marking_loses_nothing(tmp_path, monkeypatch):
+    """Processes marking at once store every accepted class, and exactly
+    one of them wins the contested session"""
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    summary = bench.stress(processes=4, sessions_per_process=5, students_per_section=10,
+                           log=lambda *args: None)
+    assert summary['lost'] == 0
+    assert summary['failures'] == 0
+    assert summary['marked'] == summary['submissions'] - summary['processes'] + 1
+    assert summary['conflicts'] == summary['processes'] - 1
@@ -12,6 +12,13 @@ def check_period_time(period):
         return start_time <= current_time <= end_time
     return False
 
+def get_period_minutes(period):
+    """Get the length of a period in minutes"""
+    start_str, end_str = PERIOD_TIMINGS[period]
+    start = datetime.strptime(start_str, '%H:%M')
+    end = datetime.strptime(end_str, '%H:%M')
+    return int((end - start).total_seconds() // 60)
+
 def format_time(time_str):
     """Format time string for display"""
     return datetime.strptime(time_str, '%H:%M').strftime('%I:%M %p')
@@ -0,0 +1,204 @@
+# writer.py
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from connections import begin_immediate, checkpoint, get_manager
+
+# Most submissions folded into one commit
+WRITER_BATCH_MAX = 100
+
+# Minimum time between WAL checkpoints run by the writer while idle
+CHECKPOINT_INTERVAL_SECONDS = 30
+
+
+class GroupCommitWriter:
+    """Single writer thread that commits concurrent submissions together
+
+    Callers hand over a function taking a connection; the writer runs it on
+    its own connection and gives the caller back that function's result.
+    Submissions that queue up while a commit is in progress are written in
+    one transaction, each inside its own savepoint. A submission that raises
+    is rolled back on its own and only its caller sees the error, while the
+    rest of the group still commits. Results are handed out only after the
+    commit succeeds.
+
+    The writer turns off automatic checkpointing on its connection, which
+    would otherwise run inside whichever commit crosses the threshold. It
+    runs a PASSIVE checkpoint itself between groups instead, at most once
+    per CHECKPOINT_INTERVAL_SECONDS and only when nothing is queued.
+    """
+
+    def __init__(self, db_file, batch_max=WRITER_BATCH_MAX):
+        self.db_file = db_file
+        self.batch_max = batch_max
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._commits = 0
+        self._submissions = 0
+        self._checkpointed_at = time.monotonic()
+        self._uncheckpointed = False
+
+    def submit(self, func, *args):
+        """Queue func(conn, *args) for the next group commit and return a Future"""
+        future = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((func, args, future))
+        return future
+
+    def run(self, func, *args, timeout=None):
+        """Run func(conn, *args) in a group commit and wait for its result
+
+        Raises TimeoutError after timeout seconds. A submission still
+        queued then is cancelled; one already being written may yet commit.
+        """
+        future = self.submit(func, *args)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _next_batch(self):
+        """Block for one submission, then take whatever else is already queued
+
+        Returns an empty batch when nothing arrives within the checkpoint
+        interval, and None once the writer is asked to stop.
+        """
+        try:
+            item = self._queue.get(timeout=CHECKPOINT_INTERVAL_SECONDS)
+        except queue.Empty:
+            return []
+        if item is None:
+            return None
+        batch = [item]
+        while len(batch) < self.batch_max:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this group, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _commit(self, conn, batch):
+        done = []
+        try:
+            begin_immediate(conn)
+            for func, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT submission')
+                try:
+                    result = func(conn, *args)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO submission')
+                    conn.execute('RELEASE submission')
+                    future.set_exception(e)
+                    continue
+                conn.execute('RELEASE submission')
+                done.append((future, result))
+            conn.commit()
+        except Exception as e:
+            print(f"Group commit error: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            for func, args, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        with self._lock:
+            self._commits += 1
+            self._submissions += len(done)
+        self._uncheckpointed = True
+        for future, result in done:
+            future.set_result(result)
+
+    def _checkpoint(self, conn, force=False):
+        if not self._uncheckpointed or not self._queue.empty():
+            return
+        if not force and time.monotonic() - self._checkpointed_at < CHECKPOINT_INTERVAL_SECONDS:
+            return
+        try:
+            checkpoint(conn, 'PASSIVE')
+            self._uncheckpointed = False
+        except Exception as e:
+            print(f"Checkpoint error: {e}")
+        self._checkpointed_at = time.monotonic()
+
+    def _fail_queued(self, error):
+        """Stop the thread, failing everything queued with error
+
+        Runs under the lock that submit() holds while queueing, so every
+        submission either sees the thread gone and starts a new one, or is
+        failed here.
+        """
+        with self._lock:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None and item[2].set_running_or_notify_cancel():
+                    item[2].set_exception(error)
+            self._thread = None
+
+    def _run(self):
+        try:
+            conn = get_manager(self.db_file).get()
+            conn.execute('PRAGMA wal_autocheckpoint = 0')
+        except Exception as e:
+            print(f"Writer start error: {e}")
+            self._fail_queued(e)
+            return
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                self._checkpoint(conn, force=True)
+                return
+            if batch:
+                self._commit(conn, batch)
+            self._checkpoint(conn)
+
+    def close(self, timeout=None):
+        """Finish queued submissions and stop the writer thread"""
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def stats(self):
+        """Get commit counters for monitoring"""
+        with self._lock:
+            return {
+                'commits': self._commits,
+                'submissions': self._submissions,
+                'queued': self._queue.qsize()
+            }
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_file):
+    """Get the shared writer for a database file"""
+    with _writers_lock:
+        if db_file not in _writers:
+            _writers[db_file] = GroupCommitWriter(db_file)
+        return _writers[db_file]
+
+
+@atexit.register
+def _close_writers():
+    for writer in _writers.values():
+        writer.close(timeout=5)